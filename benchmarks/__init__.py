@@ -0,0 +1,31 @@
+import os
+import random
+
+
+#: Whether to run the benchmarks at full scale (e.g., 10M objects). Set the
+#: ``HIPPIEPUG_BENCH_LARGE`` environment variable to enable.
+LARGE = bool(os.environ.get('HIPPIEPUG_BENCH_LARGE'))
+
+#: Seed of all random inputs, so that runs on different commits are
+#: comparable. Override with the ``HIPPIEPUG_BENCH_SEED`` environment
+#: variable.
+SEED = int(os.environ.get('HIPPIEPUG_BENCH_SEED', 0))
+
+
+def scaled(sizes, large_sizes=()):
+    """Return benchmark sizes, including the large ones if enabled."""
+    return list(sizes) + (list(large_sizes) if LARGE else [])
+
+
+def make_rng(*salt):
+    """Return a random generator seeded with :py:data:`SEED`.
+
+    :param salt: Values distinguishing the inputs of different benchmarks,
+                 e.g., their sizes.
+    """
+    return random.Random(repr((SEED,) + salt))
+
+
+def random_bytes(rng, size):
+    """Return reproducible random bytes."""
+    return rng.getrandbits(8 * size).to_bytes(size, 'little')
@@ -0,0 +1,22 @@
+import pytest
+
+import hippiepug
+
+from hippiepug.store import Sha256DictStore
+
+from . import LARGE, SEED
+
+
+@pytest.fixture
+def object_store():
+    return Sha256DictStore()
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    """Record the benchmark parameters in the JSON results, so that saved
+    runs can be told apart when comparing them."""
+    output_json['hippiepug'] = {
+        'version': hippiepug.__version__,
+        'seed': SEED,
+        'large': LARGE,
+    }
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.logstore import LogStore
+from hippiepug.sqlitestore import SqliteStore
+from hippiepug.store import Sha256DictStore
+
+from . import make_rng, random_bytes
+
+
+NUM_BLOCKS = 10**4
+
+
+@pytest.mark.parametrize('payload_size', [64, 4096])
+def test_block_builder_commit(benchmark, payload_size):
+    """Benchmark committing blocks to a fresh chain one by one."""
+    rng = make_rng('blocks', payload_size)
+    payloads = [random_bytes(rng, payload_size) for _ in range(NUM_BLOCKS)]
+
+    def setup():
+        return (BlockBuilder(Chain(Sha256DictStore())),), {}
+
+    def commit(builder):
+        for payload in payloads:
+            builder.payload = payload
+            builder.commit()
+
+    benchmark.pedantic(commit, setup=setup, rounds=3)
+
+
+@pytest.mark.parametrize('payload_size', [64, 4096])
+def test_block_builder_commit_many(benchmark, payload_size):
+    """Benchmark committing blocks to a fresh chain in one batch."""
+    rng = make_rng('blocks', payload_size)
+    payloads = [random_bytes(rng, payload_size) for _ in range(NUM_BLOCKS)]
+
+    def setup():
+        return (BlockBuilder(Chain(Sha256DictStore())),), {}
+
+    def commit(builder):
+        builder.commit_many(payloads)
+
+    benchmark.pedantic(commit, setup=setup, rounds=3)
+
+
+def _make_store(kind, path):
+    if kind == 'log':
+        return LogStore(path, sync=1)
+    return SqliteStore(os.path.join(path, 'objects.db'))
+
+
+@pytest.mark.parametrize('batched', [False, True])
+@pytest.mark.parametrize('kind', ['log', 'sqlite'])
+def test_durable_chain_build(benchmark, tmp_path_factory, kind, batched):
+    """Benchmark building a chain in a store that syncs every write."""
+    rng = make_rng('blocks', 'durable')
+    payloads = [random_bytes(rng, 64) for _ in range(NUM_BLOCKS // 10)]
+
+    def setup():
+        store = _make_store(kind, str(tmp_path_factory.mktemp('store')))
+        return (BlockBuilder(Chain(store)),), {}
+
+    def commit(builder):
+        if batched:
+            builder.commit_many(payloads)
+        else:
+            for payload in payloads:
+                builder.payload = payload
+                builder.commit()
+        builder.chain.object_store.close()
+
+    benchmark.pedantic(commit, setup=setup, rounds=3)
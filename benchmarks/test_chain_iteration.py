@@ -0,0 +1,29 @@
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.store import Sha256DictStore
+
+
+NUM_BLOCKS = 10**4
+
+
+@pytest.fixture(scope='module')
+def chain():
+    chain = Chain(Sha256DictStore())
+    builder = BlockBuilder(chain)
+    for i in range(NUM_BLOCKS):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    return chain
+
+
+@pytest.mark.parametrize('reverse', [True, False])
+def test_chain_full_iteration(benchmark, chain, reverse):
+    """Benchmark iterating over the whole chain on a cold cache."""
+
+    def iterate():
+        view = Chain(chain.object_store, head=chain.head)
+        for _ in view.iter_range(reverse=reverse):
+            pass
+
+    benchmark(iterate)
@@ -0,0 +1,48 @@
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.store import Sha256DictStore
+
+from . import make_rng, scaled
+
+
+NUM_LOOKUPS = 1000
+
+
+@pytest.fixture(scope='module',
+                params=scaled([10**3, 10**4, 10**5], [10**6, 10**7]))
+def chain(request):
+    chain = Chain(Sha256DictStore())
+    builder = BlockBuilder(chain)
+    for i in range(request.param):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    return chain
+
+
+def _indices(chain):
+    num_blocks = chain.head_block.index + 1
+    rng = make_rng('indices', num_blocks)
+    return [rng.randrange(num_blocks) for _ in range(NUM_LOOKUPS)]
+
+
+def test_chain_get_block_by_index(benchmark, chain):
+    """Benchmark looking up random blocks one by one on a cold cache."""
+    indices = _indices(chain)
+
+    def lookup():
+        view = Chain(chain.object_store, head=chain.head)
+        return [view.get_block_by_index(i) for i in indices]
+
+    benchmark(lookup)
+
+
+def test_chain_get_blocks(benchmark, chain):
+    """Benchmark looking up random blocks in one batch on a cold cache."""
+    indices = _indices(chain)
+
+    def lookup():
+        view = Chain(chain.object_store, head=chain.head)
+        return view.get_blocks(indices)
+
+    benchmark(lookup)
@@ -0,0 +1,68 @@
+import pytest
+
+from hippiepug.chain import _next_hop
+from hippiepug.navigation import finger_indices, lookup_path
+from hippiepug.struct import ChainBlock
+
+from . import make_rng
+
+
+CHAIN_SIZES = [10**5, 10**7]
+NUM_LOOKUPS = 1000
+
+
+def _scan_hop(block, index):
+    """Finger choice by scanning all the fingers."""
+    _, hash_value = min((f, h) for (f, h) in block.fingers if f >= index)
+    return hash_value
+
+
+HOPS = {
+    'scan': _scan_hop,
+    'slot': _next_hop,
+}
+
+
+def _lookups(num_blocks):
+    """Random target indices, and the blocks on the walks towards them.
+
+    Only the blocks on the walks are made, so that chains of any length
+    can be navigated. Their fingers use the index as the hash.
+    """
+    rng = make_rng('navigation', num_blocks)
+    head_index = num_blocks - 1
+    indices = [rng.randrange(num_blocks) for _ in range(NUM_LOOKUPS)]
+    blocks = {}
+    for index in indices:
+        for block_index in lookup_path(head_index, index):
+            blocks[block_index] = ChainBlock(
+                    payload=None, index=block_index,
+                    fingers=[[f, f] for f in finger_indices(block_index)])
+    return blocks[head_index], indices, blocks
+
+
+@pytest.mark.parametrize('num_blocks', CHAIN_SIZES)
+@pytest.mark.parametrize('hop', sorted(HOPS))
+def test_chain_walks(benchmark, hop, num_blocks):
+    """Benchmark choosing the fingers on walks from the head."""
+    head_block, indices, blocks = _lookups(num_blocks)
+    next_hop = HOPS[hop]
+
+    def walk():
+        for index in indices:
+            block = head_block
+            while block.index != index:
+                block = blocks[next_hop(block, index)]
+
+    benchmark(walk)
+
+
+@pytest.mark.parametrize('num_blocks', CHAIN_SIZES)
+def test_lookup_paths(benchmark, num_blocks):
+    """Benchmark computing the walks without the blocks."""
+    head_block, indices, _ = _lookups(num_blocks)
+
+    def compute_paths():
+        return [lookup_path(head_block.index, index) for index in indices]
+
+    benchmark(compute_paths)
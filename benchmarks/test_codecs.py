@@ -0,0 +1,100 @@
+import pytest
+
+from hippiepug.pack import msgpack_encoder, msgpack_decoder
+from hippiepug.pack import binary_encoder, binary_decoder
+from hippiepug.pack import EncodingParams, decode
+from hippiepug.struct import ChainBlock, TreeNode, TreeLeaf
+
+from . import make_rng, random_bytes
+
+
+NUM_OBJS = 10**4
+NUM_TREE_NODES = 10**6
+
+
+def _hash(rng):
+    return random_bytes(rng, 8).hex()
+
+
+def _objects(kind):
+    rng = make_rng('codec', kind)
+    if kind == 'block':
+        return [ChainBlock(payload=random_bytes(rng, 64), index=i,
+                           fingers=[[i - 1 - j, _hash(rng)]
+                                    for j in range(8)])
+                for i in range(NUM_OBJS)]
+    if kind == 'node':
+        return [TreeNode(pivot_prefix='key %d' % i,
+                         left_hash=_hash(rng), right_hash=_hash(rng))
+                for i in range(NUM_OBJS)]
+    if kind == 'leaf':
+        return [TreeLeaf(lookup_key='key %d' % i, payload_hash=_hash(rng))
+                for i in range(NUM_OBJS)]
+    return [random_bytes(rng, 64) for _ in range(NUM_OBJS)]
+
+
+KINDS = ['block', 'node', 'leaf', 'bytes']
+
+CODECS = {
+    'msgpack': (msgpack_encoder, msgpack_decoder),
+    'binary': (binary_encoder, binary_decoder),
+}
+
+
+def _mean_size(serialized_objs):
+    return sum(len(s) for s in serialized_objs) / len(serialized_objs)
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+@pytest.mark.parametrize('kind', KINDS)
+def test_encoder(benchmark, kind, codec):
+    encoder, _ = CODECS[codec]
+    objs = _objects(kind)
+    benchmark.extra_info['mean_size'] = _mean_size(
+            [encoder(obj) for obj in objs])
+    benchmark(lambda: [encoder(obj) for obj in objs])
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+@pytest.mark.parametrize('kind', KINDS)
+def test_decoder(benchmark, kind, codec):
+    encoder, decoder = CODECS[codec]
+    serialized_objs = [encoder(obj) for obj in _objects(kind)]
+    benchmark(lambda: [decoder(s) for s in serialized_objs])
+
+
+def _tree_nodes(num_nodes):
+    """Serialized nodes of a tree with half of them leaves."""
+    rng = make_rng('codec', 'tree', num_nodes)
+    leaves = [TreeLeaf(lookup_key='key %d' % i, payload_hash=_hash(rng))
+              for i in range(num_nodes // 2)]
+    nodes = [TreeNode(pivot_prefix='key %d' % i,
+                      left_hash=_hash(rng), right_hash=_hash(rng))
+             for i in range(num_nodes - len(leaves))]
+    return [msgpack_encoder(node) for node in leaves + nodes]
+
+
+@pytest.fixture(scope='module')
+def serialized_tree_nodes():
+    return _tree_nodes(NUM_TREE_NODES)
+
+
+@pytest.mark.parametrize('resolution', ['context', 'default', 'bound'])
+def test_decode_resolution(benchmark, serialized_tree_nodes, resolution):
+    """Benchmark resolving the decoder of a 1M-node tree.
+
+    ``context`` looks the decoder up in the thread-local stack on every
+    call, as when a default context is active, ``default`` takes the fast
+    path when none is, and ``bound`` passes the decoder of a view.
+    """
+    decoder = msgpack_decoder if resolution == 'bound' else None
+
+    def decode_all():
+        return [decode(s, decoder) for s in serialized_tree_nodes]
+
+    benchmark.extra_info['num_nodes'] = len(serialized_tree_nodes)
+    if resolution == 'context':
+        with EncodingParams().as_default():
+            benchmark.pedantic(decode_all, rounds=3)
+    else:
+        benchmark.pedantic(decode_all, rounds=3)
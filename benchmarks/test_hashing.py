@@ -0,0 +1,42 @@
+import pytest
+
+from hippiepug.hashing import Hasher, available_algorithms
+from hippiepug.store import DictStore
+from hippiepug.tree import TreeBuilder
+
+from . import make_rng, random_bytes
+
+
+TOTAL_BYTES = 2**24
+NUM_KEYS = 10**4
+
+
+@pytest.mark.parametrize('obj_size', [64, 4096, 2**20])
+@pytest.mark.parametrize('algorithm', available_algorithms())
+def test_hash_throughput(benchmark, algorithm, obj_size):
+    """Benchmark hashing objects of a given size.
+
+    Hashes the same total number of bytes for every size. The throughput
+    is ``extra_info['bytes']`` divided by the mean time.
+    """
+    hasher = Hasher(digest_size=32, binary=True, algorithm=algorithm)
+    rng = make_rng('hash', obj_size)
+    objs = [random_bytes(rng, obj_size)
+            for _ in range(TOTAL_BYTES // obj_size)]
+    benchmark.extra_info['bytes'] = TOTAL_BYTES
+    benchmark(lambda: [hasher(obj) for obj in objs])
+
+
+@pytest.mark.parametrize('binary', [False, True])
+@pytest.mark.parametrize('algorithm', available_algorithms())
+def test_tree_commit_with_hasher(benchmark, algorithm, binary):
+    """Benchmark committing a tree with a given hasher."""
+    hasher = Hasher(digest_size=32, binary=binary, algorithm=algorithm)
+    items = {b'%d' % i: b'value %d' % i for i in range(NUM_KEYS)}
+
+    def commit():
+        builder = TreeBuilder(DictStore(hasher=hasher))
+        builder.items.update(items)
+        return builder.commit()
+
+    benchmark(commit)
@@ -0,0 +1,75 @@
+import sys
+import tracemalloc
+
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.pack import msgpack_decoder, msgpack_frozen_decoder
+from hippiepug.store import Sha256DictStore
+from hippiepug.struct import TreeNode, TreeLeaf
+from hippiepug.tree import TreeBuilder
+
+
+NUM_OBJS = 10**4
+
+DECODERS = {
+    'mutable': msgpack_decoder,
+    'frozen': msgpack_frozen_decoder,
+}
+
+
+def _try_decode(serialized):
+    try:
+        return msgpack_decoder(serialized)
+    except ValueError:
+        return None
+
+
+@pytest.fixture(scope='module')
+def serialized_blocks():
+    chain = Chain(Sha256DictStore())
+    builder = BlockBuilder(chain)
+    for i in range(NUM_OBJS):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    return list(chain.object_store._backend.values())
+
+
+@pytest.fixture(scope='module')
+def serialized_nodes():
+    builder = TreeBuilder(Sha256DictStore())
+    for i in range(NUM_OBJS):
+        builder[b'key %d' % i] = b'value %d' % i
+    builder.commit()
+    # Skip the values, which are not nodes.
+    return [serialized for serialized
+            in builder.object_store._backend.values()
+            if isinstance(_try_decode(serialized), (TreeNode, TreeLeaf))]
+
+
+def _bytes_per_object(decoder, serialized_objs):
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        cache = {i: decoder(s) for i, s in enumerate(serialized_objs)}
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The cache dict itself is the same for all decoders.
+    container_size = sys.getsizeof(cache)
+    return (after - before - container_size) / len(serialized_objs)
+
+
+@pytest.mark.parametrize('decoder', sorted(DECODERS))
+@pytest.mark.parametrize('kind', ['block', 'node'])
+def test_bytes_per_cached_object(benchmark, request, kind, decoder):
+    """Measure the memory taken by decoded blocks and nodes in a cache.
+
+    The result is reported in ``extra_info``.
+    """
+    fixture = 'serialized_blocks' if kind == 'block' else 'serialized_nodes'
+    serialized_objs = request.getfixturevalue(fixture)
+    decode = DECODERS[decoder]
+    benchmark.extra_info['bytes_per_object'] = _bytes_per_object(
+            decode, serialized_objs)
+    benchmark(lambda: [decode(s) for s in serialized_objs])
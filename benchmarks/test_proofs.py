@@ -0,0 +1,137 @@
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.chain import verify_chain_inclusion_proof, verify_chain_proofs
+from hippiepug.store import Sha256DictStore
+from hippiepug.tree import TreeBuilder, Tree
+from hippiepug.tree import verify_tree_inclusion_proof, verify_tree_proofs
+
+from . import make_rng
+
+
+NUM_BLOCKS = 10**4
+NUM_KEYS = 10**4
+NUM_PROOFS = 1000
+
+
+def _chain_indices():
+    rng = make_rng('chain proofs')
+    return [rng.randrange(NUM_BLOCKS) for _ in range(NUM_PROOFS)]
+
+
+def _lookup_keys():
+    rng = make_rng('tree proofs')
+    return [str(rng.randrange(NUM_KEYS)).encode()
+            for _ in range(NUM_PROOFS)]
+
+
+@pytest.fixture(scope='module')
+def chain():
+    chain = Chain(Sha256DictStore())
+    builder = BlockBuilder(chain)
+    for i in range(NUM_BLOCKS):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    return chain
+
+
+@pytest.fixture(scope='module')
+def tree():
+    builder = TreeBuilder(Sha256DictStore())
+    for i in range(NUM_KEYS):
+        builder[str(i).encode()] = str(i).encode()
+    return builder.commit()
+
+
+@pytest.fixture(scope='module')
+def chain_proofs(chain):
+    indices = _chain_indices()
+    blocks, proofs = zip(*[chain.get_block_by_index(i, return_proof=True)
+                           for i in indices])
+    return chain.head, blocks, proofs
+
+
+@pytest.fixture(scope='module')
+def tree_proofs(tree):
+    lookup_keys = _lookup_keys()
+    values, proofs = zip(*[tree.get_value_by_lookup_key(key, True)
+                           for key in lookup_keys])
+    return tree.root, list(zip(lookup_keys, values)), proofs
+
+
+def test_chain_proof_generation(benchmark, chain):
+    """Benchmark producing inclusion proofs one by one."""
+    indices = _chain_indices()
+
+    def prove():
+        view = Chain(chain.object_store, head=chain.head)
+        return [view.get_block_by_index(i, return_proof=True)
+                for i in indices]
+
+    benchmark(prove)
+
+
+def test_chain_multi_proof_generation(benchmark, chain):
+    """Benchmark producing one proof for many blocks."""
+    indices = _chain_indices()
+
+    def prove():
+        view = Chain(chain.object_store, head=chain.head)
+        return view.get_multi_proof(indices)
+
+    benchmark(prove)
+
+
+def test_tree_proof_generation(benchmark, tree):
+    """Benchmark producing inclusion proofs one by one."""
+    lookup_keys = _lookup_keys()
+
+    def prove():
+        view = Tree(tree.object_store, tree.root)
+        return [view.get_value_by_lookup_key(key, return_proof=True)
+                for key in lookup_keys]
+
+    benchmark(prove)
+
+
+def test_tree_multi_proof_generation(benchmark, tree):
+    """Benchmark producing one proof for many keys."""
+    lookup_keys = _lookup_keys()
+
+    def prove():
+        view = Tree(tree.object_store, tree.root)
+        return view.get_multi_proof(lookup_keys)
+
+    benchmark(prove)
+
+
+def test_chain_verify_with_store(benchmark, chain_proofs):
+    head, blocks, proofs = chain_proofs
+
+    def verify():
+        return all(verify_chain_inclusion_proof(Sha256DictStore(), head,
+                                                block, proof)
+                   for block, proof in zip(blocks, proofs))
+
+    assert benchmark(verify)
+
+
+def test_chain_verify_store_free(benchmark, chain_proofs):
+    head, blocks, proofs = chain_proofs
+    assert all(benchmark(verify_chain_proofs, head, blocks, proofs))
+
+
+def test_tree_verify_with_store(benchmark, tree_proofs):
+    root, items, proofs = tree_proofs
+
+    def verify():
+        return all(verify_tree_inclusion_proof(Sha256DictStore(), root,
+                                               key, value, proof)
+                   for (key, value), proof in zip(items, proofs))
+
+    assert benchmark(verify)
+
+
+def test_tree_verify_store_free(benchmark, tree_proofs):
+    root, items, proofs = tree_proofs
+    assert all(benchmark(verify_tree_proofs, root, items, proofs))
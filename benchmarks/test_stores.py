@@ -0,0 +1,116 @@
+import os
+import random
+import pytest
+
+from hippiepug.logstore import LogStore
+from hippiepug.sqlitestore import SqliteStore
+from hippiepug.store import Sha256DictStore
+from hippiepug.tree import TreeBuilder
+
+from . import scaled
+
+
+SIZES = scaled([10**4, 10**5], [10**7])
+NUM_READS = 10**4
+
+
+KINDS = ['dict', 'log', 'sqlite']
+
+
+def _make_store(kind, path):
+    if kind == 'dict':
+        return Sha256DictStore()
+    if kind == 'log':
+        return LogStore(path)
+    return SqliteStore(os.path.join(path, 'objects.db'))
+
+
+def _close(store):
+    if hasattr(store, 'close'):
+        store.close()
+
+
+def _objects(num_objs):
+    return [b'object %d' % i + b'x' * 100 for i in range(num_objs)]
+
+
+@pytest.mark.parametrize('num_objs', SIZES)
+@pytest.mark.parametrize('kind', KINDS)
+def test_store_writes(benchmark, tmp_path_factory, kind, num_objs):
+    """Benchmark adding objects to a fresh store."""
+    objs = _objects(num_objs)
+
+    def setup():
+        store = _make_store(kind, str(tmp_path_factory.mktemp('store')))
+        return (store,), {}
+
+    def write(store):
+        for obj in objs:
+            store.add(obj)
+        _close(store)
+
+    benchmark.pedantic(write, setup=setup, rounds=3)
+
+
+@pytest.mark.parametrize('num_objs', SIZES)
+@pytest.mark.parametrize('kind', KINDS)
+def test_store_random_reads(benchmark, tmp_path, kind, num_objs):
+    """Benchmark reading random objects from a populated store."""
+    store = _make_store(kind, str(tmp_path))
+    hashes = store.add_many(_objects(num_objs))
+    rng = random.Random(0)
+    sample = [rng.choice(hashes) for _ in range(NUM_READS)]
+
+    def read():
+        for obj_hash in sample:
+            store.get(obj_hash)
+
+    benchmark(read)
+    _close(store)
+
+
+@pytest.mark.parametrize('num_objs', SIZES)
+def test_log_store_open(benchmark, tmp_path, num_objs):
+    """Benchmark opening a log store with a saved index."""
+    with LogStore(str(tmp_path)) as store:
+        for obj in _objects(num_objs):
+            store.add(obj)
+
+    benchmark(lambda: LogStore(str(tmp_path)).close())
+
+
+@pytest.mark.parametrize('num_objs', SIZES)
+@pytest.mark.parametrize('kind', KINDS)
+def test_store_batch_writes(benchmark, tmp_path_factory, kind, num_objs):
+    """Benchmark adding objects to a fresh store in one batch."""
+    objs = _objects(num_objs)
+
+    def setup():
+        store = _make_store(kind, str(tmp_path_factory.mktemp('store')))
+        return (store,), {}
+
+    def write(store):
+        store.add_many(objs)
+        _close(store)
+
+    benchmark.pedantic(write, setup=setup, rounds=3)
+
+
+@pytest.mark.parametrize('num_keys', scaled([10**4], [10**6]))
+@pytest.mark.parametrize('kind', KINDS)
+def test_store_tree_commit(benchmark, tmp_path_factory, kind, num_keys):
+    """Benchmark committing a tree to a fresh store."""
+    items = [(b'key %d' % i, b'value %d' % i) for i in range(num_keys)]
+
+    def setup():
+        store = _make_store(kind, str(tmp_path_factory.mktemp('store')))
+        builder = TreeBuilder(store)
+        for key, value in items:
+            builder[key] = value
+        return (builder,), {}
+
+    def commit(builder):
+        builder.commit()
+        _close(builder.object_store)
+
+    benchmark.pedantic(commit, setup=setup, rounds=3)
@@ -0,0 +1,48 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from hippiepug.store import Sha256DictStore
+from hippiepug.tree import TreeBuilder
+
+from . import make_rng, random_bytes
+
+
+def _items(num_keys, value_size):
+    rng = make_rng('tree', num_keys, value_size)
+    return {str(i).encode(): random_bytes(rng, value_size)
+            for i in range(num_keys)}
+
+
+@pytest.mark.parametrize('value_size', [16, 1024])
+@pytest.mark.parametrize('num_keys', [10**3, 10**4, 10**5])
+def test_tree_builder_commit(benchmark, num_keys, value_size):
+    """Benchmark committing a fresh tree."""
+    items = _items(num_keys, value_size)
+
+    def commit():
+        builder = TreeBuilder(Sha256DictStore())
+        builder.items.update(items)
+        return builder.commit()
+
+    benchmark(commit)
+
+
+@pytest.mark.parametrize('value_size', [64, 64 * 1024])
+@pytest.mark.parametrize('executor_class', [
+    None, ThreadPoolExecutor, ProcessPoolExecutor])
+def test_tree_builder_parallel_commit(benchmark, executor_class,
+                                      value_size):
+    """Benchmark committing a fresh tree serially and in parallel."""
+    num_keys = 10**4 if value_size < 1024 else 10**3
+    items = _items(num_keys, value_size)
+    executor = executor_class() if executor_class is not None else None
+
+    def commit():
+        builder = TreeBuilder(Sha256DictStore())
+        builder.items.update(items)
+        return builder.commit(executor=executor, chunk_size=256)
+
+    benchmark(commit)
+    if executor is not None:
+        executor.shutdown()
@@ -0,0 +1,62 @@
+import pytest
+
+from hippiepug.integrity import IntegrityPolicy
+from hippiepug.integrity import CHECK_ALWAYS, CHECK_ONCE, CHECK_SAMPLED
+from hippiepug.integrity import CHECK_TRUSTED
+from hippiepug.store import Sha256DictStore
+from hippiepug.tree import TreeBuilder, Tree
+
+
+NUM_KEYS = 10**5
+
+
+@pytest.fixture(scope='module')
+def tree():
+    builder = TreeBuilder(Sha256DictStore())
+    for i in range(NUM_KEYS):
+        builder[str(i).encode()] = str(i).encode()
+    return builder.commit()
+
+
+@pytest.mark.parametrize('num_lookups', [10**3, 10**4])
+def test_tree_lookup_one_by_one(benchmark, tree, num_lookups):
+    """Benchmark looking up keys one by one on a cold cache."""
+    lookup_keys = [str(i).encode() for i in range(0, NUM_KEYS,
+                                                  NUM_KEYS // num_lookups)]
+
+    def lookup():
+        view = Tree(tree.object_store, tree.root)
+        return [view.get_value_by_lookup_key(key) for key in lookup_keys]
+
+    benchmark(lookup)
+
+
+@pytest.mark.parametrize('num_lookups', [10**3, 10**4])
+def test_tree_lookup_batch(benchmark, tree, num_lookups):
+    """Benchmark looking up keys in one batch on a cold cache."""
+    lookup_keys = [str(i).encode() for i in range(0, NUM_KEYS,
+                                                  NUM_KEYS // num_lookups)]
+
+    def lookup():
+        view = Tree(tree.object_store, tree.root)
+        return view.get_many(lookup_keys)
+
+    benchmark(lookup)
+
+
+@pytest.mark.parametrize('mode', [
+    CHECK_ALWAYS, CHECK_ONCE, CHECK_SAMPLED, CHECK_TRUSTED])
+def test_tree_lookup_integrity_policy(benchmark, tree, mode):
+    """Benchmark cold-cache lookups under an integrity check policy."""
+    policy = IntegrityPolicy(mode, seed=0)
+    store = Sha256DictStore(backend=tree.object_store._backend,
+                            integrity=policy)
+    lookup_keys = [str(i).encode() for i in range(0, NUM_KEYS,
+                                                  NUM_KEYS // 10**3)]
+
+    def lookup():
+        view = Tree(store, tree.root)
+        return [view.get_value_by_lookup_key(key) for key in lookup_keys]
+
+    benchmark(lookup)
+    benchmark.extra_info['skip_rate'] = policy.stats.skip_rate
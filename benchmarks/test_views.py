@@ -0,0 +1,47 @@
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.integrity import IntegrityPolicy, CHECK_ONCE
+from hippiepug.logstore import LogStore
+from hippiepug.pack import EncodingParams, msgpack_decoder, view_decoder
+from hippiepug.views import ViewStore
+
+from . import make_rng, random_bytes, scaled
+
+
+PAYLOAD_SIZES = scaled([2**16, 2**22], [2**26])
+NUM_BLOCKS = 8
+
+READS = {
+    'copy': (lambda store: store, msgpack_decoder),
+    'view': (ViewStore, view_decoder),
+}
+
+
+@pytest.mark.parametrize('payload_size', PAYLOAD_SIZES)
+@pytest.mark.parametrize('read', sorted(READS))
+def test_block_index_reads(benchmark, tmp_path, read, payload_size):
+    """Benchmark reading the indices of blocks with large payloads.
+
+    Objects are checked once, so that repeated reads measure the copies
+    rather than the hashing.
+    """
+    rng = make_rng('views', payload_size)
+    store = LogStore(str(tmp_path), integrity=IntegrityPolicy(CHECK_ONCE))
+    chain = Chain(store)
+    builder = BlockBuilder(chain)
+    for _ in range(NUM_BLOCKS):
+        builder.payload = random_bytes(rng, payload_size)
+        builder.commit()
+
+    wrap, decoder = READS[read]
+    read_store = wrap(store)
+
+    def read_indices():
+        with EncodingParams(decoder=decoder).as_default():
+            # A fresh chain, so that blocks are not served from its cache.
+            reader = Chain(read_store, head=chain.head)
+            return [block.index for block in reader]
+
+    assert benchmark(read_indices) == list(range(NUM_BLOCKS))[::-1]
+    store.close()
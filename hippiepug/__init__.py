@@ -11,3 +11,4 @@ __license__ = 'MIT'
 from .chain import BlockBuilder, Chain
 from .tree import TreeBuilder, Tree
 from .pack import EncodingParams, encode, decode
+from .cache import CacheParams, LRUCache
@@ -0,0 +1,464 @@
+"""
+Asyncio interface to object stores, and async chain and tree readers.
+
+The readers run the same traversals as :py:class:`hippiepug.chain.Chain`
+and :py:class:`hippiepug.tree.Tree`, and only differ in how they retrieve
+objects: instead of blocking, they await an :py:class:`AsyncBaseStore`.
+Sibling tree nodes that a traversal needs together are retrieved
+concurrently.
+"""
+
+import abc
+import asyncio
+
+from .cache import resolve_cache
+from .chain import _blocks_steps, _decode_block, _forward_steps
+from .chain import _reverse_steps
+from .struct import MultiProof
+from .pack import encode, resolve_codec
+from .traversal import GetNodes, GetValues, get_nodes_steps
+from .tree import _SCAN_BATCH_SIZE, _decode_node, _get_many_steps
+from .tree import _leaf_steps, _lookup_value_steps, _multi_lookup_steps
+from .tree import _prefix_upper_bound, _range_steps
+
+
+class AsyncBaseStore(object):
+    """Abstract base class for an asyncio content-addressable store.
+
+    Mirrors :py:class:`hippiepug.store.BaseStore`, with coroutines in place
+    of the methods that do I/O.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @classmethod
+    @abc.abstractmethod
+    def hash_object(cls, serialized_obj):
+        """Return the ASCII hash of the object.
+
+        :param obj: Object, serialized to bytes
+        """
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    async def get(self, obj_hash, check_integrity=True):
+        """Return the object by its ASCII hash value.
+
+        :param obj_hash: ASCII hash
+        :param check_integrity: Whether to check the hash upon retrieval
+        """
+        pass  # pragma: no cover
+
+    async def get_many(self, obj_hashes, check_integrity=True):
+        """Return many objects by their ASCII hash values.
+
+        The default implementation awaits :py:meth:`get` for all hashes
+        concurrently.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :param check_integrity: Whether to check the hashes upon retrieval
+        :returns: List of objects in the order of ``obj_hashes``, with
+                  ``None`` for objects that are not in the store.
+        """
+        return list(await asyncio.gather(*[
+            self.get(obj_hash, check_integrity=check_integrity)
+            for obj_hash in obj_hashes]))
+
+    @abc.abstractmethod
+    async def contains(self, obj_hash):
+        """Check whether the store contains an object with a given hash.
+
+        :param obj_hash: ASCII hash
+        """
+        pass  # pragma: no cover
+
+    async def contains_many(self, obj_hashes):
+        """Check whether the store contains objects with given hashes.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :returns: List of bools in the order of ``obj_hashes``
+        """
+        return list(await asyncio.gather(*[
+            self.contains(obj_hash) for obj_hash in obj_hashes]))
+
+    @abc.abstractmethod
+    async def add(self, serialized_obj):
+        """Put the object in the store.
+
+        :param serialized_obj: Object, serialized to bytes
+        :return: Hash of the object.
+        """
+        pass  # pragma: no cover
+
+    async def add_hashed(self, obj_hash, serialized_obj):
+        """Put the object with an already computed hash in the store.
+
+        :param obj_hash: ASCII hash, as returned by :py:meth:`hash_object`
+        :param serialized_obj: Object, serialized to bytes
+        :return: Hash of the object.
+        """
+        return await self.add(serialized_obj)
+
+    async def add_many(self, serialized_objs):
+        """Put many objects in the store.
+
+        :param serialized_objs: Iterable of objects, serialized to bytes
+        :return: List of hashes of the objects.
+        """
+        serialized_objs = list(serialized_objs)
+        obj_hashes = [self.hash_object(serialized_obj)
+                      for serialized_obj in serialized_objs]
+        return await self.add_hashed_many(zip(obj_hashes, serialized_objs))
+
+    async def add_hashed_many(self, hashed_objs):
+        """Put many objects with already computed hashes in the store.
+
+        The default implementation awaits :py:meth:`add_hashed` for all
+        objects concurrently.
+
+        :param hashed_objs: Iterable of ``(obj_hash, serialized_obj)``
+                            pairs
+        :return: List of hashes of the objects.
+        """
+        return list(await asyncio.gather(*[
+            self.add_hashed(obj_hash, serialized_obj)
+            for obj_hash, serialized_obj in hashed_objs]))
+
+
+async def _drive(steps, get_nodes, get_values, on_result):
+    """Drive a traversal, awaiting what it requests.
+
+    :param on_result: Callable receiving the results of the traversal. If
+                      it returns True, the traversal is suspended, and this
+                      coroutine returns ``(True, None)``. Resume by calling
+                      again with the same traversal.
+    :returns: A ``(suspended, value)`` tuple, where ``value`` is returned
+              by the traversal.
+    """
+    value = error = None
+    while True:
+        try:
+            if error is not None:
+                step = steps.throw(error)
+            else:
+                step = steps.send(value)
+        except StopIteration as e:
+            return False, e.value
+
+        value = error = None
+        if isinstance(step, GetNodes):
+            try:
+                value = await get_nodes(step.hashes) if step.hashes else []
+            except Exception as e:
+                error = e
+        elif isinstance(step, GetValues):
+            try:
+                value = await get_values(step.hashes) if step.hashes else []
+            except Exception as e:
+                error = e
+        elif on_result(step):
+            return True, None
+
+
+async def run_steps(steps, get_nodes, get_values):
+    """Drive a traversal to completion, awaiting what it requests.
+
+    :returns: The value returned by the traversal
+    """
+    _, value = await _drive(steps, get_nodes, get_values, lambda _: False)
+    return value
+
+
+async def iter_steps(steps, get_nodes, get_values):
+    """Iterate over the results of a traversal, awaiting what it requests.
+
+    Asynchronous counterpart of
+    :py:func:`hippiepug.traversal.iter_steps`.
+    """
+    results = []
+    suspended = True
+    while suspended:
+        suspended, _ = await _drive(steps, get_nodes, get_values,
+                                    lambda result: results.append(result)
+                                    or True)
+        for result in results:
+            yield result
+        del results[:]
+
+
+class AsyncChain(object):
+    """Asyncio view of a skipchain.
+
+    :param object_store: Async object store
+    :type object_store: :py:class:`AsyncBaseStore`
+    :param head: The hash of the head block
+    :param cache: Cache. If not given, the default from
+                  :py:class:`hippiepug.cache.CacheParams` is used.
+    :param encoding: Encoder and decoder of blocks. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+
+    .. seealso::
+       * :py:class:`hippiepug.chain.Chain`
+    """
+
+    def __init__(self, object_store, head=None, cache=None, encoding=None):
+        self.object_store = object_store
+        self.head = head
+        self.encoding = encoding
+        self._cache = resolve_cache(cache)
+        self._encoder, self._decoder = resolve_codec(encoding, object_store)
+
+    async def _load_blocks(self, hash_values):
+        """Unsafely retrieve several blocks from the store, concurrently.
+
+        :raises: ``ValueError`` if retrieved object is not
+                 a :py:class:`hippiepug.struct.ChainBlock`
+        """
+        serialized_blocks = await self.object_store.get_many(hash_values)
+        blocks = []
+        for hash_value, serialized_block in zip(hash_values,
+                                                serialized_blocks):
+            block = None
+            if serialized_block is not None:
+                block = _decode_block(serialized_block, self._decoder)
+                self._cache[hash_value] = block
+            blocks.append(block)
+        return blocks
+
+    def _run(self, steps):
+        return run_steps(steps, self._load_blocks,
+                         self.object_store.get_many)
+
+    def _iter(self, steps):
+        return iter_steps(steps, self._load_blocks,
+                          self.object_store.get_many)
+
+    async def get_head_block(self):
+        """Get the latest block in the chain."""
+        if self.head is None:
+            return None
+        block, = await self._run(get_nodes_steps(self._cache, [self.head]))
+        return block
+
+    async def get_block_by_index(self, index, return_proof=False):
+        """Get block by index.
+
+        :param int>=0 index: Block index
+        :param bool return_proof: Whether to return inclusion proof
+        :returns: Found block or None, or (block, proof) tuple if
+                  return_proof is True.
+        :raises: If the index is out of bounds,
+                 raises ``IndexError``.
+
+        .. seealso::
+           * :py:meth:`hippiepug.chain.Chain.get_block_by_index`
+        """
+        (block,), proof = await self._run(
+                _blocks_steps(self._cache, self.head, [index]))
+        if return_proof:
+            return (block, proof)
+        return block
+
+    async def get_blocks(self, indices, return_proofs=False):
+        """Get many blocks by their indices in one walk.
+
+        .. seealso::
+           * :py:meth:`hippiepug.chain.Chain.get_blocks`
+        """
+        blocks, proof = await self._run(
+                _blocks_steps(self._cache, self.head, list(indices)))
+        if return_proofs:
+            return (blocks, proof)
+        return blocks
+
+    async def get_multi_proof(self, indices):
+        """Get a compact inclusion proof for many blocks.
+
+        .. seealso::
+           * :py:meth:`hippiepug.chain.Chain.get_multi_proof`
+        """
+        _, proof = await self.get_blocks(indices, return_proofs=True)
+        return MultiProof(nodes=[encode(block, self._encoder)
+                                 for block in proof])
+
+    async def iter_range(self, start=0, stop=None, reverse=False,
+                         prefetch=1024):
+        """Iterate over blocks in a range of indices.
+
+        .. seealso::
+           * :py:meth:`hippiepug.chain.Chain.iter_range`
+        """
+        head_block = await self.get_head_block()
+        length = head_block.index + 1 if head_block is not None else 0
+        if stop is None:
+            stop = length
+        if not (0 <= start and stop <= length):
+            raise IndexError(
+                ("Range is beyond this chain head. Must be "
+                 "0 <= {} and {} <= {}.").format(start, stop, length))
+
+        if reverse:
+            steps = _reverse_steps(self._cache, self.head,
+                                   stop - 1, start - 1)
+        else:
+            steps = _forward_steps(self._cache, self.head,
+                                   start, stop, prefetch)
+        async for block in self._iter(steps):
+            yield block
+
+    def __aiter__(self):
+        """Iterate over blocks, latest block first."""
+        return self.iter_range(reverse=True)
+
+    def __repr__(self):
+        return ('AsyncChain('  # pragma: no cover
+                'object_store={self.object_store}, '
+                'head={self.head})').format(self=self)
+
+
+class AsyncTree(object):
+    """Asyncio view of a Merkle tree.
+
+    :param object_store: Async object store
+    :type object_store: :py:class:`AsyncBaseStore`
+    :param root: The hash of the root node
+    :param cache: Cache. If not given, the default from
+                  :py:class:`hippiepug.cache.CacheParams` is used.
+    :param encoding: Encoder and decoder of nodes. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+
+    .. seealso::
+       * :py:class:`hippiepug.tree.Tree`
+    """
+
+    def __init__(self, object_store, root, cache=None, encoding=None):
+        self.object_store = object_store
+        self.root = root
+        self.encoding = encoding
+        self._cache = resolve_cache(cache)
+        self._encoder, self._decoder = resolve_codec(encoding, object_store)
+
+    async def _load_nodes(self, node_hashes):
+        """Unsafely retrieve several nodes from the store, concurrently.
+
+        :returns: List of nodes, with None for nodes that are not found.
+        :raises: ``TypeError`` if a retrieved object is not a tree node.
+        """
+        serialized_nodes = await self.object_store.get_many(node_hashes)
+        nodes = []
+        for node_hash, serialized_node in zip(node_hashes,
+                                              serialized_nodes):
+            node = None
+            if serialized_node is not None:
+                node = _decode_node(serialized_node, self._decoder)
+                self._cache[node_hash] = node
+            nodes.append(node)
+        return nodes
+
+    def _run(self, steps):
+        return run_steps(steps, self._load_nodes,
+                         self.object_store.get_many)
+
+    def _iter(self, steps):
+        return iter_steps(steps, self._load_nodes,
+                          self.object_store.get_many)
+
+    async def get_value_by_lookup_key(self, lookup_key, return_proof=False):
+        """Retrieve value by its lookup key.
+
+        .. seealso::
+           * :py:meth:`hippiepug.tree.Tree.get_value_by_lookup_key`
+        """
+        result, path = await self._run(
+                _lookup_value_steps(self._cache, self.root, lookup_key))
+        if return_proof:
+            return result, path
+        return result
+
+    async def get_many(self, lookup_keys, return_proofs=False):
+        """Retrieve values for many lookup keys at once.
+
+        .. seealso::
+           * :py:meth:`hippiepug.tree.Tree.get_many`
+        """
+        values, paths = await self._run(
+                _get_many_steps(self._cache, self.root, list(lookup_keys)))
+        if return_proofs:
+            return values, paths
+        return values
+
+    async def get_multi_proof(self, lookup_keys):
+        """Get a compact (non-)inclusion proof for many lookup keys.
+
+        .. seealso::
+           * :py:meth:`hippiepug.tree.Tree.get_multi_proof`
+        """
+        paths = await self._run(
+                _multi_lookup_steps(self._cache, self.root,
+                                    sorted(lookup_keys)))
+        nodes = {}
+        for path in paths:
+            for node in path:
+                nodes.setdefault(id(node), node)
+        return MultiProof(nodes=[encode(node, self._encoder)
+                                 for node in nodes.values()])
+
+    async def get_range(self, start=None, stop=None, return_proof=False):
+        """Retrieve all items in a range of lookup keys.
+
+        .. seealso::
+           * :py:meth:`hippiepug.tree.Tree.get_range`
+        """
+        proof = [] if return_proof else None
+        items = await self._run(
+                _range_steps(self._cache, self.root, start, stop, proof))
+        if return_proof:
+            return items, proof
+        return items
+
+    async def keys(self, start=None, stop=None):
+        """Iterate over lookup keys in order, lazily."""
+        leaves = self._iter(_leaf_steps(self._cache, self.root, start, stop))
+        async for leaf in leaves:
+            yield leaf.lookup_key
+
+    async def items(self, start=None, stop=None):
+        """Iterate over ``(lookup_key, value)`` pairs in order, lazily.
+
+        Values are retrieved from the store in batches.
+        """
+        batch = []
+        leaves = self._iter(_leaf_steps(self._cache, self.root, start, stop))
+        async for leaf in leaves:
+            batch.append(leaf)
+            if len(batch) == _SCAN_BATCH_SIZE:
+                for item in await self._fetch_items(batch):
+                    yield item
+                batch = []
+        for item in await self._fetch_items(batch):
+            yield item
+
+    async def _fetch_items(self, leaves):
+        if not leaves:
+            return []
+        values = await self.object_store.get_many(
+                [leaf.payload_hash for leaf in leaves])
+        return [(leaf.lookup_key, value)
+                for leaf, value in zip(leaves, values)]
+
+    def prefix_scan(self, prefix):
+        """Iterate over ``(lookup_key, value)`` pairs with keys starting
+        with a given prefix, in order, lazily."""
+        return self.items(start=prefix, stop=_prefix_upper_bound(prefix))
+
+    def __aiter__(self):
+        """Iterate over lookup keys in order."""
+        return self.keys()
+
+    def __repr__(self):
+        return ('AsyncTree('  # pragma: no cover
+                'object_store={self.object_store}, '
+                'root=\'{self.root}\')').format(self=self)
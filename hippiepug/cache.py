@@ -0,0 +1,250 @@
+"""
+Caches for decoded chain blocks and tree nodes.
+
+Chain and tree views keep the blocks and nodes they have decoded in a cache
+keyed by content hash. Any dict-like object with ``get`` and ``__setitem__``
+can serve as a cache. Since keys are content hashes, the same cache can be
+safely shared by many views, even of different chains and trees, as long as
+they use the same hash function.
+
+.. warning::
+    The cache is trusted: blocks and nodes retrieved from it are not checked
+    for integrity. Only share a cache between views that read from trusted
+    stores.
+"""
+
+import abc
+import sys
+import threading
+
+from collections import OrderedDict
+
+import attr
+
+from defaultcontext import with_default_context
+
+
+_MISSING = object()
+
+
+def approx_sizeof(obj):
+    """Approximate the size of a block or node in memory.
+
+    Accounts for the object itself and its immediate attributes.
+
+    :param obj: Cached object
+    :returns: Size in bytes
+    """
+    size = sys.getsizeof(obj)
+    if attr.has(obj.__class__):
+        for value in attr.astuple(obj, recurse=False):
+            size += sys.getsizeof(value)
+    return size
+
+
+@attr.s
+class CacheStats(object):
+    """Cache statistics.
+
+    :param hits: Number of lookups that found the object
+    :param misses: Number of lookups that did not find the object
+    :param evictions: Number of evicted objects
+    """
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    evictions = attr.ib(default=0)
+
+    @property
+    def hit_rate(self):
+        """Ratio of hits to all lookups."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class BaseCache(object):
+    """Abstract base class for a thread-safe bounded cache.
+
+    Subclasses implement the eviction policy.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        """Return the cached object, or ``default`` if not cached.
+
+        Counts as a hit or a miss.
+        """
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def __setitem__(self, key, value):
+        """Put the object in the cache, possibly evicting others."""
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def __contains__(self, key):
+        """Check if the object is cached.
+
+        Does not count as a hit or a miss.
+        """
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def __len__(self):
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove all objects from the cache."""
+        pass  # pragma: no cover
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    @property
+    def stats(self):
+        """Snapshot of cache statistics.
+
+        :rtype: :py:class:`CacheStats`
+        """
+        with self._lock:
+            return attr.evolve(self._stats)
+
+    def reset_stats(self):
+        """Reset cache statistics."""
+        with self._lock:
+            self._stats = CacheStats()
+
+
+class LRUCache(BaseCache):
+    """Cache with least-recently-used eviction.
+
+    The cache can be bounded by the number of objects, by their approximate
+    total size in memory, or both.
+
+    :param max_items: Maximum number of cached objects
+    :param max_bytes: Maximum total size of cached objects
+    :param sizeof: Function estimating the size of an object in bytes. Only
+                   used when ``max_bytes`` is set.
+
+    >>> cache = LRUCache(max_items=2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache
+    False
+    >>> cache.stats
+    CacheStats(hits=1, misses=0, evictions=1)
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=approx_sizeof):
+        super(LRUCache, self).__init__()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        """Approximate total size of cached objects.
+
+        Only tracked when ``max_bytes`` is set.
+        """
+        return self._nbytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self._stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._nbytes -= self._sizes.pop(key)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self._nbytes += size
+            self._evict()
+
+    def _evict(self):
+        """Evict least recently used objects until within the budget."""
+        while self._data and (
+                (self.max_items is not None
+                 and len(self._data) > self.max_items) or
+                (self.max_bytes is not None
+                 and self._nbytes > self.max_bytes)):
+            key, _ = self._data.popitem(last=False)
+            self._nbytes -= self._sizes.pop(key)
+            self._stats.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._nbytes = 0
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                'max_items={self.max_items}, '
+                'max_bytes={self.max_bytes})').format(self=self)
+
+
+@with_default_context(use_empty_init=True)
+@attr.s
+class CacheParams(object):
+    """Thread-local container for the default cache.
+
+    :param cache: Cache shared by all chain and tree views that are created
+                  without an explicit cache. If None, each view gets its own
+                  unbounded dict.
+
+    This is how you can install a process-wide shared cache:
+
+    >>> from .chain import Chain
+    >>> from .store import Sha256DictStore
+    >>> shared_cache = LRUCache(max_items=10000)
+    >>> CacheParams.set_global_default(CacheParams(cache=shared_cache))
+    >>> Chain(Sha256DictStore())._cache is shared_cache
+    True
+    >>> CacheParams.reset_defaults()
+    """
+    cache = attr.ib(default=None)
+
+
+def resolve_cache(cache=None):
+    """Return the cache a view should use.
+
+    :param cache: Explicitly passed cache, possibly empty
+    :returns: ``cache`` if not None, otherwise the default cache, or a new
+              dict if there is no default.
+    """
+    if cache is None:
+        cache = CacheParams.get_default().cache
+    if cache is None:
+        cache = {}
+    return cache
@@ -4,8 +4,171 @@ Tools for building and interpreting skipchains.
 
 from warnings import warn
 
-from .struct import ChainBlock
-from .pack import encode, decode
+from .struct import ChainBlock, MultiProof, VerificationResult
+from .store import Sha256DictStore
+from .pack import encode, decode, index_proof, resolve_codec
+from .cache import resolve_cache
+from .navigation import finger_indices, next_hop
+from .traversal import GetNodes, collect_steps, iter_steps, run_steps
+
+
+def _check_index(index, head_block):
+    """Check that the index is within the chain bounds.
+
+    :raises: ``IndexError`` if it is not.
+    """
+    if not (0 <= index <= head_block.index):
+        raise IndexError(
+            ("Block is beyond this chain head. Must be "
+             "0 <= {} <= {}.").format(index, head_block.index))
+
+
+def _next_hop(block, index):
+    """Choose the finger to follow from a block towards an index.
+
+    The finger is read at the slot where the skipchain layout puts it.
+    Blocks with other layouts fall back to scanning their fingers.
+
+    :returns: Hash of the block with the smallest index among the
+              fingers that do not jump beyond the target index.
+    :raises: ``ValueError`` if no such finger exists.
+    """
+    fingers = block.fingers
+    if 0 <= index < block.index:
+        hop_index, slot = next_hop(block.index, index)
+        if slot < len(fingers):
+            finger_index, hash_value = fingers[slot]
+            if finger_index == hop_index:
+                return hash_value
+    _, hash_value = min((f, h) for (f, h) in fingers if f >= index)
+    return hash_value
+
+
+def _walk_steps(cache, head_block, indices):
+    """Traversal walking from the head towards several blocks at once.
+
+    Since the indices are visited from the latest to the oldest, all
+    of them are reached in a single walk, and every block on the way
+    is requested once.
+
+    :param head_block: Head block
+    :param indices: Indices sorted in descending order
+    :returns: A tuple with a dict mapping indices to found blocks, and
+              the list of all the blocks on the walk.
+    """
+    found = {}
+    path = []
+    current_block = head_block
+    i = 0
+    while current_block is not None and i < len(indices):
+        try:
+            path.append(current_block)
+            # When found:
+            while i < len(indices) and indices[i] == current_block.index:
+                found[indices[i]] = current_block
+                i += 1
+            if i == len(indices):
+                break
+            # Otherwise, follow the fingers:
+            hash_value = _next_hop(current_block, indices[i])
+            current_block = cache.get(hash_value)
+            if current_block is None:
+                current_block, = yield GetNodes([hash_value])
+
+        # If something happened, likely a block was malformed.
+        except Exception as e:
+            warn('Exception occured while processing block %s: %s' % (
+                current_block, e))
+            break
+
+    return found, path
+
+
+def _blocks_steps(cache, head, indices):
+    """Traversal getting blocks by their indices.
+
+    :param head: Hash of the head block
+    :param indices: List of block indices
+    :returns: A tuple with the list of found blocks or None in the order
+              of ``indices``, and the list of all the blocks on the walk.
+    :raises: ``IndexError`` if an index is out of bounds.
+    """
+    head_block = None
+    if head is not None:
+        head_block = cache.get(head)
+        if head_block is None:
+            head_block, = yield GetNodes([head])
+    if head_block is None:
+        return [None] * len(indices), []
+    for index in indices:
+        _check_index(index, head_block)
+
+    found, path = yield from _walk_steps(
+            cache, head_block, sorted(set(indices), reverse=True))
+    return [found.get(index) for index in indices], path
+
+
+def _reverse_steps(cache, head, current_index, stop_index=-1):
+    """Traversal yielding blocks, latest first.
+
+    Looks up the first block by index, and then follows the back-pointer
+    of each block to its immediate predecessor.
+
+    :param head: Hash of the head block
+    :param current_index: Index of the first block
+    :param stop_index: Index of the block at which to stop (exclusive)
+    """
+    current_hash = None
+    while current_index > stop_index:
+        if current_hash is None:
+            (block,), _ = yield from _blocks_steps(
+                    cache, head, [current_index])
+            if block is None:
+                raise IndexError('Block not found.')
+        else:
+            block = cache.get(current_hash)
+            if block is None:
+                block, = yield GetNodes([current_hash])
+            if block is None or block.index != current_index:
+                raise ValueError(
+                    'Block {} is missing or malformed.'.format(
+                        current_index))
+
+        # Follow the finger to the immediate predecessor.
+        if block.index > 0:
+            predecessor_index, current_hash = block.fingers[0]
+            if predecessor_index != block.index - 1:
+                raise ValueError(
+                    'Block {} is malformed.'.format(block.index))
+
+        current_index -= 1
+        yield block
+
+
+def _forward_steps(cache, head, start, stop, prefetch):
+    """Traversal yielding blocks, oldest first, in chunks.
+
+    Each chunk is looked up by its last index, walked backwards, and
+    yielded in order.
+    """
+    for chunk_start in range(start, stop, prefetch):
+        chunk_stop = min(chunk_start + prefetch, stop)
+        chunk = yield from collect_steps(
+                _reverse_steps(cache, head, chunk_stop - 1, chunk_start - 1))
+        for block in reversed(chunk):
+            yield block
+
+
+def _decode_block(serialized_block, decoder=None):
+    """Decode a chain block.
+
+    :param decoder: Custom decoder, or None for the default one
+    :raises: ``ValueError`` if the object is not a chain block.
+    """
+    block = decode(serialized_block, decoder)
+    if not isinstance(block, ChainBlock):
+        raise ValueError('Object with this hash is not a chain block.')
+    return block
 
 
 class Chain(object):
@@ -26,34 +189,56 @@ class Chain(object):
         """
         Chain iterator.
 
+        Looks up the first block by index, and then follows the
+        back-pointer of each block to its immediate predecessor, so that
+        iterating over *n* blocks takes *n* retrievals.
+
+        :param current_index: Index of the first block
+        :param chain: Chain
+        :param stop_index: Index of the block at which to stop (exclusive)
+
         .. note::
            Iterates in the reverse order: latest block first.
         """
-        def __init__(self, current_index, chain):
+        def __init__(self, current_index, chain, stop_index=-1):
             self.current_index = current_index
             self.chain = chain
+            self.stop_index = stop_index
+            self._blocks = None
+
+        def __iter__(self):
+            return self
 
         def __next__(self):
-            if self.current_index >= 0:
-                block = self.chain[self.current_index]
-                self.current_index -= 1
-                return block
-            else:
-                raise StopIteration
+            if self._blocks is None:
+                self._blocks = self.chain._iter(_reverse_steps(
+                        self.chain._cache, self.chain.head, self.current_index,
+                        self.stop_index))
+            block = next(self._blocks)
+            self.current_index -= 1
+            return block
 
         def next(self):
             return self.__next__()
 
     def __init__(self, object_store, head=None,
-                 cache=None):
+                 cache=None, encoding=None):
         """
         :param object_store: Object store
         :param head: The hash of the head block
-        :param dict cache: Cache
+        :param cache: Cache. If not given, the default from
+                      :py:class:`hippiepug.cache.CacheParams` is used.
+        :type cache: dict-like, e.g., :py:class:`hippiepug.cache.LRUCache`
+        :param encoding: Encoder and decoder of blocks. If not given, those
+                         bound to the store are used, or else the defaults
+                         from :py:class:`hippiepug.pack.EncodingParams`.
+        :type encoding: :py:class:`hippiepug.pack.EncodingParams`
         """
         self.object_store = object_store
         self.head = head
-        self._cache = cache or {}
+        self.encoding = encoding
+        self._cache = resolve_cache(cache)
+        self._encoder, self._decoder = resolve_codec(encoding, object_store)
 
     @property
     def head_block(self):
@@ -70,16 +255,37 @@ class Chain(object):
         :raises: ``ValueError`` if retrieved object is not
                  a :py:class:`struct.ChainBlock`
         """
-        if hash_value in self._cache:
-            return self._cache[hash_value]
-
-        serialized_block = self.object_store.get(hash_value)
-        if serialized_block is not None:
-            block = decode(serialized_block)
-            if not isinstance(block, ChainBlock):
-                raise ValueError('Object with this hash is not a chain block.')
-            self._cache[hash_value] = block
-            return block
+        cached_block = self._cache.get(hash_value)
+        if cached_block is not None:
+            return cached_block
+
+        block, = self._load_blocks([hash_value])
+        return block
+
+    def _load_blocks(self, hash_values):
+        """Unsafely retrieve several blocks from the store.
+
+        Does not look the blocks up in the cache, but puts them there.
+        """
+        blocks = []
+        for hash_value in hash_values:
+            block = None
+            serialized_block = self.object_store.get(hash_value)
+            if serialized_block is not None:
+                block = _decode_block(serialized_block, self._decoder)
+                self._cache[hash_value] = block
+            blocks.append(block)
+        return blocks
+
+    def _iter(self, steps):
+        """Iterate over the results of a traversal."""
+        return iter_steps(steps, self._load_blocks,
+                          self.object_store.get_many)
+
+    def _run(self, steps):
+        """Run a traversal, retrieving what it requests."""
+        return run_steps(steps, self._load_blocks,
+                         self.object_store.get_many)
 
     def get_block_by_index(self, index, return_proof=False):
         """Get block by index.
@@ -94,39 +300,46 @@ class Chain(object):
         :raises: If the index is out of bounds,
                  raises ``IndexError``.
         """
-        if self.head_block is None:
-            if return_proof:
-                return (None, [])
-            return None
-        if not (0 <= index <= self.head_block.index):
-            raise IndexError(
-                ("Block is beyond this chain head. Must be "
-                 "0 <= {} <= {}.").format(index, self.head_block.index))
+        (block,), proof = self._run(
+                _blocks_steps(self._cache, self.head, [index]))
+        if return_proof:
+            return (block, proof)
+        return block
 
-        proof = []
-        hash_value = self.head
-        current_block = self.head_block
-        while True:
-            if current_block is None:
-                break
+    def get_blocks(self, indices, return_proofs=False):
+        """Get many blocks by their indices in one walk.
 
-            try:
-                proof.append(current_block)
-                # When found:
-                if index == current_block.index:
-                    if return_proof:
-                        return (current_block, proof)
-                    return current_block
-                # Otherwise, follow the fingers:
-                _, hash_value = [(f, h) for (f, h) in current_block.fingers
-                          if f >= index][0]
-                current_block = self._get_block_by_hash(hash_value)
-
-            # If something happened, likely a block was malformed.
-            except Exception as e:
-                warn('Exception occured while processing block %s: %s' % (
-                    current_block, e))
-                break
+        Optionally returns an inclusion proof for all the blocks at once,
+        that is a list of intermediate blocks, each included once.
+
+        :param indices: Iterable of block indices
+        :param bool return_proofs: Whether to return inclusion proof
+        :returns: List of found blocks or None in the order of ``indices``,
+                  or (blocks, proof) tuple if return_proofs is True.
+        :raises: If an index is out of bounds,
+                 raises ``IndexError``.
+
+        .. seealso::
+           * :py:meth:`get_block_by_index`
+        """
+        blocks, proof = self._run(
+                _blocks_steps(self._cache, self.head, list(indices)))
+        if return_proofs:
+            return (blocks, proof)
+        return blocks
+
+    def get_multi_proof(self, indices):
+        """Get a compact inclusion proof for many blocks.
+
+        :param indices: Iterable of block indices
+        :returns: Proof containing each needed block once
+        :rtype: :py:class:`hippiepug.struct.MultiProof`
+        :raises: If an index is out of bounds,
+                 raises ``IndexError``.
+        """
+        _, proof = self.get_blocks(indices, return_proofs=True)
+        return MultiProof(nodes=[encode(block, self._encoder)
+                                 for block in proof])
 
     def __getitem__(self, index):
         """Get block by index."""
@@ -137,12 +350,61 @@ class Chain(object):
 
     def _append(self, block):
         """Append block to the chain."""
-        serialized_block = encode(block)
+        serialized_block = encode(block, self._encoder)
         self.head = self.object_store.add(serialized_block)
         self._cache[self.head] = block
 
+    def extend(self, payloads):
+        """Append a block for each payload to the chain in one batch.
+
+        :param payloads: Iterable of block payloads
+        :return: List of the appended blocks.
+
+        .. seealso::
+           * :py:meth:`BlockBuilder.commit_many`, to append blocks using
+             a builder with a pre-commit hook
+        """
+        return BlockBuilder(self).commit_many(payloads)
+
+    def iter_range(self, start=0, stop=None, reverse=False,
+                   prefetch=1024):
+        """Iterate over blocks in a range of indices.
+
+        Reverse iteration follows the back-pointers from block to block,
+        and takes one retrieval per block. Since blocks only point back,
+        forward iteration is done in chunks of at most ``prefetch``
+        blocks: each chunk is looked up by its last index, walked
+        backwards, and yielded in order.
+
+        :param int start: First index (inclusive)
+        :param int stop: Last index (exclusive). Defaults to the index
+                         after the head block.
+        :param bool reverse: Whether to iterate latest block first
+        :param int prefetch: Maximum number of blocks held in memory during
+                             forward iteration
+        :raises: ``IndexError`` if the range is out of bounds
+        """
+        head_block = self.head_block
+        length = head_block.index + 1 if head_block is not None else 0
+        if stop is None:
+            stop = length
+        if not (0 <= start and stop <= length):
+            raise IndexError(
+                ("Range is beyond this chain head. Must be "
+                 "0 <= {} and {} <= {}.").format(start, stop, length))
+
+        if reverse:
+            return Chain.ChainIterator(stop - 1, self, stop_index=start - 1)
+        return self._iter(
+                _forward_steps(self._cache, self.head, start, stop, prefetch))
+
     def __iter__(self):
-        return Chain.ChainIterator(self.head_block.index, self)
+        """Iterate over blocks, latest block first."""
+        return self.iter_range(reverse=True)
+
+    def __reversed__(self):
+        """Iterate over blocks, oldest block first."""
+        return self.iter_range(reverse=False)
 
     def __repr__(self):
         return ('Chain('  # pragma: no cover
@@ -209,7 +471,7 @@ class BlockBuilder(object):
 
         :param int>=0 index: Block index
         """
-        return {index - 1 - ((index - 1) % (2**f)) for f in range(64)}
+        return set(finger_indices(index))
 
     def _make_next_block(self, payload=None):
         """Prepare an empty subsequent block.
@@ -217,23 +479,32 @@ class BlockBuilder(object):
         This method prefills the index and fingers. Payload is expected
         to be added before commiting to the chain.
         """
-
-        new_block = ChainBlock(payload=payload)
         if self.chain.head is None:
-            return new_block
+            return ChainBlock(payload=payload)
+        return self._make_block_after(self.chain.head_block, self.chain.head,
+                                      payload)
 
-        current_block = self.chain.head_block
-        new_block.index = current_block.index + 1
+    def _make_block_after(self, current_block, current_hash, payload=None):
+        """Prepare a block following a given one.
+
+        :param current_block: The preceding block
+        :param current_hash: Hash of the preceding block
+        """
+        new_block = ChainBlock(payload=payload)
+        current_index = current_block.index
+        new_block.index = current_index + 1
 
-        finger_indices = self.skipchain_indices(new_block.index)
         # NOTE: We want to use lists, and not tuples here, b/c
         #       msgpack transforms tuples into lists. So if these
         #       were tuples, comparison of fresh and deserialized
         #       blocks would be non-trivial.
-        new_fingers = [[current_block.index, self.chain.head]]
+        new_fingers = [[current_index, current_hash]]
         # TODO: Do we also need to generate new fingers here?
         for index, prev_hash in current_block.fingers:
-            if index in finger_indices:
+            # Same as ``index in self.skipchain_indices(new_block.index)``,
+            # that is, the index is the current one with its low bits
+            # cleared, without building the set.
+            if index == 0 or (current_index ^ index) < (index & -index):
                 new_fingers.append([index, prev_hash])
 
         new_block.fingers = new_fingers
@@ -250,6 +521,54 @@ class BlockBuilder(object):
         self._block = self._make_next_block()
         return current_block
 
+    def commit_many(self, payloads):
+        """Commit a block for each payload to the associated chain.
+
+        The blocks are chained in memory, and the hook
+        :py:meth:`pre_commit` is called for each of them, as in
+        :py:meth:`commit`. The blocks are then put into the store in a
+        single batch, and only after that the head of the chain is moved
+        to the last one. If the hook or the store fails, the chain is
+        left as it was.
+
+        :param payloads: Iterable of block payloads
+        :return: List of the blocks that were committed.
+
+        >>> from .store import Sha256DictStore
+        >>> chain = Chain(Sha256DictStore())
+        >>> blocks = BlockBuilder(chain).commit_many(
+        ...         [b'Block %d' % i for i in range(100)])
+        >>> chain[42].payload
+        b'Block 42'
+        """
+        chain = self.chain
+        hash_object = chain.object_store.hash_object
+        pending_block = self._block
+        pending_payload = pending_block.payload
+        blocks = []
+        hashed_blocks = []
+        try:
+            for payload in payloads:
+                self._block.payload = payload
+                self.pre_commit()
+                block = self._block
+                serialized_block = encode(block, chain._encoder)
+                block_hash = hash_object(serialized_block)
+                blocks.append(block)
+                hashed_blocks.append((block_hash, serialized_block))
+                self._block = self._make_block_after(block, block_hash)
+            chain.object_store.add_hashed_many(hashed_blocks)
+        except BaseException:
+            pending_block.payload = pending_payload
+            self._block = pending_block
+            raise
+
+        for block, (block_hash, _) in zip(blocks, hashed_blocks):
+            chain._cache[block_hash] = block
+        if hashed_blocks:
+            chain.head = hashed_blocks[-1][0]
+        return blocks
+
     def pre_commit(self):
         """Pre-commit hook.
 
@@ -266,7 +585,7 @@ class BlockBuilder(object):
                     self=self)
 
 
-def verify_chain_inclusion_proof(store, head, block, proof):
+def verify_chain_inclusion_proof(store, head, block, proof, encoding=None):
     """Verify inclusion proof for a block on a chain.
 
     :param store: Object store, may be empty
@@ -274,11 +593,126 @@ def verify_chain_inclusion_proof(store, head, block, proof):
     :param block: Block
     :param proof: Inclusion proof
     :type proof: list of decoded blocks
+    :param encoding: Encoder and decoder of the proof. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
     :returns: bool
+
+    .. seealso::
+       * :py:func:`verify_chain_proof` does not need a store
     """
-    for other_block in proof:
-        store.add(encode(other_block))
-    verifier_chain = Chain(store, head=head)
+    encoder, _ = resolve_codec(encoding, store)
+    store.add_many(encode(other_block, encoder) for other_block in proof)
+    verifier_chain = Chain(store, head=head, encoding=encoding)
     retrieved_block = verifier_chain.get_block_by_index(block.index)
     return retrieved_block == block
 
+
+def verify_chain_multi_proof(store, head, blocks, proof, encoding=None):
+    """Verify inclusion proof for many blocks on a chain.
+
+    :param store: Object store, may be empty
+    :param head: Chain head
+    :param blocks: Blocks
+    :param proof: Multi-proof
+    :type proof: :py:class:`hippiepug.struct.MultiProof`
+    :param encoding: Encoder and decoder of the proof. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: bool
+    """
+    store.add_many(proof.nodes)
+    blocks = list(blocks)
+    verifier_chain = Chain(store, head=head, encoding=encoding)
+    try:
+        retrieved_blocks = verifier_chain.get_blocks(
+                [block.index for block in blocks])
+    except IndexError:
+        return False
+    return retrieved_blocks == blocks
+
+
+def _verify_chain_path(blocks_by_hash, head, block):
+    """Replay the walk from the head to a block over indexed blocks."""
+    current_hash = head
+    while True:
+        current_block = blocks_by_hash.get(current_hash)
+        if current_block is None:
+            return VerificationResult(False, 'Block {} is missing.'.format(
+                current_hash))
+        if not isinstance(current_block, ChainBlock):
+            return VerificationResult(False, 'Object {} is not a block.'.format(
+                current_hash))
+        if current_block.index == block.index:
+            if current_block != block:
+                return VerificationResult(False, 'Block does not match.')
+            return VerificationResult(True)
+        try:
+            next_hash = _next_hop(current_block, block.index)
+        except Exception as e:
+            return VerificationResult(False, 'Block {} is malformed: {}'.format(
+                current_hash, e))
+        next_block = blocks_by_hash.get(next_hash)
+        # Indices must decrease along the walk.
+        if next_block is not None and not (
+                isinstance(next_block, ChainBlock) and
+                next_block.index < current_block.index):
+            return VerificationResult(False, 'Block {} is malformed.'.format(
+                next_hash))
+        current_hash = next_hash
+
+
+def verify_chain_proof(head, block, proof, hash_object=None, encoding=None):
+    """Verify inclusion proof for a block on a chain without a store.
+
+    Checks the hash links between the proof blocks directly. Each proof
+    block is hashed once.
+
+    :param head: Chain head
+    :param block: Block
+    :param proof: Inclusion proof
+    :type proof: list of decoded blocks, or
+                 :py:class:`hippiepug.struct.MultiProof`
+    :param hash_object: Hash function of the chain's store. Defaults to
+                        :py:meth:`hippiepug.store.Sha256DictStore.hash_object`
+    :param encoding: Encoder and decoder of the chain's store. Defaults to
+                     those from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :rtype: :py:class:`hippiepug.struct.VerificationResult`
+    """
+    return verify_chain_proofs(head, [block], [proof], hash_object,
+                               encoding)[0]
+
+
+def verify_chain_proofs(head, blocks, proofs, hash_object=None,
+                        encoding=None):
+    """Verify inclusion proofs for many blocks on a chain without a store.
+
+    Proof blocks shared between proofs are hashed once.
+
+    :param head: Chain head
+    :param blocks: Blocks
+    :param proofs: Inclusion proofs, one for each block
+    :param hash_object: Hash function of the chain's store. Defaults to
+                        :py:meth:`hippiepug.store.Sha256DictStore.hash_object`
+    :param encoding: Encoder and decoder of the chain's store. Defaults to
+                     those from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: List of verification results
+    """
+    if hash_object is None:
+        hash_object = Sha256DictStore.hash_object
+    encoder, decoder = resolve_codec(encoding)
+    memo = {}
+    results = []
+    for block, proof in zip(blocks, proofs):
+        try:
+            blocks_by_hash = index_proof(proof, hash_object, memo,
+                                         encoder, decoder)
+        except (ValueError, TypeError) as e:
+            results.append(VerificationResult(False, str(e)))
+            continue
+        results.append(_verify_chain_path(blocks_by_hash, head, block))
+    return results
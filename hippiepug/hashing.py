@@ -0,0 +1,182 @@
+"""
+Content hashing for stores.
+
+By default, stores identify objects by SHA256 digests truncated to 8 bytes
+and hex-encoded into ``str``. A :py:class:`Hasher` can instead use BLAKE2b,
+BLAKE2s, or, if the ``blake3`` package is installed, BLAKE3, with digests of
+any supported length. It can also produce raw ``bytes`` digests, which are
+half the size in memory and on the wire, and skip hex encoding. Chains and
+trees treat hashes as opaque values, so they work with any of these. Use
+:py:func:`to_hex` to display hashes.
+
+>>> hasher = Hasher(digest_size=32, binary=True, algorithm='blake2b')
+>>> obj_hash = hasher(b'dummy')
+>>> len(obj_hash)
+32
+>>> to_hex(obj_hash) == Hasher(32, algorithm='blake2b')(b'dummy')
+True
+
+Persistent stores record the spec of their hasher, and refuse to be opened
+with a different one:
+
+>>> hasher.spec
+'blake2b/32/bin'
+>>> Hasher.from_spec(hasher.spec) == hasher
+True
+"""
+
+from binascii import hexlify, unhexlify
+from hashlib import sha256, blake2b, blake2s
+
+import attr
+
+try:
+    import blake3
+except ImportError:  # pragma: no cover
+    blake3 = None
+
+
+#: Digest size of the default hasher, in bytes.
+DEFAULT_DIGEST_SIZE = 8
+
+
+def _sha256_digest(serialized_obj, digest_size):
+    return sha256(serialized_obj).digest()[:digest_size]
+
+
+def _blake2b_digest(serialized_obj, digest_size):
+    return blake2b(serialized_obj, digest_size=digest_size).digest()
+
+
+def _blake2s_digest(serialized_obj, digest_size):
+    return blake2s(serialized_obj, digest_size=digest_size).digest()
+
+
+def _blake3_digest(serialized_obj, digest_size):
+    return blake3.blake3(serialized_obj).digest(length=digest_size)
+
+
+#: Supported algorithms, with their digest functions and maximum digest
+#: sizes in bytes. SHA256 digests are truncated, the others are computed at
+#: the requested size.
+ALGORITHMS = {
+    'sha256': (_sha256_digest, 32),
+    'blake2b': (_blake2b_digest, 64),
+    'blake2s': (_blake2s_digest, 32),
+    'blake3': (_blake3_digest, 64),
+}
+
+
+def available_algorithms():
+    """Return the names of algorithms usable in this environment."""
+    return sorted(name for name in ALGORITHMS
+                  if name != 'blake3' or blake3 is not None)
+
+
+def to_hex(obj_hash):
+    """Return a hash as a hex string, e.g., for display.
+
+    :param obj_hash: Raw or hex-encoded hash
+    """
+    if isinstance(obj_hash, bytes):
+        return hexlify(obj_hash).decode('utf-8')
+    return obj_hash
+
+
+@attr.s(frozen=True, slots=True)
+class Hasher(object):
+    """Hash function of a store.
+
+    :param digest_size: Digest size in bytes
+    :param binary: Whether hashes are raw ``bytes``. Otherwise, they are
+                   hex-encoded ``str``.
+    :param algorithm: One of :py:data:`ALGORITHMS`
+    """
+
+    digest_size = attr.ib(default=DEFAULT_DIGEST_SIZE)
+    binary = attr.ib(default=False)
+    algorithm = attr.ib(default='sha256')
+    _digest = attr.ib(init=False, repr=False, eq=False)
+
+    def __attrs_post_init__(self):
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError('Unknown hash algorithm: {}'.format(
+                self.algorithm))
+        if self.algorithm not in available_algorithms():
+            raise ValueError('Hash algorithm {} needs the {} package.'.format(
+                self.algorithm, self.algorithm))
+        digest, max_digest_size = ALGORITHMS[self.algorithm]
+        if not 0 < self.digest_size <= max_digest_size:
+            raise ValueError('Digest size must be between 1 and %d bytes.'
+                             % max_digest_size)
+        object.__setattr__(self, '_digest', digest)
+
+    def __call__(self, serialized_obj):
+        """Return the hash of a serialized object."""
+        digest = self._digest(serialized_obj, self.digest_size)
+        if self.binary:
+            return digest
+        return hexlify(digest).decode('utf-8')
+
+    @property
+    def spec(self):
+        """String identifying the hasher, e.g., ``'sha256/8/hex'``."""
+        return '{}/{}/{}'.format(self.algorithm, self.digest_size,
+                                 'bin' if self.binary else 'hex')
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Make a hasher from its :py:attr:`spec`.
+
+        :raises: ``ValueError`` if the spec is malformed
+        """
+        try:
+            algorithm, digest_size, encoding = spec.split('/')
+            if encoding not in ('bin', 'hex'):
+                raise ValueError()
+            digest_size = int(digest_size)
+        except ValueError:
+            raise ValueError('Malformed hasher spec: {}'.format(spec))
+        return cls(digest_size=digest_size, binary=encoding == 'bin',
+                   algorithm=algorithm)
+
+    def to_bytes(self, obj_hash):
+        """Return the raw digest of a hash.
+
+        :raises: ``ValueError`` if the hash is malformed
+        """
+        if self.binary:
+            if not isinstance(obj_hash, bytes):
+                raise ValueError('Hash is not bytes: {}'.format(obj_hash))
+            return obj_hash
+        try:
+            return unhexlify(obj_hash)
+        except (TypeError, ValueError):
+            raise ValueError('Hash is not a hex string: {}'.format(obj_hash))
+
+    def from_bytes(self, digest):
+        """Return the hash with a given raw digest."""
+        if self.binary:
+            return bytes(digest)
+        return hexlify(digest).decode('utf-8')
+
+
+#: Hasher of :py:class:`hippiepug.store.Sha256DictStore`.
+HEX_HASHER = Hasher()
+
+
+def resolve_hasher(recorded_spec, hasher=None):
+    """Return the hasher a persistent store should use.
+
+    :param recorded_spec: Spec recorded in the store, or None for a new
+                          store, or a store made before specs were recorded.
+    :param hasher: Hasher requested by the caller, if any
+    :raises: ``ValueError`` if the requested hasher is not the recorded one
+    """
+    if recorded_spec is None:
+        return hasher if hasher is not None else HEX_HASHER
+    recorded = Hasher.from_spec(recorded_spec)
+    if hasher is not None and hasher != recorded:
+        raise ValueError('Store uses hasher {}, not {}.'.format(
+            recorded.spec, hasher.spec))
+    return recorded
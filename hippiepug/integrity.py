@@ -0,0 +1,183 @@
+"""
+Policies for checking the integrity of retrieved objects.
+
+By default, stores re-hash every object they return, so that a corrupted
+or forged object is never used. Objects that are read over and over again,
+like the upper nodes of a tree, are then hashed over and over again,
+although their bytes do not change. An :py:class:`IntegrityPolicy` passed
+to a store relaxes this:
+
+* :py:data:`CHECK_ALWAYS`: hash every retrieved object,
+* :py:data:`CHECK_ONCE`: hash each object once per process and store, and
+  remember the hashes of verified objects in a bounded set,
+* :py:data:`CHECK_SAMPLED`: hash a random fraction of retrieved objects,
+* :py:data:`CHECK_TRUSTED`: hash nothing, for backends that already
+  guarantee integrity.
+
+The policy counts the checks it did and skipped.
+
+>>> from .store import Sha256DictStore
+>>> policy = IntegrityPolicy(CHECK_ONCE)
+>>> store = Sha256DictStore(integrity=policy)
+>>> obj_hash = store.add(b'dummy')
+>>> for _ in range(3):
+...     _ = store.get(obj_hash)
+>>> policy.stats
+IntegrityStats(checked=1, skipped=2, failed=0)
+"""
+
+import random
+import threading
+
+import attr
+
+from .store import IntegrityValidationError
+
+
+#: Check every retrieved object.
+CHECK_ALWAYS = 'always'
+#: Check each object once per process and store.
+CHECK_ONCE = 'once'
+#: Check a random sample of retrieved objects.
+CHECK_SAMPLED = 'sampled'
+#: Never check retrieved objects.
+CHECK_TRUSTED = 'trusted'
+
+#: Default maximum number of remembered verified hashes.
+DEFAULT_MAX_VERIFIED = 2**20
+
+
+@attr.s
+class IntegrityStats(object):
+    """Integrity check statistics.
+
+    :param checked: Number of objects hashed and found valid
+    :param skipped: Number of objects returned without hashing
+    :param failed: Number of objects that failed the check
+    """
+    checked = attr.ib(default=0)
+    skipped = attr.ib(default=0)
+    failed = attr.ib(default=0)
+
+    @property
+    def skip_rate(self):
+        """Ratio of skipped checks to all retrievals."""
+        retrievals = self.checked + self.skipped + self.failed
+        return self.skipped / retrievals if retrievals else 0.0
+
+
+class IntegrityPolicy(object):
+    """Policy for checking the integrity of retrieved objects.
+
+    :param mode: One of :py:data:`CHECK_ALWAYS`, :py:data:`CHECK_ONCE`,
+                 :py:data:`CHECK_SAMPLED`, :py:data:`CHECK_TRUSTED`
+    :param max_verified: Maximum number of verified hashes remembered in
+                         the :py:data:`CHECK_ONCE` mode. The oldest ones
+                         are forgotten first.
+    :param sample_rate: Fraction of objects checked in the
+                        :py:data:`CHECK_SAMPLED` mode
+    :param seed: Seed of the sampling
+
+    A policy can be shared by several stores. Verified hashes are then
+    remembered per store, so that an object verified in one store is still
+    checked when it is read from another one. Remembered hashes keep their
+    stores alive until they are forgotten.
+    """
+
+    def __init__(self, mode=CHECK_ALWAYS, max_verified=DEFAULT_MAX_VERIFIED,
+                 sample_rate=0.01, seed=None):
+        checks = {
+            CHECK_ALWAYS: self._check_always,
+            CHECK_ONCE: self._check_once,
+            CHECK_SAMPLED: self._check_sampled,
+            CHECK_TRUSTED: self._check_trusted,
+        }
+        if mode not in checks:
+            raise ValueError('Unknown integrity check mode: {}'.format(mode))
+        if max_verified < 1:
+            raise ValueError('At least one verified hash must be kept.')
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('Sample rate must be between 0 and 1.')
+        self.mode = mode
+        self.max_verified = max_verified
+        self.sample_rate = sample_rate
+        self.check = checks[mode]
+        self._verified = {}
+        self._random = random.Random(seed).random
+        self._lock = threading.Lock()
+        self._stats = IntegrityStats()
+
+    def check(self, obj_hash, serialized_obj, hash_object, store):
+        """Check a retrieved object according to the policy.
+
+        Replaced by the check of the policy's mode on construction.
+
+        :param obj_hash: Requested hash
+        :param serialized_obj: Retrieved object
+        :param hash_object: Hash function of the store
+        :param store: Store the object was retrieved from
+        :raises: :py:class:`hippiepug.store.IntegrityValidationError`
+        """
+        pass  # pragma: no cover
+
+    def _verify(self, obj_hash, serialized_obj, hash_object):
+        valid = obj_hash == hash_object(serialized_obj)
+        with self._lock:
+            if valid:
+                self._stats.checked += 1
+            else:
+                self._stats.failed += 1
+        if not valid:
+            raise IntegrityValidationError()
+
+    def _skip(self):
+        with self._lock:
+            self._stats.skipped += 1
+
+    def _check_always(self, obj_hash, serialized_obj, hash_object, store):
+        self._verify(obj_hash, serialized_obj, hash_object)
+
+    def _check_once(self, obj_hash, serialized_obj, hash_object, store):
+        verified = self._verified
+        key = (store, obj_hash)
+        if key in verified:
+            self._skip()
+            return
+        self._verify(obj_hash, serialized_obj, hash_object)
+        with self._lock:
+            if len(verified) >= self.max_verified:
+                # Dicts keep insertion order, so this is the oldest hash.
+                del verified[next(iter(verified))]
+            verified[key] = True
+
+    def _check_sampled(self, obj_hash, serialized_obj, hash_object, store):
+        if self._random() < self.sample_rate:
+            self._verify(obj_hash, serialized_obj, hash_object)
+        else:
+            self._skip()
+
+    def _check_trusted(self, obj_hash, serialized_obj, hash_object, store):
+        self._skip()
+
+    def forget(self):
+        """Forget all verified hashes, so that they are checked again."""
+        with self._lock:
+            self._verified.clear()
+
+    @property
+    def stats(self):
+        """Snapshot of integrity check statistics.
+
+        :rtype: :py:class:`IntegrityStats`
+        """
+        with self._lock:
+            return attr.evolve(self._stats)
+
+    def reset_stats(self):
+        """Reset integrity check statistics."""
+        with self._lock:
+            self._stats = IntegrityStats()
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '\'{self.mode}\')').format(self=self)
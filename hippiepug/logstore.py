@@ -0,0 +1,469 @@
+"""
+Persistent content-addressable store backed by an append-only log.
+
+Objects are appended to a log file as records::
+
+    | key type | key length | value length | CRC32 | key | value |
+
+An in-memory index maps hashes to the positions of values in the log. The
+index is saved next to the log when the store is closed, together with the
+size of the log it covers. When the store is opened, the index is loaded,
+and the rest of the log is scanned to recover the records written after
+it. A torn record at the end of the log, left by a crash in the middle of
+a write, is truncated.
+
+Values are read through a memory map of the log, and
+:py:meth:`LogStore.get_view` returns them without copying.
+
+The spec of the store's hasher is recorded in a file next to the log, so
+that the store is always reopened with the same hash function.
+"""
+
+import marshal
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from .hashing import HEX_HASHER, resolve_hasher
+from .store import BaseStore, Sha256DictStore
+
+
+#: Fsync the log after every write.
+SYNC_ALWAYS = 'always'
+#: Only fsync the log on :py:meth:`LogStore.sync` and
+#: :py:meth:`LogStore.close`.
+SYNC_NEVER = 'never'
+
+LOG_FILENAME = 'objects.log'
+INDEX_FILENAME = 'objects.idx'
+HASHER_FILENAME = 'hasher'
+
+_RECORD_HEADER = struct.Struct('>BHII')
+_STR_KEY = 0
+_BYTES_KEY = 1
+_INDEX_VERSION = 1
+
+
+def _encode_key(obj_hash):
+    """Serialize a hash for a log record."""
+    if isinstance(obj_hash, bytes):
+        return _BYTES_KEY, obj_hash
+    return _STR_KEY, obj_hash.encode('utf-8')
+
+
+def _decode_key(key_type, key_bytes):
+    """Deserialize a hash from a log record."""
+    if key_type == _BYTES_KEY:
+        return key_bytes
+    return key_bytes.decode('utf-8')
+
+
+def _fsync_dir(path):
+    """Make a rename in a directory durable, where supported."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # pragma: no cover
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # pragma: no cover
+        pass
+    finally:
+        os.close(fd)
+
+
+class LogStore(BaseStore):
+    """
+    Persistent store using, by default, truncated SHA256 hex-encoded
+    hashes, backed by an append-only log.
+
+    :param path: Directory of the store. Created if it does not exist.
+    :param sync: Fsync policy. Either :py:data:`SYNC_ALWAYS`,
+                 :py:data:`SYNC_NEVER`, or a number *n* to fsync after
+                 every *n* writes.
+    :param hasher: Hash function of a new store, e.g., for raw binary
+                   hashes. By default, truncated SHA256 hex-encoded hashes.
+                   An existing store is opened with its recorded hasher.
+    :type hasher: :py:class:`hippiepug.hashing.Hasher`
+    :param integrity: Policy for checking retrieved objects. By default,
+                      every retrieved object is checked.
+    :type integrity: :py:class:`hippiepug.integrity.IntegrityPolicy`
+    :param encoding: Encoder and decoder that chains and trees over this
+                     store use by default
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :raises: ``ValueError`` if ``hasher`` is not the recorded one
+
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> with LogStore(path) as store:
+    ...     obj_hash = store.add(b'dummy')
+    >>> with LogStore(path) as store:
+    ...     store.get(obj_hash) == b'dummy'
+    True
+    """
+
+    HASH_SIZE_BYTES = Sha256DictStore.HASH_SIZE_BYTES
+
+    def __init__(self, path, sync=SYNC_NEVER, hasher=None, integrity=None,
+                 encoding=None):
+        if not (sync in (SYNC_ALWAYS, SYNC_NEVER) or
+                (isinstance(sync, int) and sync > 0)):
+            raise ValueError('Unknown sync policy: {}'.format(sync))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.sync_policy = sync
+        self.integrity = integrity
+        self.encoding = encoding
+        self._log_path = os.path.join(path, LOG_FILENAME)
+        self._index_path = os.path.join(path, INDEX_FILENAME)
+        self.hasher = self._init_hasher(hasher)
+        self.hash_object = self.hasher
+        self._lock = threading.RLock()
+        self._index = {}
+        self._size = 0
+        self._unsynced_writes = 0
+        self._mmap = None
+        self._mapped_size = 0
+        self._log = None
+        self._open()
+
+    @classmethod
+    def hash_object(cls, serialized_obj):
+        """Return a SHA256 hex-encoded hash of a serialized object."""
+        return Sha256DictStore.hash_object(serialized_obj)
+
+    def _init_hasher(self, hasher):
+        """Resolve the hasher against the recorded one, and record it."""
+        hasher_path = os.path.join(self.path, HASHER_FILENAME)
+        try:
+            with open(hasher_path) as f:
+                recorded_spec = f.read().strip()
+        except FileNotFoundError:
+            recorded_spec = None
+            # Stores made before hashers were recorded use the default.
+            if os.path.exists(self._log_path) and \
+                    os.path.getsize(self._log_path) > 0:
+                recorded_spec = HEX_HASHER.spec
+
+        resolved = resolve_hasher(recorded_spec, hasher)
+        if not os.path.exists(hasher_path):
+            tmp_path = hasher_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(resolved.spec)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, hasher_path)
+            _fsync_dir(self.path)
+        return resolved
+
+    def _open(self):
+        """Open the log, and recover the index."""
+        self._log = open(self._log_path, 'ab')
+        log_size = os.path.getsize(self._log_path)
+        watermark = self._load_index(log_size)
+        self._size = self._scan(watermark, log_size)
+        if self._size < log_size:
+            # Truncate a torn record at the end of the log.
+            self._log.truncate(self._size)
+
+    def _load_index(self, log_size):
+        """Load the saved index.
+
+        :returns: Size of the log covered by the index, or 0 if there
+                  is no valid index.
+        """
+        self._index = {}
+        try:
+            with open(self._index_path, 'rb') as f:
+                data = f.read()
+            crc, = struct.unpack('>I', data[:4])
+            if zlib.crc32(data[4:]) != crc:
+                return 0
+            version, watermark, index = marshal.loads(data[4:])
+        except (OSError, ValueError, EOFError, TypeError, struct.error):
+            return 0
+        if version != _INDEX_VERSION or watermark > log_size:
+            return 0
+        self._index = index
+        return watermark
+
+    def _scan(self, offset, log_size):
+        """Index the records in the log starting at an offset.
+
+        :returns: End of the last intact record.
+        """
+        with open(self._log_path, 'rb') as f:
+            f.seek(offset)
+            while offset < log_size:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                key_type, key_length, value_length, crc = \
+                        _RECORD_HEADER.unpack(header)
+                key_bytes = f.read(key_length)
+                value = f.read(value_length)
+                if len(key_bytes) < key_length or \
+                        len(value) < value_length or \
+                        zlib.crc32(value, zlib.crc32(key_bytes)) != crc:
+                    break
+                value_offset = offset + _RECORD_HEADER.size + key_length
+                self._index[_decode_key(key_type, key_bytes)] = (
+                        value_offset, value_length)
+                offset = value_offset + value_length
+        return offset
+
+    def save_index(self):
+        """Save the index, so that the log need not be scanned on open.
+
+        Syncs the log first, so that the index never covers records that
+        are not durable.
+        """
+        with self._lock:
+            self.sync()
+            data = marshal.dumps((_INDEX_VERSION, self._size, self._index))
+            tmp_path = self._index_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack('>I', zlib.crc32(data)))
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._index_path)
+            _fsync_dir(self.path)
+
+    def sync(self):
+        """Flush the log, and fsync it to disk."""
+        with self._lock:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced_writes = 0
+
+    def _append(self, obj_hash, serialized_obj):
+        """Append a record to the log, and index it."""
+        key_type, key_bytes = _encode_key(obj_hash)
+        crc = zlib.crc32(serialized_obj, zlib.crc32(key_bytes))
+        self._log.write(_RECORD_HEADER.pack(
+                key_type, len(key_bytes), len(serialized_obj), crc))
+        self._log.write(key_bytes)
+        self._log.write(serialized_obj)
+
+        value_offset = self._size + _RECORD_HEADER.size + len(key_bytes)
+        self._index[obj_hash] = (value_offset, len(serialized_obj))
+        self._size = value_offset + len(serialized_obj)
+
+    def _apply_sync_policy(self, num_writes):
+        """Sync the log after a number of writes, if the policy says so."""
+        if num_writes == 0 or self.sync_policy == SYNC_NEVER:
+            return
+        if self.sync_policy == SYNC_ALWAYS:
+            self.sync()
+        else:
+            self._unsynced_writes += num_writes
+            if self._unsynced_writes >= self.sync_policy:
+                self.sync()
+
+    def _mapped(self, offset, length):
+        """Return the memory map of the log, remapping it if it does not
+        cover a value yet."""
+        with self._lock:
+            if offset + length > self._mapped_size:
+                self._log.flush()
+                # The old map is not closed, since views returned by
+                # get_view may still point into it. It is unmapped once
+                # the last of them is released.
+                with open(self._log_path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+                self._mapped_size = len(self._mmap)
+            return self._mmap
+
+    def _read(self, offset, length):
+        """Read a value from the log through the memory map."""
+        return self._mapped(offset, length)[offset:offset + length]
+
+    def _view(self, offset, length):
+        """Return a view of a value in the memory map of the log."""
+        return memoryview(self._mapped(offset, length))[
+                offset:offset + length]
+
+    def __contains__(self, obj_hash):
+        """Check if obj with a given hash is in the store."""
+        return obj_hash in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def contains_many(self, obj_hashes):
+        """Check whether the store contains objects with given hashes."""
+        index = self._index
+        return [obj_hash in index for obj_hash in obj_hashes]
+
+    def _get(self, obj_hash, check_integrity, read):
+        location = self._index.get(obj_hash)
+        if location is None:
+            return None
+        serialized_obj = read(*location)
+        if check_integrity:
+            self._check_integrity(obj_hash, serialized_obj)
+        return serialized_obj
+
+    def get(self, obj_hash, check_integrity=True):
+        """Get an object with a given hash from the store.
+
+        If the object does not exist, returns None.
+
+        :param obj_hash: ASCII hash of the object
+        :param check_integrity: Whether to check the hash of the retrieved
+                                object against the given hash.
+        """
+        return self._get(obj_hash, check_integrity, self._read)
+
+    def get_view(self, obj_hash, check_integrity=True):
+        """Get a view of an object with a given hash in the memory map.
+
+        The object is not copied. The view stays valid after the store is
+        closed or compacted, and keeps its part of the log mapped until it
+        is released.
+
+        :param obj_hash: ASCII hash of the object
+        :param check_integrity: Whether to check the hash of the retrieved
+                                object against the given hash.
+        """
+        return self._get(obj_hash, check_integrity, self._view)
+
+    def get_many(self, obj_hashes, check_integrity=True):
+        """Get many objects with given hashes from the store.
+
+        Values are read under a single lock acquisition, and the log is
+        remapped at most once.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :param check_integrity: Whether to check the hashes of the
+                                retrieved objects against the given hashes.
+        :returns: List of objects in the order of ``obj_hashes``, with
+                  ``None`` for objects that are not in the store.
+        """
+        with self._lock:
+            return [self.get(obj_hash, check_integrity=check_integrity)
+                    for obj_hash in obj_hashes]
+
+    def add(self, serialized_obj):
+        """Add an object to the store.
+
+        If an object with this hash already exists, silently does nothing.
+        """
+        return self.add_hashed(self.hash_object(serialized_obj),
+                               serialized_obj)
+
+    def add_hashed(self, obj_hash, serialized_obj):
+        """Add an object with a precomputed hash to the store.
+
+        The hash is trusted, and is not recomputed. A wrong hash will
+        be detected upon retrieval with integrity checks.
+        """
+        with self._lock:
+            if obj_hash not in self._index:
+                self._append(obj_hash, serialized_obj)
+                self._apply_sync_policy(1)
+        return obj_hash
+
+    def add_hashed_many(self, hashed_objs):
+        """Add many objects with precomputed hashes to the store.
+
+        The sync policy is applied once after the whole batch, e.g., with
+        :py:data:`SYNC_ALWAYS` the log is synced once rather than after
+        every object.
+        """
+        obj_hashes = []
+        num_writes = 0
+        with self._lock:
+            try:
+                for obj_hash, serialized_obj in hashed_objs:
+                    if obj_hash not in self._index:
+                        self._append(obj_hash, serialized_obj)
+                        num_writes += 1
+                    obj_hashes.append(obj_hash)
+            finally:
+                self._apply_sync_policy(num_writes)
+        return obj_hashes
+
+    def compact(self, live_hashes=None):
+        """Rewrite the log, keeping only the given objects.
+
+        :param live_hashes: Hashes of objects to keep, e.g., all the objects
+                            reachable from the chain heads and tree roots in
+                            use. If None, all objects are kept, and only
+                            the space taken by torn records is reclaimed.
+        """
+        with self._lock:
+            if live_hashes is None:
+                live_hashes = list(self._index)
+            tmp_path = self._log_path + '.compact'
+            index = {}
+            size = 0
+            with open(tmp_path, 'wb') as f:
+                for obj_hash in live_hashes:
+                    location = self._index.get(obj_hash)
+                    if location is None or obj_hash in index:
+                        continue
+                    serialized_obj = self._read(*location)
+                    key_type, key_bytes = _encode_key(obj_hash)
+                    crc = zlib.crc32(serialized_obj, zlib.crc32(key_bytes))
+                    f.write(_RECORD_HEADER.pack(
+                            key_type, len(key_bytes), len(serialized_obj),
+                            crc))
+                    f.write(key_bytes)
+                    f.write(serialized_obj)
+                    value_offset = size + _RECORD_HEADER.size + len(key_bytes)
+                    index[obj_hash] = (value_offset, len(serialized_obj))
+                    size = value_offset + len(serialized_obj)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._close_files()
+            # The saved index points into the old log. Remove it first, so
+            # that a crash before the new one is saved leads to a rescan.
+            try:
+                os.remove(self._index_path)
+            except FileNotFoundError:
+                pass
+            _fsync_dir(self.path)
+            os.replace(tmp_path, self._log_path)
+            _fsync_dir(self.path)
+            self._log = open(self._log_path, 'ab')
+            self._index = index
+            self._size = size
+            self.save_index()
+
+    def _close_files(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views are still exported. The map is closed when the
+                # last of them is released.
+                pass
+            self._mmap = None
+            self._mapped_size = 0
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def close(self):
+        """Sync the log, save the index, and close the files."""
+        with self._lock:
+            if self._log is None:
+                return
+            self.save_index()
+            self._close_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '\'{self.path}\')').format(self=self)
@@ -0,0 +1,374 @@
+"""
+Optional instrumentation of store accesses, hashing, encoding, and caching.
+
+Instrumentation works by wrapping the components a chain or a tree view
+uses: the object store, the cache, and the encoding parameters. Views that
+are not given wrapped components pay nothing for it.
+
+Every instrumented operation is recorded with its name and, for timed
+operations, its duration in seconds:
+
+* ``store.get``, ``store.get_many``, ``store.contains``, ``store.add``,
+  ``store.add_many``: store round trips,
+* ``store.miss``: objects that were not found in the store,
+* ``hash_object``: hashing, including the integrity checks on retrieval,
+* ``encode``, ``decode``: serialization,
+* ``cache.hit``, ``cache.miss``: cache lookups, not timed.
+
+Records are passed on to sinks: :py:class:`MemorySink` keeps counters and
+latency histograms, :py:class:`PrometheusSink` also renders them in the
+Prometheus text format, and :py:class:`CallbackSink` calls a function.
+
+>>> from .store import Sha256DictStore
+>>> from .tree import Tree, TreeBuilder
+>>> sink = MemorySink()
+>>> instrumentation = Instrumentation(sinks=[sink])
+>>> store = InstrumentedStore(Sha256DictStore(), instrumentation)
+>>> builder = TreeBuilder(store)
+>>> builder['foo'] = b'bar'
+>>> root = builder.commit().root
+>>> tree = Tree(store, root, cache=InstrumentedCache({}, instrumentation))
+>>> tree['foo']
+b'bar'
+>>> sink.counters['store.get'], sink.counters['cache.miss']
+(2, 1)
+"""
+
+import abc
+import threading
+import time
+
+from bisect import bisect_left
+
+import attr
+
+from .pack import EncodingParams
+from .store import BaseStore
+
+
+#: Default upper bounds of latency histogram buckets, in seconds.
+DEFAULT_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4,
+                   1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0)
+
+
+@attr.s
+class Histogram(object):
+    """Latency histogram.
+
+    :param buckets: Sorted upper bounds of the buckets, in seconds
+    :param counts: Number of observations in each bucket, not cumulative.
+                   The last count is for observations above all bounds.
+    :param total: Sum of all observations
+    """
+    buckets = attr.ib(default=DEFAULT_BUCKETS)
+    counts = attr.ib(default=None)
+    total = attr.ib(default=0.0)
+
+    def __attrs_post_init__(self):
+        if self.counts is None:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    @property
+    def count(self):
+        """Number of observations."""
+        return sum(self.counts)
+
+    def observe(self, seconds):
+        """Add an observation."""
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+
+
+class BaseSink(object):
+    """Abstract base class for a sink of instrumentation records."""
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def record(self, op, seconds=None):
+        """Record an operation.
+
+        :param op: Name of the operation
+        :param seconds: Duration, or None if the operation is not timed
+        """
+        pass  # pragma: no cover
+
+
+class CallbackSink(BaseSink):
+    """Sink calling a function with every record.
+
+    :param callback: Callable accepting ``(op, seconds)``
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, op, seconds=None):
+        self.callback(op, seconds)
+
+
+class MemorySink(BaseSink):
+    """Sink keeping counters and latency histograms in memory.
+
+    :param buckets: Upper bounds of the histogram buckets, in seconds
+
+    >>> sink = MemorySink()
+    >>> sink.record('store.get', 2e-6)
+    >>> sink.record('cache.hit')
+    >>> sink.counters
+    {'store.get': 1, 'cache.hit': 1}
+    >>> sink.histograms['store.get'].count
+    1
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, seconds=None):
+        with self._lock:
+            self.counters[op] = self.counters.get(op, 0) + 1
+            if seconds is not None:
+                histogram = self.histograms.get(op)
+                if histogram is None:
+                    histogram = Histogram(buckets=self.buckets)
+                    self.histograms[op] = histogram
+                histogram.observe(seconds)
+
+    def reset(self):
+        """Clear all counters and histograms."""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+class PrometheusSink(MemorySink):
+    """In-memory sink that can render its contents for Prometheus.
+
+    :param prefix: Prefix of the metric names
+
+    >>> sink = PrometheusSink()
+    >>> sink.record('cache.hit')
+    >>> print(sink.render())
+    # HELP hippiepug_operations_total Number of operations.
+    # TYPE hippiepug_operations_total counter
+    hippiepug_operations_total{op="cache.hit"} 1
+    # HELP hippiepug_operation_seconds Duration of operations.
+    # TYPE hippiepug_operation_seconds histogram
+    <BLANKLINE>
+    """
+
+    def __init__(self, prefix='hippiepug', buckets=DEFAULT_BUCKETS):
+        super(PrometheusSink, self).__init__(buckets=buckets)
+        self.prefix = prefix
+
+    def render(self):
+        """Render the counters and histograms in the Prometheus text
+        exposition format.
+
+        :returns: str
+        """
+        counter_name = '{}_operations_total'.format(self.prefix)
+        histogram_name = '{}_operation_seconds'.format(self.prefix)
+        with self._lock:
+            lines = [
+                '# HELP {} Number of operations.'.format(counter_name),
+                '# TYPE {} counter'.format(counter_name),
+            ]
+            for op, count in sorted(self.counters.items()):
+                lines.append('{}{{op="{}"}} {}'.format(
+                    counter_name, op, count))
+
+            lines.extend([
+                '# HELP {} Duration of operations.'.format(histogram_name),
+                '# TYPE {} histogram'.format(histogram_name),
+            ])
+            for op, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                bounds = [repr(b) for b in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{op="{}",le="{}"}} {}'.format(
+                        histogram_name, op, bound, cumulative))
+                lines.append('{}_sum{{op="{}"}} {!r}'.format(
+                    histogram_name, op, histogram.total))
+                lines.append('{}_count{{op="{}"}} {}'.format(
+                    histogram_name, op, cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation(object):
+    """Dispatcher of instrumentation records to sinks.
+
+    :param sinks: List of sinks
+    :type sinks: list of :py:class:`BaseSink`
+    :param clock: Function returning the current time in seconds
+    """
+
+    def __init__(self, sinks=None, clock=time.perf_counter):
+        self.sinks = list(sinks) if sinks is not None else []
+        self.clock = clock
+
+    def record(self, op, seconds=None):
+        """Pass a record on to all sinks."""
+        for sink in self.sinks:
+            sink.record(op, seconds)
+
+    def timed(self, op, func):
+        """Wrap a function, so that its calls are recorded as ``op``."""
+        clock = self.clock
+        record = self.record
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(op, clock() - start)
+
+        return timed_func
+
+    def encoding_params(self, params=None):
+        """Make encoding parameters with instrumented encoder and decoder.
+
+        :param params: Parameters to instrument. Defaults to the current
+                       default parameters.
+        :type params: :py:class:`hippiepug.pack.EncodingParams`
+        :rtype: :py:class:`hippiepug.pack.EncodingParams`
+
+        Use as ``with instrumentation.encoding_params().as_default():``
+        """
+        if params is None:
+            params = EncodingParams.get_default()
+        return EncodingParams(
+                encoder=self.timed('encode', params.encoder),
+                decoder=self.timed('decode', params.decoder))
+
+
+class InstrumentedStore(BaseStore):
+    """Store wrapper that records store round trips and hashing.
+
+    Integrity checks on retrieval are done by the wrapper, following the
+    integrity policy of the wrapped store, so that they are recorded as
+    ``hash_object``. Other attributes are passed through
+    to the wrapped store.
+
+    :param store: Wrapped store
+    :type store: :py:class:`hippiepug.store.BaseStore`
+    :param instrumentation: Instrumentation
+    :type instrumentation: :py:class:`Instrumentation`
+    """
+
+    def __init__(self, store, instrumentation):
+        self.store = store
+        self.instrumentation = instrumentation
+        self.hash_object = instrumentation.timed(
+                'hash_object', store.hash_object)
+        self._get = instrumentation.timed('store.get', store.get)
+        self._get_view = instrumentation.timed('store.get', store.get_view)
+        self._get_many = instrumentation.timed(
+                'store.get_many', store.get_many)
+        self._contains = instrumentation.timed(
+                'store.contains', store.__contains__)
+        self._contains_many = instrumentation.timed(
+                'store.contains', store.contains_many)
+        self._add_hashed = instrumentation.timed(
+                'store.add', store.add_hashed)
+        self._add_hashed_many = instrumentation.timed(
+                'store.add_many', store.add_hashed_many)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _check(self, obj_hash, serialized_obj, check_integrity):
+        if serialized_obj is None:
+            self.instrumentation.record('store.miss')
+        elif check_integrity:
+            self._check_integrity(obj_hash, serialized_obj, self.store)
+        return serialized_obj
+
+    def get(self, obj_hash, check_integrity=True):
+        serialized_obj = self._get(obj_hash, check_integrity=False)
+        return self._check(obj_hash, serialized_obj, check_integrity)
+
+    def get_view(self, obj_hash, check_integrity=True):
+        serialized_obj = self._get_view(obj_hash, check_integrity=False)
+        return self._check(obj_hash, serialized_obj, check_integrity)
+
+    def get_many(self, obj_hashes, check_integrity=True):
+        obj_hashes = list(obj_hashes)
+        serialized_objs = self._get_many(obj_hashes, check_integrity=False)
+        return [self._check(obj_hash, serialized_obj, check_integrity)
+                for obj_hash, serialized_obj
+                in zip(obj_hashes, serialized_objs)]
+
+    def __contains__(self, obj_hash):
+        return self._contains(obj_hash)
+
+    def contains_many(self, obj_hashes):
+        return self._contains_many(obj_hashes)
+
+    def add(self, serialized_obj):
+        return self._add_hashed(self.hash_object(serialized_obj),
+                                serialized_obj)
+
+    def add_hashed(self, obj_hash, serialized_obj):
+        return self._add_hashed(obj_hash, serialized_obj)
+
+    def add_many(self, serialized_objs):
+        serialized_objs = list(serialized_objs)
+        obj_hashes = [self.hash_object(serialized_obj)
+                      for serialized_obj in serialized_objs]
+        return self._add_hashed_many(list(zip(obj_hashes, serialized_objs)))
+
+    def add_hashed_many(self, hashed_objs):
+        return self._add_hashed_many(hashed_objs)
+
+    def transaction(self):
+        return self.store.transaction()
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '{self.store})').format(self=self)
+
+
+class InstrumentedCache(object):
+    """Cache wrapper that records cache hits and misses.
+
+    :param cache: Wrapped cache
+    :type cache: dict-like, e.g., :py:class:`hippiepug.cache.LRUCache`
+    :param instrumentation: Instrumentation
+    :type instrumentation: :py:class:`Instrumentation`
+    """
+
+    def __init__(self, cache, instrumentation):
+        self.cache = cache
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def get(self, key, default=None):
+        value = self.cache.get(key)
+        if value is None:
+            self.instrumentation.record('cache.miss')
+            return default
+        self.instrumentation.record('cache.hit')
+        return value
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
+
+    def __getitem__(self, key):
+        return self.cache[key]
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '{self.cache})').format(self=self)
@@ -0,0 +1,145 @@
+"""
+Migration of chains and trees between stores with different hashes.
+
+Blocks and nodes refer to each other by hashes, so moving a chain or a
+tree to a store with another hash function, e.g., from the default hex
+hashes to raw binary ones, means rewriting every block and node with the
+new hashes of the objects it refers to. The old store stays readable as it
+is, and can be dropped once the migrated heads and roots are in use.
+Objects are decoded with the codec of the source store, and encoded with
+that of the target store, so migration can also switch codecs.
+
+>>> from .chain import Chain, BlockBuilder
+>>> from .hashing import Hasher
+>>> from .store import Sha256DictStore, DictStore
+>>> chain = Chain(Sha256DictStore())
+>>> builder = BlockBuilder(chain)
+>>> for i in range(3):
+...     builder.payload = b'Block %d' % i
+...     block = builder.commit()
+>>> target = DictStore(hasher=Hasher(digest_size=32, binary=True))
+>>> head = migrate_chain(chain.object_store, chain.head, target)
+>>> Chain(target, head=head).get_block_by_index(1).payload
+b'Block 1'
+"""
+
+from .pack import encode, decode, resolve_codec
+from .struct import ChainBlock, TreeNode, TreeLeaf
+
+
+def _get(store, obj_hash):
+    serialized_obj = store.get(obj_hash)
+    if serialized_obj is None:
+        raise ValueError('Object not found: {}'.format(obj_hash))
+    return serialized_obj
+
+
+def migrate_chain(source, head, target, migrate_payload=None, memo=None,
+                  source_encoding=None, target_encoding=None):
+    """Copy a chain to another store, rewriting the fingers.
+
+    :param source: Store of the chain
+    :param head: Hash of the head block in ``source``
+    :param target: Store to copy the chain to
+    :param migrate_payload: Function rewriting a block payload, e.g., if
+                            payloads contain hashes of tree roots. By
+                            default, payloads are copied as they are.
+    :param memo: Dict mapping old hashes to new ones. Pass the same dict to
+                 migrate several heads of one chain without rewriting the
+                 shared blocks twice.
+    :param source_encoding: Decoder of the source. If not given, the one
+                            bound to the source store is used, or else
+                            the default.
+    :type source_encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :param target_encoding: Encoder of the target. If not given, the one
+                            bound to the target store is used, or else
+                            the default.
+    :type target_encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: Hash of the head block in ``target``
+    """
+    if memo is None:
+        memo = {}
+    if head is None:
+        return None
+    _, decoder = resolve_codec(source_encoding, source)
+    encoder, _ = resolve_codec(target_encoding, target)
+
+    # Collect the blocks that are not migrated yet, from the head down.
+    pending = []
+    block_hash = head
+    while block_hash is not None and block_hash not in memo:
+        block = decode(_get(source, block_hash), decoder)
+        pending.append((block_hash, block))
+        block_hash = block.fingers[0][1] if block.fingers else None
+
+    for block_hash, block in reversed(pending):
+        payload = block.payload
+        if migrate_payload is not None:
+            payload = migrate_payload(payload)
+        new_block = ChainBlock(
+                payload=payload, index=block.index,
+                fingers=[[index, memo[finger_hash]]
+                         for index, finger_hash in block.fingers])
+        memo[block_hash] = target.add(encode(new_block, encoder))
+    return memo[head]
+
+
+def migrate_tree(source, root, target, memo=None, source_encoding=None,
+                 target_encoding=None):
+    """Copy a tree and its values to another store, rewriting the hashes.
+
+    :param source: Store of the tree
+    :param root: Hash of the root node in ``source``
+    :param target: Store to copy the tree to
+    :param memo: Dict mapping old hashes to new ones. Pass the same dict to
+                 migrate several versions of a tree without rewriting the
+                 shared nodes twice.
+    :param source_encoding: Decoder of the source. If not given, the one
+                            bound to the source store is used, or else
+                            the default.
+    :type source_encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :param target_encoding: Encoder of the target. If not given, the one
+                            bound to the target store is used, or else
+                            the default.
+    :type target_encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: Hash of the root node in ``target``
+    """
+    if memo is None:
+        memo = {}
+    if root is None:
+        return None
+    _, decoder = resolve_codec(source_encoding, source)
+    encoder, _ = resolve_codec(target_encoding, target)
+
+    # Post-order traversal, so that children are migrated before parents.
+    stack = [(root, False)]
+    while stack:
+        node_hash, children_done = stack.pop()
+        if node_hash is None or node_hash in memo:
+            continue
+        node = decode(_get(source, node_hash), decoder)
+
+        if isinstance(node, TreeLeaf):
+            payload_hash = node.payload_hash
+            if payload_hash not in memo:
+                memo[payload_hash] = target.add(_get(source, payload_hash))
+            new_node = TreeLeaf(lookup_key=node.lookup_key,
+                                payload_hash=memo[payload_hash])
+
+        elif isinstance(node, TreeNode):
+            if not children_done:
+                stack.append((node_hash, True))
+                stack.append((node.right_hash, False))
+                stack.append((node.left_hash, False))
+                continue
+            new_node = TreeNode(
+                    pivot_prefix=node.pivot_prefix,
+                    left_hash=memo.get(node.left_hash),
+                    right_hash=memo.get(node.right_hash))
+
+        else:
+            raise ValueError('Object is not a tree node: {}'.format(
+                node_hash))
+
+        memo[node_hash] = target.add(encode(new_node, encoder))
+    return memo[root]
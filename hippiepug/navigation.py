@@ -0,0 +1,110 @@
+"""
+Arithmetic navigation of skipchain fingers.
+
+The fingers of a block are fully determined by its index. Block ``n > 0``
+points to its predecessor ``n - 1``, and to the indices obtained by
+clearing the set bits of ``n - 1`` one by one, from the lowest, down to
+zero. The fingers are stored in this order, so the finger towards a given
+index is always at the same slot of the block.
+
+This module computes the finger indices, the next hop towards a target
+index, and the whole lookup path, without looking at the blocks.
+
+>>> finger_indices(13)
+(12, 8, 0)
+>>> next_hop(13, 5)
+(8, 1)
+>>> lookup_path(13, 5)
+[13, 8, 6, 5]
+"""
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+def _check_indices(from_index, to_index):
+    if not (0 <= to_index < from_index):
+        raise ValueError(
+            'Cannot navigate from block {} to block {}.'.format(
+                from_index, to_index))
+
+
+def finger_indices(index):
+    """Finger indices of a block, in the order of its fingers.
+
+    :param int>=0 index: Block index
+    :returns: Tuple of indices, empty for the first block
+    """
+    fingers = []
+    if index > 0:
+        current = index - 1
+        fingers.append(current)
+        while current:
+            current &= current - 1
+            fingers.append(current)
+    return tuple(fingers)
+
+
+def finger_slot(index, finger_index):
+    """Position of a finger in a block.
+
+    :param int>=0 index: Block index
+    :param finger_index: Index of the block the finger points to
+    :returns: Slot of the finger in the fingers of the block
+    :raises: ``ValueError`` if the block has no such finger.
+    """
+    predecessor = index - 1
+    cleared = predecessor ^ finger_index
+    # The finger must be the predecessor with some low set bits cleared.
+    if (index <= 0 or finger_index < 0 or cleared & finger_index
+            or (finger_index and cleared >= finger_index & -finger_index)):
+        raise ValueError('Block {} has no finger to block {}.'.format(
+            index, finger_index))
+    return _popcount(cleared)
+
+
+def next_hop(from_index, to_index):
+    """Optimal hop from one block towards another.
+
+    The hop is to the block with the smallest index among the fingers
+    that do not jump beyond the target.
+
+    :param from_index: Index of the current block
+    :param to_index: Index of the target block, smaller than ``from_index``
+    :returns: A tuple with the index of the next block, and the slot of
+              its finger in the current block
+    :raises: ``ValueError`` if the target is not before the current block.
+    """
+    _check_indices(from_index, to_index)
+    predecessor = from_index - 1
+    if predecessor == to_index:
+        return predecessor, 0
+    # Fingers agree with the predecessor above its highest bit that
+    # differs from the target. Clearing that bit jumps beyond the target,
+    # unless the target has no lower bits set.
+    top_bit = 1 << ((predecessor ^ to_index).bit_length() - 1)
+    if to_index & (top_bit - 1):
+        hop_index = predecessor & -top_bit
+    else:
+        hop_index = to_index
+    return hop_index, _popcount(predecessor ^ hop_index)
+
+
+def lookup_path(from_index, to_index):
+    """Indices of all blocks on the walk from one block to another.
+
+    :param from_index: Index of the first block
+    :param to_index: Index of the target block, at most ``from_index``
+    :returns: List of indices, from ``from_index`` to ``to_index``
+    :raises: ``ValueError`` if the target is after the first block.
+    """
+    if from_index == to_index >= 0:
+        return [from_index]
+    _check_indices(from_index, to_index)
+    path = [from_index]
+    current = from_index
+    while current != to_index:
+        current, _ = next_hop(current, to_index)
+        path.append(current)
+    return path
@@ -0,0 +1,343 @@
+"""
+Persistent content-addressable store backed by SQLite.
+
+Objects are kept in a single table keyed by the raw bytes of their hashes.
+The database runs in WAL mode, so that readers do not block the writer.
+Each thread gets its own connection, and each connection keeps its
+statements prepared between calls.
+
+Writes that come in a batch are done in one transaction, and so is a whole
+:py:meth:`hippiepug.tree.TreeBuilder.commit`, even though it puts its
+objects into the store in several batches.
+To group several writes of your own, e.g., many
+:py:meth:`hippiepug.chain.BlockBuilder.commit` calls, use
+:py:meth:`SqliteStore.transaction`.
+
+The store can also keep named references to objects, like the latest chain
+head or tree root, so that they can be found again after a restart.
+
+The spec of the store's hasher is recorded in the database, so that the
+store is always reopened with the same hash function.
+"""
+
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+from .hashing import HEX_HASHER, resolve_hasher
+from .store import BaseStore, Sha256DictStore
+
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS objects ('
+    '    hash BLOB PRIMARY KEY,'
+    '    value BLOB NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS refs ('
+    '    name TEXT PRIMARY KEY,'
+    '    hash BLOB NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS meta ('
+    '    key TEXT PRIMARY KEY,'
+    '    value TEXT NOT NULL'
+    ') WITHOUT ROWID',
+)
+
+_GET = 'SELECT value FROM objects WHERE hash = ?'
+_CONTAINS = 'SELECT 1 FROM objects WHERE hash = ?'
+_GET_MANY = 'SELECT hash, value FROM objects WHERE hash IN ({})'
+_CONTAINS_MANY = 'SELECT hash FROM objects WHERE hash IN ({})'
+_ADD = 'INSERT OR IGNORE INTO objects (hash, value) VALUES (?, ?)'
+_COUNT = 'SELECT COUNT(*) FROM objects'
+_GET_REF = 'SELECT hash FROM refs WHERE name = ?'
+_SET_REF = 'INSERT OR REPLACE INTO refs (name, hash) VALUES (?, ?)'
+_DELETE_REF = 'DELETE FROM refs WHERE name = ?'
+_ALL_REFS = 'SELECT name, hash FROM refs'
+_GET_META = 'SELECT value FROM meta WHERE key = ?'
+_SET_META = 'INSERT INTO meta (key, value) VALUES (?, ?)'
+_ANY_OBJECT = 'SELECT 1 FROM objects LIMIT 1'
+
+#: Maximum number of hashes in a single batched query. Stays below the
+#: default limit on the number of SQLite host parameters.
+BATCH_SIZE = 500
+
+#: Number of prepared statements kept by each connection.
+STATEMENT_CACHE_SIZE = 256
+
+
+def _chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+class SqliteStore(BaseStore):
+    """
+    Persistent store using, by default, truncated SHA256 hex-encoded
+    hashes, backed by an SQLite database.
+
+    :param path: Path to the database file. Created if it does not exist.
+    :param synchronous: Value of the SQLite ``synchronous`` pragma.
+                        ``'NORMAL'`` is durable against process crashes,
+                        and, in WAL mode, keeps the database consistent
+                        on power loss. Use ``'FULL'`` to also make every
+                        transaction durable on power loss.
+    :param hasher: Hash function of a new store, e.g., for raw binary
+                   hashes. By default, truncated SHA256 hex-encoded hashes.
+                   An existing store is opened with its recorded hasher.
+    :type hasher: :py:class:`hippiepug.hashing.Hasher`
+    :param integrity: Policy for checking retrieved objects. By default,
+                      every retrieved object is checked.
+    :type integrity: :py:class:`hippiepug.integrity.IntegrityPolicy`
+    :param encoding: Encoder and decoder that chains and trees over this
+                     store use by default
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :raises: ``ValueError`` if ``hasher`` is not the recorded one
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'objects.db')
+    >>> with SqliteStore(path) as store:
+    ...     obj_hash = store.add(b'dummy')
+    ...     store.set_ref('latest', obj_hash)
+    >>> with SqliteStore(path) as store:
+    ...     store.get(store.get_ref('latest')) == b'dummy'
+    True
+    """
+
+    HASH_SIZE_BYTES = Sha256DictStore.HASH_SIZE_BYTES
+
+    def __init__(self, path, synchronous='NORMAL', hasher=None,
+                 integrity=None, encoding=None):
+        self.path = path
+        self.synchronous = synchronous
+        self.integrity = integrity
+        self.encoding = encoding
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        conn = self._conn
+        try:
+            with self.transaction():
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                self.hasher = self._init_hasher(hasher)
+        except BaseException:
+            self.close()
+            raise
+        self.hash_object = self.hasher
+
+    @classmethod
+    def hash_object(cls, serialized_obj):
+        """Return a SHA256 hex-encoded hash of a serialized object."""
+        return Sha256DictStore.hash_object(serialized_obj)
+
+    def _init_hasher(self, hasher):
+        """Resolve the hasher against the recorded one, and record it."""
+        conn = self._conn
+        row = conn.execute(_GET_META, ('hasher',)).fetchone()
+        if row is not None:
+            return resolve_hasher(row[0], hasher)
+        # Stores made before hashers were recorded use the default.
+        legacy = conn.execute(_ANY_OBJECT).fetchone() is not None
+        resolved = resolve_hasher(HEX_HASHER.spec if legacy else None,
+                                  hasher)
+        conn.execute(_SET_META, ('hasher', resolved.spec))
+        return resolved
+
+    @property
+    def _conn(self):
+        """Connection of the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Transactions are managed explicitly. Each connection is only
+            # used by its own thread, but may be closed from any thread.
+            conn = sqlite3.connect(self.path, isolation_level=None,
+                                   check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous={}'.format(self.synchronous))
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Group the writes of the current thread into one transaction.
+
+        Transactions can be nested, in which case only the outermost one
+        is committed. If an exception is raised, the outermost transaction
+        is rolled back.
+
+        >>> import os, tempfile
+        >>> store = SqliteStore(os.path.join(tempfile.mkdtemp(), 'db'))
+        >>> with store.transaction():
+        ...     hashes = [store.add(b'obj %d' % i) for i in range(3)]
+        >>> len(store)
+        3
+        """
+        conn = self._conn
+        if self._local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        else:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute('COMMIT')
+
+    def _key(self, obj_hash):
+        """Convert a hash to a compact key.
+
+        :returns: Raw hash bytes, or None if the hash is malformed.
+        """
+        try:
+            return self.hasher.to_bytes(obj_hash)
+        except ValueError:
+            return None
+
+    def __contains__(self, obj_hash):
+        """Check if obj with a given hash is in the store."""
+        key = self._key(obj_hash)
+        if key is None:
+            return False
+        return self._conn.execute(_CONTAINS, (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute(_COUNT).fetchone()[0]
+
+    def contains_many(self, obj_hashes):
+        """Check if objs with given hashes are in the store.
+
+        Issues one query per :py:data:`BATCH_SIZE` hashes.
+        """
+        keys = [self._key(obj_hash) for obj_hash in obj_hashes]
+        present = set()
+        valid_keys = [key for key in keys if key is not None]
+        for chunk in _chunks(valid_keys, BATCH_SIZE):
+            query = _CONTAINS_MANY.format(', '.join('?' * len(chunk)))
+            present.update(bytes(row[0])
+                           for row in self._conn.execute(query, chunk))
+        return [key is not None and key in present for key in keys]
+
+    def _check(self, obj_hash, serialized_obj, check_integrity):
+        if serialized_obj is not None:
+            serialized_obj = bytes(serialized_obj)
+            if check_integrity:
+                self._check_integrity(obj_hash, serialized_obj)
+        return serialized_obj
+
+    def get(self, obj_hash, check_integrity=True):
+        """Get an object with a given hash from the store.
+
+        If the object does not exist, returns None.
+
+        :param obj_hash: ASCII hash of the object
+        :param check_integrity: Whether to check the hash of the retrieved
+                                object against the given hash.
+        """
+        key = self._key(obj_hash)
+        if key is None:
+            return None
+        row = self._conn.execute(_GET, (key,)).fetchone()
+        serialized_obj = row[0] if row is not None else None
+        return self._check(obj_hash, serialized_obj, check_integrity)
+
+    def get_many(self, obj_hashes, check_integrity=True):
+        """Get many objects with given hashes from the store.
+
+        Issues one query per :py:data:`BATCH_SIZE` hashes.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :param check_integrity: Whether to check the hashes of the
+                                retrieved objects against the given hashes.
+        :returns: List of objects in the order of ``obj_hashes``, with
+                  ``None`` for objects that are not in the store.
+        """
+        obj_hashes = list(obj_hashes)
+        keys = [self._key(obj_hash) for obj_hash in obj_hashes]
+        found = {}
+        valid_keys = list(set(key for key in keys if key is not None))
+        for chunk in _chunks(valid_keys, BATCH_SIZE):
+            query = _GET_MANY.format(', '.join('?' * len(chunk)))
+            found.update((bytes(key), value)
+                         for key, value in self._conn.execute(query, chunk))
+        return [self._check(obj_hash, found.get(key), check_integrity)
+                for obj_hash, key in zip(obj_hashes, keys)]
+
+    def add(self, serialized_obj):
+        """Add an object to the store.
+
+        If an object with this hash already exists, silently does nothing.
+        """
+        return self.add_hashed(self.hash_object(serialized_obj),
+                               serialized_obj)
+
+    def _key_for_write(self, obj_hash):
+        return self.hasher.to_bytes(obj_hash)
+
+    def add_hashed(self, obj_hash, serialized_obj):
+        """Add an object with a precomputed hash to the store.
+
+        The hash is trusted, and is not recomputed. A wrong hash will
+        be detected upon retrieval with integrity checks.
+        """
+        self._conn.execute(_ADD, (self._key_for_write(obj_hash),
+                                  serialized_obj))
+        return obj_hash
+
+    def add_hashed_many(self, hashed_objs):
+        """Add many objects with precomputed hashes in one transaction."""
+        hashed_objs = list(hashed_objs)
+        rows = [(self._key_for_write(obj_hash), serialized_obj)
+                for obj_hash, serialized_obj in hashed_objs]
+        with self.transaction():
+            self._conn.executemany(_ADD, rows)
+        return [obj_hash for obj_hash, _ in hashed_objs]
+
+    def get_ref(self, name):
+        """Return the hash a named reference points to, or None."""
+        row = self._conn.execute(_GET_REF, (name,)).fetchone()
+        if row is not None:
+            return self.hasher.from_bytes(row[0])
+
+    def set_ref(self, name, obj_hash):
+        """Point a named reference to a hash, e.g., of a chain head."""
+        self._conn.execute(_SET_REF, (name, self._key_for_write(obj_hash)))
+
+    def delete_ref(self, name):
+        """Remove a named reference, if it exists."""
+        self._conn.execute(_DELETE_REF, (name,))
+
+    def refs(self):
+        """Return all named references.
+
+        :returns: dict mapping names to hashes
+        """
+        return {name: self.hasher.from_bytes(key)
+                for name, key in self._conn.execute(_ALL_REFS)}
+
+    def close(self):
+        """Close the connections of all threads."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '\'{self.path}\')').format(self=self)
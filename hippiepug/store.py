@@ -1,8 +1,11 @@
 import abc
 from binascii import hexlify
+from contextlib import contextmanager
 
 from hashlib import sha256
 
+from .hashing import HEX_HASHER
+
 
 class BaseStore(object):
     """Abstract base class for a content-addresable store."""
@@ -34,6 +37,75 @@ class BaseStore(object):
         """
         pass  # pragma: no cover
 
+    def get_view(self, obj_hash, check_integrity=True):
+        """Return the object by its ASCII hash value as a ``memoryview``.
+
+        The default implementation wraps the result of :py:meth:`get`.
+        Stores that own the buffers of their objects, e.g., a memory map,
+        should override this to return views without copying.
+
+        :param obj_hash: ASCII hash
+        :param check_integrity: Whether to check the hash upon retrieval
+        """
+        serialized_obj = self.get(obj_hash, check_integrity=check_integrity)
+        if serialized_obj is not None:
+            return memoryview(serialized_obj)
+
+    def get_many(self, obj_hashes, check_integrity=True):
+        """Return many objects by their ASCII hash values.
+
+        The default implementation calls :py:meth:`get` for each hash.
+        Stores with a costly round-trip should override this.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :param check_integrity: Whether to check the hashes upon retrieval
+        :returns: List of objects in the order of ``obj_hashes``, with
+                  ``None`` for objects that are not in the store.
+        """
+        return [self.get(obj_hash, check_integrity=check_integrity)
+                for obj_hash in obj_hashes]
+
+    def contains_many(self, obj_hashes):
+        """Check whether the store contains objects with given hashes.
+
+        The default implementation checks each hash with ``in``.
+
+        :param obj_hashes: Iterable of ASCII hashes
+        :returns: List of bools in the order of ``obj_hashes``
+        """
+        return [obj_hash in self for obj_hash in obj_hashes]
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one transaction.
+
+        Writers that put many objects into the store, like
+        :py:meth:`hippiepug.tree.TreeBuilder.commit`, do it within a
+        transaction. Stores without transactions write each object right
+        away, and the default implementation does nothing.
+        """
+        yield
+
+    def _check_integrity(self, obj_hash, serialized_obj, store=None):
+        """Check a retrieved object against the requested hash.
+
+        Follows the integrity policy of the store, if it has one, and
+        otherwise hashes the object.
+
+        :param obj_hash: Requested hash
+        :param serialized_obj: Retrieved object
+        :param store: Store the object was retrieved from, whose policy
+                      applies. By default, this store.
+        :raises: :py:class:`IntegrityValidationError`
+        """
+        if store is None:
+            store = self
+        integrity = getattr(store, 'integrity', None)
+        if integrity is not None:
+            integrity.check(obj_hash, serialized_obj, self.hash_object, store)
+        elif obj_hash != self.hash_object(serialized_obj):
+            raise IntegrityValidationError()
+
     @abc.abstractmethod
     def add(self, serialized_obj):
         """
@@ -44,6 +116,47 @@ class BaseStore(object):
         """
         pass  # pragma: no cover
 
+    def add_hashed(self, obj_hash, serialized_obj):
+        """Put the object with an already computed hash in the store.
+
+        Builders that need the hash of an object anyway (e.g., to link it
+        from a parent node) can use this to avoid hashing it twice. The
+        default implementation simply calls :py:meth:`add`.
+
+        :param obj_hash: ASCII hash, as returned by :py:meth:`hash_object`
+        :param serialized_obj: Object, serialized to bytes
+        :return: Hash of the object.
+        """
+        return self.add(serialized_obj)
+
+    def add_many(self, serialized_objs):
+        """Put many objects in the store.
+
+        Hashes the objects, and passes them on to
+        :py:meth:`add_hashed_many`.
+
+        :param serialized_objs: Iterable of objects, serialized to bytes
+        :return: List of hashes of the objects.
+        """
+        serialized_objs = list(serialized_objs)
+        obj_hashes = [self.hash_object(serialized_obj)
+                      for serialized_obj in serialized_objs]
+        self.add_hashed_many(zip(obj_hashes, serialized_objs))
+        return obj_hashes
+
+    def add_hashed_many(self, hashed_objs):
+        """Put many objects with already computed hashes in the store.
+
+        The default implementation calls :py:meth:`add_hashed` for each
+        object. Stores with a costly round-trip should override this.
+
+        :param hashed_objs: Iterable of ``(obj_hash, serialized_obj)``
+                            pairs
+        :return: List of hashes of the objects.
+        """
+        return [self.add_hashed(obj_hash, serialized_obj)
+                for obj_hash, serialized_obj in hashed_objs]
+
 
 class IntegrityValidationError(Exception):
     pass
@@ -55,16 +168,29 @@ class BaseDictStore(BaseStore):
 
     :param backend: Backend
     :type backend: dict-like
+    :param integrity: Policy for checking retrieved objects. By default,
+                      every retrieved object is checked.
+    :type integrity: :py:class:`hippiepug.integrity.IntegrityPolicy`
+    :param encoding: Encoder and decoder that chains and trees over this
+                     store use by default
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
     """
 
-    def __init__(self, backend=None):
+    def __init__(self, backend=None, integrity=None, encoding=None):
         if backend is None:
             backend = {}
         self._backend = backend
+        self.integrity = integrity
+        self.encoding = encoding
 
     def __contains__(self, obj_hash):
         """Check if obj with a given hash is in the store."""
-        return self.get(obj_hash, check_integrity=False) is not None
+        return self._backend.get(obj_hash) is not None
+
+    def contains_many(self, obj_hashes):
+        """Check if objs with given hashes are in the store."""
+        backend = self._backend
+        return [backend.get(obj_hash) is not None for obj_hash in obj_hashes]
 
     def get(self, obj_hash, check_integrity=True):
         """Get an object with a given hash from the store.
@@ -77,8 +203,7 @@ class BaseDictStore(BaseStore):
         """
         serialized_obj = self._backend.get(obj_hash)
         if serialized_obj is not None and check_integrity:
-            if obj_hash != self.hash_object(serialized_obj):
-                raise IntegrityValidationError()
+            self._check_integrity(obj_hash, serialized_obj)
         return serialized_obj
 
     def add(self, serialized_obj):
@@ -86,8 +211,16 @@ class BaseDictStore(BaseStore):
 
         If an object with this hash already exists, silently does nothing.
         """
-        obj_hash = self.hash_object(serialized_obj)
-        if not obj_hash in self:
+        return self.add_hashed(self.hash_object(serialized_obj),
+                               serialized_obj)
+
+    def add_hashed(self, obj_hash, serialized_obj):
+        """Add an object with a precomputed hash to the store.
+
+        The hash is trusted, and is not recomputed. A wrong hash will
+        be detected upon retrieval with integrity checks.
+        """
+        if self._backend.get(obj_hash) is None:
             self._backend[obj_hash] = serialized_obj
         return obj_hash
 
@@ -115,8 +248,43 @@ class Sha256DictStore(BaseDictStore):
 
     HASH_SIZE_BYTES = 8
 
+    @classmethod
     def hash_object(cls, serialized_obj):
         """Return a SHA256 hex-encoded hash of a serialized object."""
         hash_bytes = sha256(serialized_obj).digest()
         hexdigest = hexlify(hash_bytes[:Sha256DictStore.HASH_SIZE_BYTES])
         return hexdigest.decode('utf-8')
+
+
+class DictStore(BaseDictStore):
+    """
+    Dict-based store with a configurable hash function.
+
+    :param backend: Backend
+    :type backend: dict-like
+    :param hasher: Hash function. By default, the same truncated SHA256
+                   hex-encoded hashes as :py:class:`Sha256DictStore`.
+    :type hasher: :py:class:`hippiepug.hashing.Hasher`
+    :param integrity: Policy for checking retrieved objects
+    :type integrity: :py:class:`hippiepug.integrity.IntegrityPolicy`
+    :param encoding: Encoder and decoder that chains and trees over this
+                     store use by default
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+
+    >>> from hippiepug.hashing import Hasher
+    >>> store = DictStore(hasher=Hasher(digest_size=32, binary=True))
+    >>> obj_hash = store.add(b'dummy')
+    >>> len(obj_hash)
+    32
+    >>> store.get(obj_hash) == b'dummy'
+    True
+    """
+
+    def __init__(self, backend=None, hasher=HEX_HASHER, integrity=None,
+                 encoding=None):
+        super(DictStore, self).__init__(backend, integrity=integrity,
+                                        encoding=encoding)
+        self.hasher = hasher
+        # Kept as an attribute rather than a method, so that the hash
+        # function can be sent to worker processes without the store.
+        self.hash_object = hasher
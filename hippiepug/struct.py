@@ -1,11 +1,100 @@
 """
 Basic building blocks.
+
+Blocks and nodes are slotted, so that they carry no per-instance
+``__dict__``. For large caches, there are also frozen variants,
+:py:class:`FrozenChainBlock`, :py:class:`FrozenTreeNode`, and
+:py:class:`FrozenTreeLeaf`, which keep block fingers in the compact
+:py:class:`Fingers` representation. The frozen variants are equal to the
+mutable structures with the same fields, and serialize to the same bytes.
 """
 
+import sys
+
+from array import array
+
 import attr
 
 
-@attr.s
+class Fingers(object):
+    """Compact immutable sequence of skipchain fingers.
+
+    Keeps the indices in an integer array, and the hashes in a tuple,
+    instead of a list of two-element lists. Iterating yields
+    ``(index, hash)`` pairs. Compares equal to a list of the same pairs.
+
+    :param fingers: Iterable of ``(index, hash)`` pairs
+
+    >>> fingers = Fingers([[1, 'abc'], [0, 'def']])
+    >>> fingers[0]
+    (1, 'abc')
+    >>> fingers == [[1, 'abc'], [0, 'def']]
+    True
+    >>> Fingers.from_columns([1, 0], ('abc', 'def')) == fingers
+    True
+    """
+    __slots__ = ['indices', 'hashes']
+
+    def __init__(self, fingers=()):
+        if isinstance(fingers, Fingers):
+            self.indices, self.hashes = fingers.indices, fingers.hashes
+            return
+        fingers = list(fingers)
+        self.indices = array('q', [index for index, _ in fingers])
+        self.hashes = tuple(obj_hash for _, obj_hash in fingers)
+
+    @classmethod
+    def from_columns(cls, indices, hashes):
+        """Build fingers from their indices and their hashes, without
+        pairing them up.
+
+        :param indices: Sequence of indices
+        :param tuple hashes: Hashes, in the same order
+        """
+        fingers = cls.__new__(cls)
+        fingers.indices = array('q', indices)
+        fingers.hashes = hashes
+        return fingers
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        return zip(self.indices, self.hashes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Fingers(list(self)[i])
+        return self.indices[i], self.hashes[i]
+
+    def __eq__(self, other):
+        if isinstance(other, Fingers):
+            return (self.indices == other.indices and
+                    self.hashes == other.hashes)
+        try:
+            return list(self) == [tuple(finger) for finger in other]
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.indices.tobytes(), self.hashes))
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self.indices) +
+                sys.getsizeof(self.hashes))
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '{fingers})').format(self=self, fingers=list(self))
+
+
+@attr.s(slots=True)
 class ChainBlock(object):
     """Skipchain block.
 
@@ -19,7 +108,7 @@ class ChainBlock(object):
     fingers = attr.ib(default=attr.Factory(list))
 
 
-@attr.s
+@attr.s(slots=True)
 class TreeNode(object):
     """Merkle tree intermediate node.
 
@@ -33,7 +122,7 @@ class TreeNode(object):
     right_hash = attr.ib(default=None)
 
 
-@attr.s
+@attr.s(slots=True)
 class TreeLeaf(object):
     """Merkle tree leaf.
 
@@ -43,3 +132,99 @@ class TreeLeaf(object):
 
     lookup_key = attr.ib(default=None)
     payload_hash = attr.ib(default=None)
+
+
+class _Frozen(object):
+    """Equality of frozen structures with their mutable counterparts.
+
+    The mutable structure has to be the last base class.
+    """
+    __slots__ = []
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__.__bases__[-1]):
+            return NotImplemented
+        return (attr.astuple(self, recurse=False) ==
+                attr.astuple(other, recurse=False))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(attr.astuple(self, recurse=False))
+
+
+@attr.s(slots=True, frozen=True, eq=False)
+class FrozenChainBlock(_Frozen, ChainBlock):
+    """Immutable skipchain block with compact fingers.
+
+    >>> block = FrozenChainBlock(b'payload', index=1, fingers=[[0, 'abc']])
+    >>> block == ChainBlock(b'payload', index=1, fingers=[[0, 'abc']])
+    True
+    """
+
+    fingers = attr.ib(default=(), converter=Fingers)
+
+
+@attr.s(slots=True, frozen=True, eq=False)
+class FrozenTreeNode(_Frozen, TreeNode):
+    """Immutable Merkle tree intermediate node."""
+
+
+@attr.s(slots=True, frozen=True, eq=False)
+class FrozenTreeLeaf(_Frozen, TreeLeaf):
+    """Immutable Merkle tree leaf."""
+
+
+def freeze(obj):
+    """Return the frozen variant of a block or a node.
+
+    Other objects are returned as is.
+    """
+    frozen_class = _FROZEN_CLASSES.get(obj.__class__)
+    if frozen_class is None:
+        return obj
+    return frozen_class(*attr.astuple(obj, recurse=False))
+
+
+_FROZEN_CLASSES = {
+    ChainBlock: FrozenChainBlock,
+    TreeNode: FrozenTreeNode,
+    TreeLeaf: FrozenTreeLeaf,
+}
+
+
+@attr.s
+class MultiProof(object):
+    """Proof of inclusion of many blocks or tree nodes at once.
+
+    Contains every block or node needed to verify the inclusion once.
+    Blocks and nodes refer to each other by hashes, so they are kept
+    serialized, exactly as they were hashed.
+
+    :param nodes: Serialized blocks or nodes
+    """
+
+    nodes = attr.ib(default=attr.Factory(list))
+
+
+@attr.s
+class VerificationResult(object):
+    """Result of a proof verification.
+
+    Evaluates to True if and only if the verification succeeded.
+
+    :param valid: Whether the verification succeeded
+    :param reason: Why the verification failed
+    """
+
+    valid = attr.ib()
+    reason = attr.ib(default=None)
+
+    def __bool__(self):
+        return self.valid
+
+    __nonzero__ = __bool__
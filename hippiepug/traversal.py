@@ -0,0 +1,165 @@
+"""
+Traversal logic shared by the synchronous and asynchronous views.
+
+Chain and tree traversals are written as generators that do no I/O by
+themselves. Whenever a traversal needs objects from the store, it yields
+a request, and gets the retrieved objects back from a driver:
+
+* :py:class:`GetNodes` asks for decoded chain blocks or tree nodes,
+* :py:class:`GetValues` asks for raw values.
+
+Anything else a traversal yields is a result. The value a traversal
+returns is the result of the whole operation.
+
+Drivers answer requests with a list of objects in the order of the
+requested hashes, with ``None`` for objects that are not in the store.
+If retrieval fails, the exception is thrown into the traversal at the
+point of the request.
+
+Traversals look decoded nodes up in the view's cache first, and only
+request the nodes that are not cached, so that lookups served from the
+cache do not pay for the round trip through the driver.
+
+>>> def lookup(obj_hash):
+...     obj, = yield GetValues([obj_hash])
+...     yield 'got %s' % obj
+...     return obj
+>>> fetch = lambda hashes: [h.upper() for h in hashes]
+>>> list(iter_steps(lookup('abc'), fetch, fetch))
+['got ABC']
+>>> run_steps(lookup('abc'), fetch, fetch)
+'ABC'
+"""
+
+
+class GetNodes(object):
+    """Request for decoded nodes.
+
+    :param hashes: List of hashes. Nodes requested together can be
+                   retrieved concurrently.
+    """
+    __slots__ = ['hashes']
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+
+class GetValues(object):
+    """Request for raw values.
+
+    :param hashes: List of hashes
+    """
+    __slots__ = ['hashes']
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+
+def get_nodes_steps(cache, hashes):
+    """Traversal getting nodes from the cache, and requesting the rest.
+
+    Use as ``nodes = yield from get_nodes_steps(cache, hashes)``.
+
+    :param cache: Cache of decoded nodes
+    :param hashes: List of hashes
+    :returns: List of nodes in the order of ``hashes``, with ``None`` for
+              nodes that are not found.
+    """
+    nodes = [cache.get(node_hash) for node_hash in hashes]
+    missing = [i for i, node in enumerate(nodes) if node is None]
+    if missing:
+        retrieved = yield GetNodes([hashes[i] for i in missing])
+        for i, node in zip(missing, retrieved):
+            nodes[i] = node
+    return nodes
+
+
+def is_request(step):
+    """Check if a step yielded by a traversal is a request."""
+    return isinstance(step, (GetNodes, GetValues))
+
+
+def iter_steps(steps, get_nodes, get_values):
+    """Drive a traversal synchronously, yielding its results.
+
+    :param steps: Traversal generator
+    :param get_nodes: Callable answering :py:class:`GetNodes` requests
+    :param get_values: Callable answering :py:class:`GetValues` requests
+    :returns: The value returned by the traversal
+    """
+    value = error = None
+    while True:
+        try:
+            if error is None:
+                step = steps.send(value)
+            else:
+                step = steps.throw(error)
+        except StopIteration as e:
+            return e.value
+
+        value = error = None
+        try:
+            if step.__class__ is GetNodes:
+                value = get_nodes(step.hashes)
+            elif step.__class__ is GetValues:
+                value = get_values(step.hashes)
+            else:
+                yield step
+        except Exception as e:
+            error = e
+
+
+def run_steps(steps, get_nodes, get_values):
+    """Drive a traversal synchronously to completion.
+
+    Any results of the traversal are discarded.
+
+    :returns: The value returned by the traversal
+    """
+    value = error = None
+    while True:
+        try:
+            if error is None:
+                step = steps.send(value)
+            else:
+                step = steps.throw(error)
+        except StopIteration as e:
+            return e.value
+
+        value = error = None
+        try:
+            if step.__class__ is GetNodes:
+                value = get_nodes(step.hashes)
+            elif step.__class__ is GetValues:
+                value = get_values(step.hashes)
+        except Exception as e:
+            error = e
+
+
+def collect_steps(steps):
+    """Run a traversal inside another one, collecting its results.
+
+    Passes the requests of the inner traversal on to the driver of the
+    outer one. Use as ``results = yield from collect_steps(steps)``.
+
+    :returns: List of results of the inner traversal
+    """
+    results = []
+    value = error = None
+    while True:
+        try:
+            if error is not None:
+                step = steps.throw(error)
+            else:
+                step = steps.send(value)
+        except StopIteration:
+            return results
+
+        value = error = None
+        if is_request(step):
+            try:
+                value = yield step
+            except Exception as e:
+                error = e
+        else:
+            results.append(step)
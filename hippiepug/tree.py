@@ -2,13 +2,20 @@
 Tools for building and interpreting key-value Merkle trees.
 """
 
+import math
 import os
 
+from bisect import bisect_left
+from itertools import islice
 from warnings import warn
 
-from .struct import TreeNode, TreeLeaf
-from .store import IntegrityValidationError
-from .pack import encode, decode
+from .struct import TreeNode, TreeLeaf, MultiProof, VerificationResult
+from .store import IntegrityValidationError, Sha256DictStore
+from .pack import EncodingParams, encode, decode, index_proof
+from .pack import resolve_codec
+from .cache import resolve_cache
+from .traversal import GetNodes, GetValues, collect_steps, get_nodes_steps
+from .traversal import iter_steps, run_steps
 
 
 def _is_leaf(node):
@@ -21,6 +28,260 @@ def _is_inner_node(node):
     return isinstance(node, TreeNode)
 
 
+def _prefix_upper_bound(prefix):
+    """Return the smallest key greater than all keys with a given prefix.
+
+    :param prefix: String or bytes prefix
+    :returns: Upper bound, or None if there is no such key.
+
+    >>> _prefix_upper_bound('ab')
+    'ac'
+    >>> _prefix_upper_bound(b'a\\xff')
+    b'b'
+    >>> _prefix_upper_bound(b'') is None
+    True
+    """
+    if isinstance(prefix, bytes):
+        stripped = prefix.rstrip(b'\xff')
+        if not stripped:
+            return None
+        return stripped[:-1] + bytes([stripped[-1] + 1])
+
+    stripped = prefix.rstrip(chr(0x10ffff))
+    if not stripped:
+        return None
+    return stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+
+# Number of values retrieved from the store in one batch during scans.
+_SCAN_BATCH_SIZE = 64
+
+
+def _lookup_steps(cache, root, lookup_key):
+    """Traversal getting the path to a lookup key.
+
+    :returns: List of nodes on the path from the root to a leaf node.
+              The path is partial if the lookup failed.
+    """
+    # Nodes on the path from the root to the leaf.
+    path_nodes = []
+    current_node = cache.get(root)
+    if current_node is None:
+        current_node, = yield GetNodes([root])
+    while True:
+        path_nodes.append(current_node)
+        try:
+            # If current node is an intermediate node, get its left or
+            # right child according to the pivot value.
+            if _is_inner_node(current_node):
+                if lookup_key < current_node.pivot_prefix:
+                    child_hash = current_node.left_hash
+                else:
+                    child_hash = current_node.right_hash
+                current_node = cache.get(child_hash)
+                if current_node is None:
+                    current_node, = yield GetNodes([child_hash])
+
+                # If a child is not found, cannot continue the lookup.
+                if current_node is None:
+                    raise ValueError('A required node was not found')
+
+            # Stop when the current node is a leaf.
+            elif _is_leaf(current_node):
+                break
+
+            # Not a tree node. Likely a malformed object.
+            else:
+                raise TypeError('Invalid node type.')
+
+        # Warn that the lookup failed, and return whatever was found
+        # on the path.
+        except Exception as e:
+            warn('Exception occured when handling node %s: %s' % (
+                current_node, e))
+            break
+
+    return path_nodes
+
+
+def _payload_hash(path, lookup_key):
+    """Return the payload hash of the leaf with a lookup key, if the path
+    ends at it."""
+    # Check whether the last node in the path is a leaf, and its
+    # lookup key is what we were looking for.
+    if path and _is_leaf(path[-1]) and path[-1].lookup_key == lookup_key:
+        return path[-1].payload_hash
+
+
+def _lookup_value_steps(cache, root, lookup_key):
+    """Traversal getting the value by its lookup key.
+
+    :returns: A ``(value, path)`` tuple
+    """
+    path = yield from _lookup_steps(cache, root, lookup_key)
+    value = None
+    payload_hash = _payload_hash(path, lookup_key)
+    if payload_hash is not None:
+        value, = yield GetValues([payload_hash])
+    return value, path
+
+
+def _multi_lookup_steps(cache, root, lookup_keys):
+    """Traversal getting the paths to many sorted lookup keys at once.
+
+    Descends the tree once, splitting the keys at each pivot, so that
+    every node on the union of paths is requested once. Children that
+    are both on the paths are requested together.
+
+    :param lookup_keys: Sorted list of lookup keys
+    :returns: List of paths from the root to a leaf node, one for each
+              lookup key. Paths of keys sharing a prefix of the path
+              share the node objects.
+    """
+    paths = [None] * len(lookup_keys)
+    if len(lookup_keys) == 0:
+        return paths
+
+    try:
+        root_node, = yield from get_nodes_steps(cache, [root])
+    except Exception as e:
+        warn('Exception occured when handling node %s: %s' % (root, e))
+        return [[] for _ in paths]
+
+    stack = [(root_node, 0, len(lookup_keys), [])]
+    while stack:
+        current_node, start, end, path_nodes = stack.pop()
+        try:
+            # If a node is not found, cannot continue the lookup.
+            if current_node is None:
+                raise ValueError('A required node was not found')
+            path_nodes = path_nodes + [current_node]
+
+            # If current node is an intermediate node, split the keys
+            # according to the pivot value, and descend into children.
+            if _is_inner_node(current_node):
+                middle = bisect_left(lookup_keys,
+                        current_node.pivot_prefix, start, end)
+                ranges = [(child_hash, child_start, child_end)
+                          for child_hash, child_start, child_end in [
+                              (current_node.left_hash, start, middle),
+                              (current_node.right_hash, middle, end)]
+                          if child_start < child_end]
+                children = yield from get_nodes_steps(cache,
+                        [child_hash for child_hash, _, _ in ranges])
+                # Handle the left child first.
+                for child, (_, child_start, child_end) in reversed(
+                        list(zip(children, ranges))):
+                    stack.append((child, child_start, child_end,
+                                  path_nodes))
+
+            # Stop when the current node is a leaf.
+            elif _is_leaf(current_node):
+                for i in range(start, end):
+                    paths[i] = path_nodes
+
+            # Not a tree node. Likely a malformed object.
+            else:
+                raise TypeError('Invalid node type.')
+
+        # Warn that the lookup failed, and return whatever was found
+        # on the paths.
+        except Exception as e:
+            warn('Exception occured when handling node %s: %s' % (
+                current_node, e))
+            for i in range(start, end):
+                paths[i] = path_nodes
+
+    return paths
+
+
+def _get_many_steps(cache, root, lookup_keys):
+    """Traversal getting the values for many lookup keys at once.
+
+    :param lookup_keys: List of lookup keys
+    :returns: A ``(values, paths)`` tuple of lists in the order of
+              ``lookup_keys``
+    """
+    order = sorted(range(len(lookup_keys)), key=lookup_keys.__getitem__)
+    sorted_paths = yield from _multi_lookup_steps(
+            cache, root, [lookup_keys[i] for i in order])
+
+    paths = [None] * len(lookup_keys)
+    payload_hashes = [None] * len(lookup_keys)
+    for i, path in zip(order, sorted_paths):
+        paths[i] = path
+        payload_hashes[i] = _payload_hash(path, lookup_keys[i])
+
+    found_hashes = list({h for h in payload_hashes if h is not None})
+    payloads = dict(zip(found_hashes, (yield GetValues(found_hashes))))
+    values = [payloads.get(h) if h is not None else None
+              for h in payload_hashes]
+    return values, paths
+
+
+def _leaf_steps(cache, root, start=None, stop=None, visited=None):
+    """Traversal yielding leaves in a range of lookup keys, in order.
+
+    Descends only into subtrees that overlap the range. Overlapping
+    children of a node are requested together.
+
+    :param start: Lower bound of the range (inclusive), or None
+    :param stop: Upper bound of the range (exclusive), or None
+    :param list visited: If given, all visited nodes are appended to it
+    :raises: ``ValueError`` if a node is not found, ``TypeError`` if
+             an object is not a tree node.
+    """
+    stack = yield from get_nodes_steps(cache, [root])
+    while stack:
+        current_node = stack.pop()
+        if current_node is None:
+            raise ValueError('A required node was not found')
+        if visited is not None:
+            visited.append(current_node)
+
+        if _is_inner_node(current_node):
+            # Left subtree contains keys smaller than the pivot, and the
+            # right subtree contains the rest.
+            child_hashes = []
+            if stop is None or current_node.pivot_prefix < stop:
+                child_hashes.append(current_node.right_hash)
+            if start is None or start < current_node.pivot_prefix:
+                child_hashes.append(current_node.left_hash)
+            stack.extend((yield from get_nodes_steps(cache, child_hashes)))
+
+        elif _is_leaf(current_node):
+            lookup_key = current_node.lookup_key
+            if (start is None or start <= lookup_key) and (
+                    stop is None or lookup_key < stop):
+                yield current_node
+
+        else:
+            raise TypeError('Invalid node type.')
+
+
+def _range_steps(cache, root, start=None, stop=None, visited=None):
+    """Traversal getting all items in a range of lookup keys.
+
+    :returns: List of ``(lookup_key, value)`` pairs
+    """
+    leaves = yield from collect_steps(
+            _leaf_steps(cache, root, start, stop, visited))
+    values = yield GetValues([leaf.payload_hash for leaf in leaves])
+    return [(leaf.lookup_key, value) for leaf, value in zip(leaves, values)]
+
+
+def _decode_node(serialized_node, decoder=None):
+    """Decode a tree node.
+
+    :param decoder: Custom decoder, or None for the default one
+    :raises: ``TypeError`` if the object is not a tree node.
+    """
+    node = decode(serialized_node, decoder)
+    if not _is_leaf(node) and not _is_inner_node(node):
+        raise TypeError('Object with this hash is not a tree node.')
+    return node
+
+
 class Tree(object):
     """
     View of a Merkle tree.
@@ -29,8 +290,13 @@ class Tree(object):
 
     :param object_store: Object store
     :param root: The hash of the root node
-    :param cache: Cache
-    :type cache: dict
+    :param cache: Cache. If not given, the default from
+                  :py:class:`hippiepug.cache.CacheParams` is used.
+    :type cache: dict-like, e.g., :py:class:`hippiepug.cache.LRUCache`
+    :param encoding: Encoder and decoder of nodes. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
 
     .. warning::
        All read accesses are cached. The cache is assumed to be trusted,
@@ -41,10 +307,15 @@ class Tree(object):
        * :py:class:`hippiepug.chain.Chain`
     """
 
-    def __init__(self, object_store, root, cache=None):
+    def __init__(self, object_store, root, cache=None, encoding=None):
         self.object_store = object_store
         self.root = root
-        self._cache = cache or {}
+        self.encoding = encoding
+        self._cache = resolve_cache(cache)
+        self._encoder, self._decoder = resolve_codec(encoding, object_store)
+        # Lower bound on the number of leaves. Exact for trees made by a
+        # builder, and raised by the balance checks of updates.
+        self._min_size = 1
 
     def _get_node_by_hash(self, node_hash):
         """Unsafely retrieve node by its hash.
@@ -59,62 +330,97 @@ class Tree(object):
                  a tree node.
         """
         # Get the node from cache if it is in the cache.
-        if node_hash in self._cache:
-            return self._cache[node_hash]
+        cached_node = self._cache.get(node_hash)
+        if cached_node is not None:
+            return cached_node
 
         serialized_node = self.object_store.get(
                 node_hash, check_integrity=True)
         if serialized_node is not None:
-            node = decode(serialized_node)
-            if not _is_leaf(node) and not _is_inner_node(node):
-                raise TypeError('Object with this hash is not a tree node.')
-            self._cache[node_hash] = node
-            return node
+            return self._decode_node(node_hash, serialized_node)
+
+    def _decode_node(self, node_hash, serialized_node):
+        """Decode a retrieved node, and put it in the cache.
+
+        :raises: ``TypeError`` if the object is not a tree node.
+        """
+        node = _decode_node(serialized_node, self._decoder)
+        self._cache[node_hash] = node
+        return node
+
+    def _load_nodes(self, node_hashes):
+        """Unsafely retrieve several nodes from the store, in one batch.
+
+        Does not look the nodes up in the cache, but puts them there.
+
+        :returns: List of nodes, with None for nodes that are not found.
+        :raises: ``TypeError`` if a retrieved object is not a tree node.
+        """
+        if len(node_hashes) == 1:
+            serialized_nodes = [self.object_store.get(
+                    node_hashes[0], check_integrity=True)]
+        else:
+            serialized_nodes = self.object_store.get_many(
+                    node_hashes, check_integrity=True)
+        return [self._decode_node(node_hash, serialized_node)
+                if serialized_node is not None else None
+                for node_hash, serialized_node
+                in zip(node_hashes, serialized_nodes)]
+
+    def _get_values(self, value_hashes):
+        """Retrieve several values, fetching them in one batch."""
+        if len(value_hashes) == 1:
+            return [self.object_store.get(value_hashes[0])]
+        return self.object_store.get_many(value_hashes)
+
+    def _run(self, steps):
+        """Run a traversal, retrieving what it requests."""
+        return run_steps(steps, self._load_nodes, self._get_values)
+
+    def _iter(self, steps):
+        """Iterate over the results of a traversal."""
+        return iter_steps(steps, self._load_nodes, self._get_values)
 
     def _get_inclusion_proof(self, lookup_key):
         """Get (non-)inclusion proof for a lookup key.
 
         :param lookup_key: Lookup key
-        :returns: A tuple with a path to a leaf node, and a list of other
-                  nodes needed to reproduce the tree root.
+        :returns: Path from the root to a leaf node
         """
-        # Nodes on the path from the root to the leaf.
-        path_nodes = []
-        current_node = self.root_node
-        while True:
-            path_nodes.append(current_node)
-            left_child = right_child = None
-            try:
-                # If current node is an intermediate node, get its left or
-                # right child according to the pivot value.
-                if _is_inner_node(current_node):
-                    if lookup_key < current_node.pivot_prefix:
-                        current_node = self._get_node_by_hash(
-                                current_node.left_hash)
-                    else:
-                        current_node = self._get_node_by_hash(
-                                current_node.right_hash)
-
-                    # If a child is not found, cannot continue the lookup.
-                    if current_node is None:
-                        raise ValueError('A required node was not found')
-
-                # Stop when the current node is a leaf.
-                elif _is_leaf(current_node):
-                    break
-
-                # Not a tree node. Likely a malformed object.
-                else:
-                    raise TypeError('Invalid node type.')
+        return self._run(_lookup_steps(self._cache, self.root, lookup_key))
 
-            # Warn that the lookup failed, and return whatever was found
-            # on the path.
-            except Exception as e:
-                warn('Exception occured when handling node %s: %s' % (
-                    current_node, e))
-                break
+    def _get_inclusion_proofs(self, lookup_keys):
+        """Get (non-)inclusion proofs for many sorted lookup keys at once.
+
+        :param lookup_keys: Sorted list of lookup keys
+        :returns: List of paths from the root to a leaf node, one for each
+                  lookup key.
+        """
+        return self._run(_multi_lookup_steps(self._cache, self.root,
+                                             lookup_keys))
+
+    def get_many(self, lookup_keys, return_proofs=False):
+        """Retrieve values for many lookup keys at once.
 
-        return path_nodes
+        The tree is traversed once for all the keys, and the values are
+        retrieved from the store in one batch.
+
+        :param lookup_keys: Iterable of lookup keys
+        :param return_proofs: Whether to return inclusion proofs
+        :returns: List of values in the order of ``lookup_keys`` when
+                  ``return_proofs`` is False, and a ``(values, proofs)``
+                  tuple of lists when ``return_proofs`` is True. A value
+                  is ``None`` when the lookup key was not found.
+
+        .. seealso::
+           * :py:meth:`get_value_by_lookup_key`
+        """
+        values, paths = self._run(
+                _get_many_steps(self._cache, self.root, list(lookup_keys)))
+        if return_proofs:
+            return values, paths
+        else:
+            return values
 
     def get_value_by_lookup_key(self, lookup_key, return_proof=False):
         """Retrieve value by its lookup key.
@@ -125,19 +431,105 @@ class Tree(object):
                   ``(value, proof)`` tuple when ``return_proof`` is True.
                   A value is ``None`` when the lookup key was not found.
         """
-        path = self._get_inclusion_proof(lookup_key)
-        result = None
-        if path and path[-1] is not None:
-            # Check whether the last node in the path is a leaf, and its
-            # lookup key is what we were looking for.
-            if _is_leaf(path[-1]) and (path[-1].lookup_key == lookup_key):
-                result = self.object_store.get(path[-1].payload_hash)
-
+        result, path = self._run(
+                _lookup_value_steps(self._cache, self.root, lookup_key))
         if return_proof:
             return result, path
         else:
             return result
 
+    def get_multi_proof(self, lookup_keys):
+        """Get a compact (non-)inclusion proof for many lookup keys.
+
+        :param lookup_keys: Iterable of lookup keys
+        :returns: Proof containing each node on the paths to the keys once
+        :rtype: :py:class:`hippiepug.struct.MultiProof`
+        """
+        paths = self._get_inclusion_proofs(sorted(lookup_keys))
+        # Paths share the node objects, so deduplicate by identity.
+        nodes = {}
+        for path in paths:
+            for node in path:
+                nodes.setdefault(id(node), node)
+        return MultiProof(nodes=[encode(node, self._encoder)
+                                 for node in nodes.values()])
+
+    def _iter_leaves(self, start=None, stop=None, visited=None):
+        """Iterate over leaves in a range of lookup keys, in order.
+
+        :param start: Lower bound of the range (inclusive), or None
+        :param stop: Upper bound of the range (exclusive), or None
+        :param list visited: If given, all visited nodes are appended to it
+        :raises: ``ValueError`` if a node is not found, ``TypeError`` if
+                 an object is not a tree node.
+        """
+        return self._iter(
+                _leaf_steps(self._cache, self.root, start, stop, visited))
+
+    def keys(self, start=None, stop=None):
+        """Iterate over lookup keys in order, lazily.
+
+        :param start: Lower bound of the range (inclusive), or None
+        :param stop: Upper bound of the range (exclusive), or None
+        """
+        for leaf in self._iter_leaves(start, stop):
+            yield leaf.lookup_key
+
+    def items(self, start=None, stop=None):
+        """Iterate over ``(lookup_key, value)`` pairs in order, lazily.
+
+        Values are retrieved from the store in batches.
+
+        :param start: Lower bound of the range (inclusive), or None
+        :param stop: Upper bound of the range (exclusive), or None
+
+        .. seealso::
+           * :py:meth:`get_range`
+        """
+        leaves = self._iter_leaves(start, stop)
+        while True:
+            batch = list(islice(leaves, _SCAN_BATCH_SIZE))
+            if not batch:
+                break
+            values = self.object_store.get_many(
+                    [leaf.payload_hash for leaf in batch])
+            for leaf, value in zip(batch, values):
+                yield leaf.lookup_key, value
+
+    def prefix_scan(self, prefix):
+        """Iterate over ``(lookup_key, value)`` pairs with keys starting
+        with a given prefix, in order, lazily.
+
+        :param prefix: String or bytes prefix
+        """
+        return self.items(start=prefix, stop=_prefix_upper_bound(prefix))
+
+    def get_range(self, start=None, stop=None, return_proof=False):
+        """Retrieve all items in a range of lookup keys.
+
+        Optionally returns a range proof, that is the list of nodes
+        sufficient to verify that no items in the range were omitted.
+
+        :param start: Lower bound of the range (inclusive), or None
+        :param stop: Upper bound of the range (exclusive), or None
+        :param return_proof: Whether to return range proof
+        :returns: List of ``(lookup_key, value)`` pairs when
+                  ``return_proof`` is False, and an ``(items, proof)``
+                  tuple when ``return_proof`` is True.
+        """
+        proof = [] if return_proof else None
+        items = self._run(
+                _range_steps(self._cache, self.root, start, stop, proof))
+
+        if return_proof:
+            return items, proof
+        else:
+            return items
+
+    def __iter__(self):
+        """Iterate over lookup keys in order."""
+        return self.keys()
+
     def __contains__(self, lookup_key):
         """Check if lookup key is in the tree."""
         try:
@@ -158,6 +550,26 @@ class Tree(object):
         else:
             return value
 
+    def update(self, changes):
+        """Apply a batch of changes, producing a new version of the tree.
+
+        Only the nodes on the paths to the changed lookup keys are
+        rewritten. All other subtrees are shared with this version of the
+        tree, which stays valid. Subtrees that get too deep are rebuilt,
+        so that the depth stays logarithmic in the number of keys.
+
+        :param changes: Mapping from lookup keys to new values. A value of
+                        ``None`` deletes the lookup key.
+        :returns: View of the new version of the tree
+        :rtype: :py:class:`Tree`
+
+        .. seealso::
+           * :py:meth:`TreeBuilder.from_tree`
+        """
+        builder = TreeBuilder.from_tree(self)
+        builder.items.update(changes)
+        return builder.commit()
+
     @property
     def root_node(self):
         """The root node."""
@@ -170,10 +582,164 @@ class Tree(object):
                     self=self)
 
 
+def _make_subtree(items, start, end, hash_object, emit, encoder=None):
+    """Build a subtree over a range of sorted items.
+
+    Works on index ranges, so the items are never copied. Every node
+    is encoded and hashed exactly once, and immediately passed on to
+    ``emit``.
+
+    :param items: Sorted list of ``(lookup_key, payload_hash)`` tuples
+    :param start: Start of the range (inclusive)
+    :param end: End of the range (exclusive)
+    :param hash_object: Hash function of the store
+    :param emit: Callable accepting ``(node_hash, serialized_node)``
+    :param encoder: Custom encoder, or None for the default one
+    :returns: Hash of the subtree root
+    """
+    if end - start == 1:
+        lookup_key, payload_hash = items[start]
+        node = TreeLeaf(lookup_key=lookup_key, payload_hash=payload_hash)
+
+    else:
+        middle = (start + end) // 2
+        pivot_prefix = items[middle][0]
+        # NOTE: The right partition includes the pivot node
+        left_hash = _make_subtree(items, start, middle, hash_object, emit,
+                                  encoder)
+        right_hash = _make_subtree(items, middle, end, hash_object, emit,
+                                   encoder)
+
+        # TODO: Can we reliably truncate the prefixes?
+        node = TreeNode(pivot_prefix=pivot_prefix,
+                left_hash=left_hash, right_hash=right_hash)
+
+    serialized_node = encode(node, encoder)
+    node_hash = hash_object(serialized_node)
+    emit(node_hash, serialized_node)
+    return node_hash
+
+
+def _hash_chunk(hash_object, serialized_objs):
+    """Hash a chunk of objects. Runs in an executor."""
+    return [hash_object(serialized_obj) for serialized_obj in serialized_objs]
+
+
+def _build_subtree(hash_object, encoder, items):
+    """Build a subtree over sorted items. Runs in an executor.
+
+    :returns: A tuple with the hash of the subtree root, and the list of
+              ``(node_hash, serialized_node)`` pairs in the serial order.
+    """
+    hashed_nodes = []
+    root = _make_subtree(items, 0, len(items), hash_object,
+                         lambda *pair: hashed_nodes.append(pair), encoder)
+    return root, hashed_nodes
+
+
+def _make_subtree_parallel(items, hash_object, emit, encoder, executor,
+                           chunk_size):
+    """Build a tree over sorted items, with subtrees built concurrently.
+
+    Splits the items in the same way as :py:func:`_make_subtree` until
+    the ranges hold at most ``chunk_size`` items, builds the subtrees over
+    these ranges in the executor, and builds the nodes above them. Nodes
+    are passed on to ``emit`` in the same order as in the serial build.
+
+    :returns: Hash of the root
+    """
+    # Submit the subtrees first, so that they are all built concurrently.
+    futures = []
+
+    def plan(start, end):
+        if end - start <= chunk_size:
+            futures.append(executor.submit(
+                    _build_subtree, hash_object, encoder, items[start:end]))
+            return len(futures) - 1
+        middle = (start + end) // 2
+        return (items[middle][0], plan(start, middle), plan(middle, end))
+
+    def build(subtree):
+        if not isinstance(subtree, tuple):
+            root, hashed_nodes = futures[subtree].result()
+            for node_hash, serialized_node in hashed_nodes:
+                emit(node_hash, serialized_node)
+            return root
+        pivot_prefix, left, right = subtree
+        node = TreeNode(pivot_prefix=pivot_prefix,
+                left_hash=build(left), right_hash=build(right))
+        serialized_node = encode(node, encoder)
+        node_hash = hash_object(serialized_node)
+        emit(node_hash, serialized_node)
+        return node_hash
+
+    return build(plan(0, len(items)))
+
+
+#: Default number of items hashed, or put in a subtree, by one executor
+#: task during a parallel commit.
+PARALLEL_CHUNK_SIZE = 4096
+
+#: Number of values and nodes put into the store in one batch during a
+#: commit.
+COMMIT_BATCH_SIZE = 10000
+
+#: Subtrees rewritten by updates are rebuilt once they are deeper than
+#: this many times the binary logarithm of their size.
+MAX_DEPTH_FACTOR = 2
+
+
+class _Subtree(object):
+    """Subtree of a tree being updated.
+
+    Untouched subtrees only have the hash of their root. Rewritten ones
+    have either their changed children, or the items of a fresh subtree
+    to build over them.
+
+    :param height: Length of the longest rewritten path in the subtree
+    :param size: Number of leaves, if known
+    :param min_size: Lower bound on the number of leaves
+    """
+
+    __slots__ = ['node_hash', 'pivot_prefix', 'left', 'right', 'items',
+                 'height', 'size', 'min_size']
+
+    def __init__(self, node_hash=None, pivot_prefix=None, left=None,
+                 right=None, items=None, height=0, size=None, min_size=1):
+        self.node_hash = node_hash
+        self.pivot_prefix = pivot_prefix
+        self.left = left
+        self.right = right
+        self.items = items
+        self.height = height
+        self.size = size
+        self.min_size = min_size if size is None else size
+
+    @classmethod
+    def fresh(cls, items):
+        """Balanced subtree over sorted items."""
+        return cls(items=items, height=(len(items) - 1).bit_length(),
+                   size=len(items))
+
+    @classmethod
+    def inner(cls, pivot_prefix, left, right):
+        """Subtree with rewritten children."""
+        size = None
+        if left.size is not None and right.size is not None:
+            size = left.size + right.size
+        return cls(pivot_prefix=pivot_prefix, left=left, right=right,
+                   height=1 + max(left.height, right.height), size=size,
+                   min_size=left.min_size + right.min_size)
+
+
 class TreeBuilder(object):
     """Builder for a key-value Merkle tree.
 
     :param object_store: Object store
+    :param encoding: Encoder and decoder of nodes. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
 
     You can add items using a dict-like interface:
 
@@ -185,72 +751,362 @@ class TreeBuilder(object):
     >>> tree = builder.commit()
     >>> 'foo' in tree
     True
+
+    To change an existing tree, use :py:meth:`from_tree`:
+
+    >>> builder = TreeBuilder.from_tree(tree)
+    >>> builder['foo'] = b'new bar'
+    >>> del builder['baz']
+    >>> new_tree = builder.commit()
+    >>> new_tree['foo'] == b'new bar' and 'baz' not in new_tree
+    True
+    >>> tree['foo'] == b'bar' and 'baz' in tree
+    True
     """
 
-    def __init__(self, object_store):
+    def __init__(self, object_store, encoding=None):
         self.object_store = object_store
+        self.encoding = encoding
         self.items = {}
+        self._base_tree = None
+        self._encoder, _ = resolve_codec(encoding, object_store)
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Make a builder that applies changes on top of an existing tree.
+
+        On commit, only the paths to the changed lookup keys are
+        rewritten, and all untouched subtrees are shared with the
+        existing tree.
+
+        :param tree: Existing tree
+        :type tree: :py:class:`Tree`
+        """
+        builder = cls(tree.object_store, encoding=tree.encoding)
+        builder._base_tree = tree
+        return builder
 
     def __setitem__(self, lookup_key, value):
         """Add item for committing to the tree."""
         self.items[lookup_key] = value
 
-    def _make_subtree(self, items):
-        """Build a tree from sorted items.
+    def __delitem__(self, lookup_key):
+        """Remove item from the tree on commit."""
+        if self._base_tree is None:
+            del self.items[lookup_key]
+        else:
+            self.items[lookup_key] = None
+
+    def _emit_node(self, node, emit):
+        """Encode and hash the node, and pass it on to ``emit``.
+
+        :returns: Hash of the node
+        """
+        serialized_node = encode(node, self._encoder)
+        node_hash = self.object_store.hash_object(serialized_node)
+        emit(node_hash, serialized_node)
+        return node_hash
+
+    def _make_subtree(self, items, start, end, emit):
+        """Build a subtree over a range of sorted items.
+
+        .. seealso::
+           * :py:func:`_make_subtree`
+        """
+        return _make_subtree(items, start, end,
+                             self.object_store.hash_object, emit,
+                             self._encoder)
+
+    def _subtree_min_size(self, subtree, limit):
+        """Number of leaves in a subtree of an update, counted up to a limit.
+
+        Untouched subtrees are counted by traversing the base tree, only
+        until the limit is reached, so that checking the balance of a
+        large subtree does not read all of it.
+
+        :param limit: Number of leaves that is enough to know about
+        :returns: The number of leaves, or a lower bound on it that is at
+                  least ``limit``.
+        """
+        if subtree.size is not None or subtree.min_size >= limit:
+            return subtree.min_size
+        if subtree.node_hash is not None:
+            base_tree = self._base_tree
+            leaves = base_tree._iter(
+                    _leaf_steps(base_tree._cache, subtree.node_hash))
+            subtree.min_size = sum(1 for _ in islice(leaves, limit))
+            if subtree.min_size < limit:
+                subtree.size = subtree.min_size
+        else:
+            left, right = subtree.left, subtree.right
+            self._subtree_min_size(left, limit - right.min_size)
+            self._subtree_min_size(right, limit - left.min_size)
+            subtree.min_size = left.min_size + right.min_size
+            if left.size is not None and right.size is not None:
+                subtree.size = subtree.min_size
+        return subtree.min_size
+
+    def _is_unbalanced(self, subtree):
+        """Check if a rewritten subtree is deeper than
+        :py:data:`MAX_DEPTH_FACTOR` times the binary logarithm of its size.
+        """
+        limit = math.ceil(2 ** (subtree.height / MAX_DEPTH_FACTOR))
+        return self._subtree_min_size(subtree, limit) < limit
+
+    def _subtree_items(self, subtree):
+        """Sorted ``(lookup_key, payload_hash)`` items of an update subtree."""
+        items = []
+        stack = [subtree]
+        while stack:
+            current = stack.pop()
+            if current.items is not None:
+                items.extend(current.items)
+            elif current.node_hash is not None:
+                base_tree = self._base_tree
+                items.extend(
+                        (leaf.lookup_key, leaf.payload_hash)
+                        for leaf in base_tree._iter(_leaf_steps(
+                            base_tree._cache, current.node_hash)))
+            else:
+                stack.extend((current.right, current.left))
+        return items
+
+    def _update_subtree(self, node_hash, changes, keys, max_depth):
+        """Apply sorted changes to an existing subtree.
+
+        Subtrees that no change falls into are left as they are. A leaf
+        is replaced with a fresh subtree over the leaf item and the
+        changes that fall into it. Nothing is encoded yet, see
+        :py:meth:`_emit_subtree`.
 
-        :param items: An iterable of comparable and serializable items
+        A rewritten subtree that brings leaves deeper than ``max_depth``
+        is rebuilt from its items, if it is also deeper than
+        :py:data:`MAX_DEPTH_FACTOR` times the binary logarithm of its
+        size, like in a scapegoat tree. The check at the root keeps the
+        depth of the tree logarithmic, at the cost of rebuilding small
+        subtrees now and then. Sizes are counted lazily, and only up to
+        what the check needs, so the whole tree is never counted.
+
+        :param node_hash: Hash of the subtree root
+        :param changes: Sorted list of ``(lookup_key, payload_hash)``
+                        tuples. ``None`` payload hash means deletion.
+        :param keys: Lookup keys of the changes
+        :param max_depth: Depth above which rewritten subtrees are
+                          checked for rebuilding. Any depth up to
+                          :py:data:`MAX_DEPTH_FACTOR` times the binary
+                          logarithm of a lower bound on the size of the
+                          tree will do.
+        :returns: A tuple with the new subtree, or None if it became
+                  empty, and the change in the number of leaves.
+        """
+        size_delta = 0
+        results = []
+        # Visits are (node_hash, start, end, depth) tuples. Nodes whose
+        # children are visited are pushed as (node, node_hash, depth)
+        # tuples, to be combined after the children.
+        stack = [(node_hash, 0, len(changes), 0)]
+        while stack:
+            frame = stack.pop()
+            if len(frame) == 3:
+                node, node_hash, depth = frame
+                right = results.pop()
+                left = results.pop()
+                # If one of the subtrees is gone, the other one takes the
+                # place of this node.
+                if left is None or right is None:
+                    results.append(right if left is None else left)
+                    continue
+                if left.node_hash == node.left_hash and \
+                        right.node_hash == node.right_hash:
+                    results.append(_Subtree(node_hash=node_hash))
+                    continue
+                subtree = _Subtree.inner(node.pivot_prefix, left, right)
+                if depth + subtree.height > max_depth and \
+                        self._is_unbalanced(subtree):
+                    subtree = _Subtree.fresh(self._subtree_items(subtree))
+                results.append(subtree)
+                continue
+
+            node_hash, start, end, depth = frame
+            if start == end:
+                results.append(_Subtree(node_hash=node_hash))
+                continue
+
+            node = self._base_tree._get_node_by_hash(node_hash)
+            if node is None:
+                raise ValueError('A required node was not found')
+
+            if _is_inner_node(node):
+                middle = bisect_left(keys, node.pivot_prefix, start, end)
+                stack.append((node, node_hash, depth))
+                stack.append((node.right_hash, middle, end, depth + 1))
+                stack.append((node.left_hash, start, middle, depth + 1))
+
+            elif _is_leaf(node):
+                # Merge the leaf item into the changes, unless it is
+                # changed itself.
+                leaf_item = (node.lookup_key, node.payload_hash)
+                leaf_pending = True
+                items = []
+                for lookup_key, payload_hash in changes[start:end]:
+                    if leaf_pending and node.lookup_key <= lookup_key:
+                        if node.lookup_key < lookup_key:
+                            items.append(leaf_item)
+                        else:
+                            size_delta -= 1
+                        leaf_pending = False
+                    if payload_hash is not None:
+                        items.append((lookup_key, payload_hash))
+                        size_delta += 1
+                if leaf_pending:
+                    items.append(leaf_item)
+
+                if len(items) == 0:
+                    results.append(None)
+                elif items == [leaf_item]:
+                    results.append(_Subtree(node_hash=node_hash, size=1))
+                else:
+                    results.append(_Subtree.fresh(items))
+
+            else:
+                raise TypeError('Invalid node type.')
+
+        return results.pop(), size_delta
+
+    def _emit_subtree(self, subtree, emit):
+        """Encode the nodes of an updated subtree, children first.
+
+        :returns: Hash of the subtree root
+        """
+        hashes = []
+        stack = [(subtree, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if current.node_hash is not None:
+                hashes.append(current.node_hash)
+            elif current.items is not None:
+                hashes.append(self._make_subtree(
+                        current.items, 0, len(current.items), emit))
+            elif not children_done:
+                stack.append((current, True))
+                stack.append((current.right, False))
+                stack.append((current.left, False))
+            else:
+                right_hash = hashes.pop()
+                left_hash = hashes.pop()
+                hashes.append(self._emit_node(TreeNode(
+                        pivot_prefix=current.pivot_prefix,
+                        left_hash=left_hash, right_hash=right_hash), emit))
+        return hashes.pop()
+
+    def commit(self, executor=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        """Commit items to the tree.
+
+        If the builder was made using :py:meth:`from_tree`, the items are
+        applied as changes to the base tree, and items set to ``None`` are
+        deleted.
+
+        :param executor: Optional :py:class:`concurrent.futures.Executor`.
+                         If given, values are hashed in chunks, and the
+                         subtrees of a fresh tree are built concurrently.
+                         The result is identical to that of a serial
+                         commit.
+        :param chunk_size: Number of values hashed, or items put in a
+                           subtree, by one executor task.
+        :returns: View of the committed tree
+        :rtype: :py:class:`Tree`
+        :raises: ``ValueError`` if the tree would be empty.
+
+        The objects are put into the store in batches of bounded size,
+        all within one :py:meth:`hippiepug.store.BaseStore.transaction`.
+
+        Since ``hashlib`` releases the GIL when hashing large buffers, a
+        thread pool pays off for large values. To also parallelize the
+        encoding of nodes, use a process pool. Note that encoders set as
+        defaults in the current thread are passed on to the executor,
+        so they need to be picklable for process pools.
         """
-        if len(items) == 0:
-            raise ValueError("No items to put.")
+        with self.object_store.transaction():
+            return self._commit(executor, chunk_size)
 
-        if len(items) == 1:
-            (key, serialized_obj), = items
-            value_hash = self.object_store.hash_object(serialized_obj)
-            leaf = TreeLeaf(lookup_key=key, payload_hash=value_hash)
-            return [leaf]
+    def _commit(self, executor, chunk_size):
+        hash_object = self.object_store.hash_object
+        sorted_items = sorted(self.items.items(), key=lambda t: t[0])
 
+        # Hash each item and node only once, and put them into the store
+        # in batches of bounded size.
+        values = [serialized_obj for _, serialized_obj in sorted_items
+                  if serialized_obj is not None]
+        if executor is None:
+            value_hashes = [hash_object(serialized_obj)
+                            for serialized_obj in values]
         else:
-            middle = len(items) // 2
-            pivot_prefix, pivot_obj = items[middle]
-            left_partition = items[:middle]
-            # NOTE: The right partition includes the pivot node
-            right_partition = items[middle:]
-            left_subtree_nodes = self._make_subtree(left_partition)
-            right_subtree_nodes = self._make_subtree(right_partition)
-
-            # TODO: Can we reliably truncate the prefixes?
-
-            # Compute hashes of direct children.
-            left_hash = None
-            right_hash = None
-            left_hash = self.object_store.hash_object(
-                encode(left_subtree_nodes[0]))
-            right_hash = self.object_store.hash_object(
-                encode(right_subtree_nodes[0]))
-
-            pivot_node = TreeNode(pivot_prefix=pivot_prefix,
-                    left_hash=left_hash, right_hash=right_hash)
-
-            return [pivot_node] + left_subtree_nodes + right_subtree_nodes
-
-    # TODO: Figure out if we can have this as an atomic transaction
-    def commit(self):
-        """Commit items to the tree."""
-        items = sorted(self.items.items(), key=lambda t: t[0])
-        nodes = self._make_subtree(items)
-
-        # Put intermediate nodes into the store.
-        for node in nodes:
-            serialized_node = encode(node)
-            self.object_store.add(serialized_node)
-
-        # Put items themselves into the store.
-        for serialized_obj in self.items.values():
-            self.object_store.add(serialized_obj)
-
-        root_node = nodes[0]
-        root = self.object_store.hash_object(encode(root_node))
-        return Tree(self.object_store, root)
+            chunks = [values[i:i + chunk_size]
+                      for i in range(0, len(values), chunk_size)]
+            value_hashes = [value_hash for chunk_hashes in executor.map(
+                                _hash_chunk, [hash_object] * len(chunks),
+                                chunks)
+                            for value_hash in chunk_hashes]
+        batch = []
+
+        def emit(obj_hash, serialized_obj):
+            nonlocal batch
+            batch.append((obj_hash, serialized_obj))
+            if len(batch) >= COMMIT_BATCH_SIZE:
+                self.object_store.add_hashed_many(batch)
+                batch = []
+
+        for value_hash, serialized_obj in zip(value_hashes, values):
+            emit(value_hash, serialized_obj)
+
+        items = []
+        value_hashes = iter(value_hashes)
+        for lookup_key, serialized_obj in sorted_items:
+            value_hash = None
+            if serialized_obj is not None:
+                value_hash = next(value_hashes)
+            elif self._base_tree is None:
+                continue
+            items.append((lookup_key, value_hash))
+
+        if self._base_tree is None:
+            if len(items) == 0:
+                raise ValueError("No items to put.")
+            if executor is None:
+                root = self._make_subtree(items, 0, len(items), emit)
+            else:
+                encoder = self._encoder
+                if encoder is None:
+                    encoder = EncodingParams.get_default().encoder
+                root = _make_subtree_parallel(items, hash_object, emit,
+                        encoder, executor, chunk_size)
+            if batch:
+                self.object_store.add_hashed_many(batch)
+            tree = Tree(self.object_store, root, encoding=self.encoding)
+            tree._min_size = len(items)
+            return tree
+
+        # The tree keeps at least this many leaves, whatever is deleted.
+        base_tree = self._base_tree
+        min_size = max(base_tree._min_size - (len(items) - len(values)), 1)
+        max_depth = MAX_DEPTH_FACTOR * math.log2(min_size)
+        keys = [lookup_key for lookup_key, _ in items]
+        subtree, size_delta = self._update_subtree(
+                base_tree.root, items, keys, max_depth)
+        if subtree is None:
+            raise ValueError("No items left in the tree.")
+        root = self._emit_subtree(subtree, emit)
+        if batch:
+            self.object_store.add_hashed_many(batch)
+        tree = Tree(self.object_store, root, cache=base_tree._cache,
+                    encoding=self.encoding)
+        # Keep what the balance checks have counted, so that the next
+        # updates of either version do not count it again.
+        tree._min_size = max(base_tree._min_size + size_delta,
+                             subtree.min_size)
+        base_tree._min_size = max(base_tree._min_size,
+                                  subtree.min_size - size_delta)
+        return tree
 
     def __repr__(self):
         return ('TreeBuilder('  # pragma: no cover
@@ -259,7 +1115,8 @@ class TreeBuilder(object):
                     self=self)
 
 
-def verify_tree_inclusion_proof(store, root, lookup_key, value, proof):
+def verify_tree_inclusion_proof(store, root, lookup_key, value, proof,
+                                encoding=None):
     """Verify inclusion proof for a tree.
 
     :param store: Object store, may be empty
@@ -268,11 +1125,174 @@ def verify_tree_inclusion_proof(store, root, lookup_key, value, proof):
     :param value: Value associated with the lookup key
     :param proof: Inclusion proof
     :type proof: tuple containing list of decoded path nodes
+    :param encoding: Encoder and decoder of the proof. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
     :returns: bool
+
+    .. seealso::
+       * :py:func:`verify_tree_proof` does not need a store
     """
-    for node in proof:
-        store.add(encode(node))
-    store.add(value)
-    verifier_tree = Tree(store, root=root)
+    encoder, _ = resolve_codec(encoding, store)
+    store.add_many([encode(node, encoder) for node in proof] + [value])
+    verifier_tree = Tree(store, root=root, encoding=encoding)
     retrieved_payload = verifier_tree.get_value_by_lookup_key(lookup_key)
     return retrieved_payload == value
+
+
+def verify_tree_range_proof(store, root, items, proof, start=None,
+                            stop=None, encoding=None):
+    """Verify that items are all the items in a range of a tree.
+
+    :param store: Object store, may be empty
+    :param root: Tree root
+    :param items: List of ``(lookup_key, value)`` pairs
+    :param proof: Range proof
+    :type proof: list of decoded nodes
+    :param start: Lower bound of the range (inclusive), or None
+    :param stop: Upper bound of the range (exclusive), or None
+    :param encoding: Encoder and decoder of the proof. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: bool
+    """
+    encoder, _ = resolve_codec(encoding, store)
+    store.add_many([encode(node, encoder) for node in proof] +
+                   [value for _, value in items])
+    verifier_tree = Tree(store, root=root, encoding=encoding)
+    try:
+        retrieved_items = verifier_tree.get_range(start, stop)
+    except (ValueError, TypeError):
+        return False
+    return retrieved_items == [tuple(item) for item in items]
+
+
+def verify_tree_multi_proof(store, root, items, proof, encoding=None):
+    """Verify (non-)inclusion proof for many lookup keys in a tree.
+
+    :param store: Object store, may be empty
+    :param root: Tree root
+    :param items: Iterable of ``(lookup_key, value)`` pairs. A value of
+                  ``None`` claims that the lookup key is not in the tree.
+    :param proof: Multi-proof
+    :type proof: :py:class:`hippiepug.struct.MultiProof`
+    :param encoding: Encoder and decoder of the proof. If not given, those
+                     bound to the store are used, or else the defaults
+                     from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: bool
+    """
+    store.add_many(proof.nodes)
+    items = sorted(items, key=lambda t: t[0])
+    verifier_tree = Tree(store, root=root, encoding=encoding)
+    paths = verifier_tree._get_inclusion_proofs(
+            [lookup_key for lookup_key, _ in items])
+
+    for (lookup_key, value), path in zip(items, paths):
+        # Every path must end in a leaf, otherwise the proof is
+        # insufficient.
+        if not path or not _is_leaf(path[-1]):
+            return False
+        leaf = path[-1]
+        if leaf.lookup_key == lookup_key:
+            if value is None or (
+                    store.hash_object(value) != leaf.payload_hash):
+                return False
+        elif value is not None:
+            return False
+    return True
+
+
+def _verify_tree_path(nodes_by_hash, root, lookup_key, value, hash_object):
+    """Replay the lookup from the root over indexed nodes."""
+    current_hash = root
+    while True:
+        current_node = nodes_by_hash.get(current_hash)
+        if current_node is None:
+            return VerificationResult(False, 'Node {} is missing.'.format(
+                current_hash))
+        if _is_inner_node(current_node):
+            try:
+                if lookup_key < current_node.pivot_prefix:
+                    current_hash = current_node.left_hash
+                else:
+                    current_hash = current_node.right_hash
+            except TypeError as e:
+                return VerificationResult(False, 'Node {} is malformed: {}'
+                    .format(current_hash, e))
+        elif _is_leaf(current_node):
+            break
+        else:
+            return VerificationResult(False, 'Object {} is not a node.'.format(
+                current_hash))
+
+    if current_node.lookup_key != lookup_key:
+        if value is not None:
+            return VerificationResult(False, 'Lookup key is not in the tree.')
+        return VerificationResult(True)
+    if value is None:
+        return VerificationResult(False, 'Lookup key is in the tree.')
+    if hash_object(value) != current_node.payload_hash:
+        return VerificationResult(False, 'Value does not match.')
+    return VerificationResult(True)
+
+
+def verify_tree_proof(root, lookup_key, value, proof, hash_object=None,
+                      encoding=None):
+    """Verify (non-)inclusion proof for a tree without a store.
+
+    Checks the hash links between the proof nodes directly. Each proof
+    node is hashed once.
+
+    :param root: Tree root
+    :param lookup_key: Lookup key
+    :param value: Value associated with the lookup key, or ``None`` to
+                  verify that the lookup key is not in the tree
+    :param proof: Inclusion proof
+    :type proof: list of decoded nodes, or
+                 :py:class:`hippiepug.struct.MultiProof`
+    :param hash_object: Hash function of the tree's store. Defaults to
+                        :py:meth:`hippiepug.store.Sha256DictStore.hash_object`
+    :param encoding: Encoder and decoder of the tree's store. Defaults to
+                     those from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :rtype: :py:class:`hippiepug.struct.VerificationResult`
+    """
+    return verify_tree_proofs(root, [(lookup_key, value)], [proof],
+                              hash_object, encoding)[0]
+
+
+def verify_tree_proofs(root, items, proofs, hash_object=None,
+                       encoding=None):
+    """Verify (non-)inclusion proofs for many lookup keys without a store.
+
+    Proof nodes shared between proofs are hashed once.
+
+    :param root: Tree root
+    :param items: ``(lookup_key, value)`` pairs. A value of ``None`` claims
+                  that the lookup key is not in the tree.
+    :param proofs: Inclusion proofs, one for each item
+    :param hash_object: Hash function of the tree's store. Defaults to
+                        :py:meth:`hippiepug.store.Sha256DictStore.hash_object`
+    :param encoding: Encoder and decoder of the tree's store. Defaults to
+                     those from :py:class:`hippiepug.pack.EncodingParams`.
+    :type encoding: :py:class:`hippiepug.pack.EncodingParams`
+    :returns: List of verification results
+    """
+    if hash_object is None:
+        hash_object = Sha256DictStore.hash_object
+    encoder, decoder = resolve_codec(encoding)
+    memo = {}
+    results = []
+    for (lookup_key, value), proof in zip(items, proofs):
+        try:
+            nodes_by_hash = index_proof(proof, hash_object, memo,
+                                        encoder, decoder)
+        except (ValueError, TypeError) as e:
+            results.append(VerificationResult(False, str(e)))
+            continue
+        results.append(_verify_tree_path(
+            nodes_by_hash, root, lookup_key, value, hash_object))
+    return results
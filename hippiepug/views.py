@@ -0,0 +1,182 @@
+"""
+Zero-copy reads of large payloads.
+
+By default, every retrieval copies an object out of the store into fresh
+``bytes``, and decoding a chain block copies its payload once more. For
+multi-megabyte payloads, the copies dominate the cost of a lookup.
+
+A :py:class:`ViewStore` wraps a store so that it returns ``memoryview``
+objects over the buffers owned by the store, e.g., the memory map of a
+:py:class:`hippiepug.logstore.LogStore`. Decoding with
+:py:func:`hippiepug.pack.view_decoder` then leaves block payloads in these
+buffers, so reading the index and the fingers of a block never touches
+its payload. Tree values are returned as views as they are.
+
+A :py:class:`PayloadReader` streams a payload in chunks, through the
+standard file interface.
+
+>>> from .chain import Chain, BlockBuilder
+>>> from .pack import EncodingParams, view_decoder
+>>> from .store import Sha256DictStore
+>>> chain = Chain(Sha256DictStore())
+>>> builder = BlockBuilder(chain)
+>>> builder.payload = b'Large payload'
+>>> _ = builder.commit()
+>>> with EncodingParams(decoder=view_decoder).as_default():
+...     view_chain = Chain(ViewStore(chain.object_store), head=chain.head)
+...     payload = view_chain[0].payload
+>>> isinstance(payload, memoryview)
+True
+>>> PayloadReader(payload).read(5)
+b'Large'
+
+Views keep the buffers they point into alive, e.g., the part of the log
+they are in stays mapped. Blocks and nodes decoded from views hold them as
+long as they are cached.
+"""
+
+import io
+
+from .store import BaseStore
+
+
+#: Default size of chunks yielded by :py:meth:`PayloadReader.iter_chunks`.
+DEFAULT_CHUNK_SIZE = 2**20
+
+
+class ViewStore(BaseStore):
+    """Store wrapper that returns objects as ``memoryview`` objects.
+
+    Retrievals go through :py:meth:`hippiepug.store.BaseStore.get_view` of
+    the wrapped store, with its integrity checks. Other attributes are
+    passed through to the wrapped store.
+
+    :param store: Wrapped store
+    :type store: :py:class:`hippiepug.store.BaseStore`
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hash_object = store.hash_object
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def get(self, obj_hash, check_integrity=True):
+        """Return a view of the object with a given hash, or None."""
+        return self.store.get_view(obj_hash, check_integrity=check_integrity)
+
+    def get_view(self, obj_hash, check_integrity=True):
+        """Return a view of the object with a given hash, or None."""
+        return self.store.get_view(obj_hash, check_integrity=check_integrity)
+
+    def get_many(self, obj_hashes, check_integrity=True):
+        """Return views of many objects with given hashes."""
+        get_view = self.store.get_view
+        return [get_view(obj_hash, check_integrity=check_integrity)
+                for obj_hash in obj_hashes]
+
+    def __contains__(self, obj_hash):
+        return obj_hash in self.store
+
+    def contains_many(self, obj_hashes):
+        return self.store.contains_many(obj_hashes)
+
+    def add(self, serialized_obj):
+        return self.store.add(serialized_obj)
+
+    def add_hashed(self, obj_hash, serialized_obj):
+        return self.store.add_hashed(obj_hash, serialized_obj)
+
+    def add_many(self, serialized_objs):
+        return self.store.add_many(serialized_objs)
+
+    def add_hashed_many(self, hashed_objs):
+        return self.store.add_hashed_many(hashed_objs)
+
+    def transaction(self):
+        return self.store.transaction()
+
+    def __repr__(self):
+        return ('{self.__class__.__name__}('  # pragma: no cover
+                '{self.store})').format(self=self)
+
+
+class PayloadReader(io.RawIOBase):
+    """Read-only, seekable file object over a payload.
+
+    Reads copy only the requested chunks out of the payload, so that very
+    large values can be processed piece by piece, e.g., with
+    ``shutil.copyfileobj``.
+
+    :param payload: Bytes-like payload, e.g., a view returned by a
+                    :py:class:`ViewStore`
+
+    >>> reader = PayloadReader(b'abcdef')
+    >>> reader.read(2), reader.read()
+    (b'ab', b'cdef')
+    >>> _ = reader.seek(-3, io.SEEK_END)
+    >>> [bytes(chunk) for chunk in reader.iter_chunks(chunk_size=2)]
+    [b'de', b'f']
+    """
+
+    def __init__(self, payload):
+        super(PayloadReader, self).__init__()
+        self._view = memoryview(payload).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read bytes into a pre-allocated buffer.
+
+        :returns: Number of bytes read, 0 at the end of the payload
+        """
+        self._checkClosed()
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        size = len(chunk)
+        memoryview(buffer).cast('B')[:size] = chunk
+        self._pos += size
+        return size
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Iterate over the rest of the payload in chunks, without copying.
+
+        :param chunk_size: Maximum size of a chunk, in bytes
+        :returns: Iterator of ``memoryview`` slices of the payload
+        """
+        self._checkClosed()
+        while self._pos < len(self._view):
+            chunk = self._view[self._pos:self._pos + chunk_size]
+            self._pos += len(chunk)
+            yield chunk
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Change the position, and return the new one."""
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError('Invalid whence: {}'.format(whence))
+        if pos < 0:
+            raise ValueError('Negative seek position: {}'.format(pos))
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        self._checkClosed()
+        return self._pos
+
+    def close(self):
+        """Close the reader, and release the payload."""
+        if not self.closed:
+            self._view.release()
+        super(PayloadReader, self).close()
@@ -6,7 +6,7 @@ from setuptools import setup
 
 
 INSTALL_REQUIRES = [
-    'attrs>=17.4.0',
+    'attrs>=19.2.0',
     'msgpack>=0.5.6',
     'defaultcontext>=1.1.0',
 ]
@@ -21,7 +21,11 @@ TEST_REQUIRES = [
     'pytest-lazy-fixture',
 ]
 
-DEV_REQUIRES = TEST_REQUIRES + [
+BENCH_REQUIRES = TEST_REQUIRES + [
+    'pytest-benchmark',
+]
+
+DEV_REQUIRES = BENCH_REQUIRES + [
     'sphinx',
     'sphinx_rtd_theme'
 ]
@@ -53,7 +57,9 @@ setup(
     tests_require=TEST_REQUIRES,
     extras_require={
         'dev': DEV_REQUIRES,
-        'test': TEST_REQUIRES
+        'bench': BENCH_REQUIRES,
+        'test': TEST_REQUIRES,
+        'blake3': ['blake3'],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,198 @@
+import asyncio
+import pytest
+
+from hippiepug.aio import AsyncBaseStore, AsyncChain, AsyncTree
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.pack import EncodingParams, binary_encoder, binary_decoder
+from hippiepug.store import Sha256DictStore
+from hippiepug.tree import Tree, TreeBuilder
+
+
+class AsyncDictStore(AsyncBaseStore):
+    """In-memory async store that yields to the event loop on each call,
+    and tracks how many retrievals are in flight."""
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else Sha256DictStore()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @classmethod
+    def hash_object(cls, serialized_obj):
+        return Sha256DictStore.hash_object(serialized_obj)
+
+    async def get(self, obj_hash, check_integrity=True):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0)
+            return self.store.get(obj_hash, check_integrity=check_integrity)
+        finally:
+            self.in_flight -= 1
+
+    async def contains(self, obj_hash):
+        await asyncio.sleep(0)
+        return obj_hash in self.store
+
+    async def add(self, serialized_obj):
+        await asyncio.sleep(0)
+        return self.store.add(serialized_obj)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+@pytest.fixture
+def sync_chain(object_store):
+    chain = Chain(object_store)
+    builder = BlockBuilder(chain)
+    for i in range(42):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    return chain
+
+
+@pytest.fixture
+def async_chain(sync_chain):
+    return AsyncChain(AsyncDictStore(sync_chain.object_store),
+                      head=sync_chain.head)
+
+
+@pytest.fixture
+def sync_tree(object_store):
+    builder = TreeBuilder(object_store)
+    for i in range(100):
+        builder[b'%03d' % i] = b'value %d' % i
+    return builder.commit()
+
+
+@pytest.fixture
+def async_tree(sync_tree):
+    return AsyncTree(AsyncDictStore(sync_tree.object_store), sync_tree.root)
+
+
+def test_async_store_batch_defaults():
+    store = AsyncDictStore()
+    objs = [b'obj %d' % i for i in range(3)]
+    hashes = run(store.add_many(objs))
+    assert run(store.get_many(hashes)) == objs
+    missing_hash = store.hash_object(b'nonexistent')
+    assert run(store.contains_many(hashes + [missing_hash])) == \
+            [True, True, True, False]
+
+
+def test_async_chain_get_block_by_index(sync_chain, async_chain):
+    """Check that async lookups and proofs match the sync ones."""
+    for index in [0, 1, 17, 41]:
+        expected = sync_chain.get_block_by_index(index, return_proof=True)
+        result = run(async_chain.get_block_by_index(
+            index, return_proof=True))
+        assert result == expected
+
+    with pytest.raises(IndexError):
+        run(async_chain.get_block_by_index(42))
+
+
+def test_async_chain_get_blocks(sync_chain, async_chain):
+    indices = [3, 40, 3, 0]
+    assert run(async_chain.get_blocks(indices, return_proofs=True)) == \
+            sync_chain.get_blocks(indices, return_proofs=True)
+    assert run(async_chain.get_multi_proof(indices)) == \
+            sync_chain.get_multi_proof(indices)
+
+
+def test_async_chain_iteration(sync_chain, async_chain):
+    assert run(collect(async_chain)) == list(sync_chain)
+    assert run(collect(async_chain.iter_range(5, 30, prefetch=7))) == \
+            list(sync_chain.iter_range(5, 30))
+    assert run(collect(async_chain.iter_range(5, 30, reverse=True))) == \
+            list(sync_chain.iter_range(5, 30, reverse=True))
+    with pytest.raises(IndexError):
+        run(collect(async_chain.iter_range(0, 43)))
+
+
+@pytest.mark.parametrize('bound_to', ['view', 'store'])
+def test_async_views_use_bound_codec(bound_to):
+    """Check that async views decode objects written with a bound codec."""
+    params = EncodingParams(encoder=binary_encoder, decoder=binary_decoder)
+    store = Sha256DictStore(encoding=params)
+    chain = Chain(store)
+    chain.extend([b'Block %d' % i for i in range(10)])
+    tree_builder = TreeBuilder(store)
+    for i in range(10):
+        tree_builder[b'%03d' % i] = b'value %d' % i
+    tree = tree_builder.commit()
+
+    async_store = AsyncDictStore(store)
+    encoding = params
+    if bound_to == 'store':
+        async_store.encoding = params
+        encoding = None
+    async_chain = AsyncChain(async_store, head=chain.head,
+                             encoding=encoding)
+    async_tree = AsyncTree(async_store, tree.root, encoding=encoding)
+
+    assert run(async_chain.get_block_by_index(3)) == chain[3]
+    assert run(async_chain.get_multi_proof([3, 7])) == \
+            chain.get_multi_proof([3, 7])
+    assert run(async_tree.get_value_by_lookup_key(b'007')) == b'value 7'
+    assert run(async_tree.get_multi_proof([b'003'])) == \
+            tree.get_multi_proof([b'003'])
+
+
+def test_async_chain_empty():
+    chain = AsyncChain(AsyncDictStore())
+    assert run(chain.get_head_block()) is None
+    assert run(chain.get_block_by_index(0, return_proof=True)) == (None, [])
+    assert run(collect(chain)) == []
+
+
+def test_async_tree_lookups(sync_tree, async_tree):
+    """Check that async lookups and proofs match the sync ones."""
+    for key in [b'000', b'042', b'099', b'nonexistent']:
+        expected = sync_tree.get_value_by_lookup_key(key, return_proof=True)
+        result = run(async_tree.get_value_by_lookup_key(
+            key, return_proof=True))
+        assert result == expected
+
+    keys = [b'010', b'nonexistent', b'003', b'010']
+    assert run(async_tree.get_many(keys, return_proofs=True)) == \
+            sync_tree.get_many(keys, return_proofs=True)
+    assert run(async_tree.get_multi_proof(keys)) == \
+            sync_tree.get_multi_proof(keys)
+
+
+def test_async_tree_iteration(sync_tree, async_tree):
+    assert run(collect(async_tree)) == list(sync_tree)
+    assert run(collect(async_tree.items(b'010', b'075'))) == \
+            list(sync_tree.items(b'010', b'075'))
+    assert run(collect(async_tree.prefix_scan(b'05'))) == \
+            list(sync_tree.prefix_scan(b'05'))
+    assert run(async_tree.get_range(b'020', b'030', return_proof=True)) == \
+            sync_tree.get_range(b'020', b'030', return_proof=True)
+
+
+def test_async_tree_fetches_siblings_concurrently(async_tree):
+    run(async_tree.get_range())
+    assert async_tree.object_store.max_in_flight > 1
+
+
+def test_async_tree_missing_node(sync_tree):
+    """Check that a missing node is handled as in the sync tree."""
+    store = sync_tree.object_store
+    del store._backend[sync_tree.root_node.left_hash]
+    tree = Tree(store, sync_tree.root)
+    async_tree = AsyncTree(AsyncDictStore(store), sync_tree.root)
+
+    with pytest.warns(UserWarning, match='Exception occured'):
+        assert run(async_tree.get_many([b'001', b'099'])) == \
+                [None, b'value 99']
+    with pytest.raises(ValueError):
+        run(async_tree.get_range())
+    with pytest.raises(ValueError):
+        tree.get_range()
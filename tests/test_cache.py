@@ -0,0 +1,135 @@
+import pytest
+import threading
+
+from hippiepug.cache import LRUCache, CacheParams, approx_sizeof
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.tree import Tree, TreeBuilder
+from hippiepug.struct import ChainBlock
+
+
+def test_lru_evicts_least_recently_used():
+    """Check the eviction order."""
+    cache = LRUCache(max_items=3)
+    for key in 'abc':
+        cache[key] = key.upper()
+    assert cache.get('a') == 'A'
+    cache['d'] = 'D'
+
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    assert len(cache) == 3
+    assert cache.stats.evictions == 1
+
+
+def test_lru_byte_budget():
+    """Check that the cache stays within the byte budget."""
+    block = ChainBlock(payload=b'x' * 1000)
+    block_size = approx_sizeof(block)
+    assert block_size > 1000
+
+    cache = LRUCache(max_bytes=3 * block_size)
+    for i in range(10):
+        cache[i] = ChainBlock(payload=b'x' * 1000)
+        assert cache.nbytes <= 3 * block_size
+    assert len(cache) == 3
+    assert list(range(7, 10)) == [i for i in range(10) if i in cache]
+
+
+def test_lru_stats():
+    """Check hit and miss counters."""
+    cache = LRUCache()
+    cache['a'] = 1
+    assert cache.get('a') == 1
+    assert cache['a'] == 1
+    assert cache.get('b') is None
+    with pytest.raises(KeyError):
+        cache['b']
+
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.evictions) == (2, 2, 0)
+    assert stats.hit_rate == 0.5
+
+    cache.reset_stats()
+    assert cache.stats.hits == 0
+
+
+def test_lru_overwrite_keeps_size():
+    """Check that overwriting an object does not leak the byte count."""
+    cache = LRUCache(max_bytes=10**6)
+    cache['a'] = b'x' * 100
+    nbytes = cache.nbytes
+    cache['a'] = b'x' * 100
+    assert cache.nbytes == nbytes
+    cache.clear()
+    assert cache.nbytes == 0 and len(cache) == 0
+
+
+def test_lru_thread_safety():
+    """Hammer the cache from several threads."""
+    cache = LRUCache(max_items=50)
+
+    def worker(offset):
+        for i in range(2000):
+            key = (offset + i) % 100
+            cache[key] = key
+            value = cache.get(key)
+            assert value is None or value == key
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) <= 50
+    stats = cache.stats
+    assert stats.hits + stats.misses == 8 * 2000
+
+
+def test_empty_cache_is_shared(object_store):
+    """Check that an empty cache passed explicitly is used."""
+    cache = {}
+    chain = Chain(object_store, cache=cache)
+    assert chain._cache is cache
+
+    builder = TreeBuilder(object_store)
+    builder['a'] = b'b'
+    tree = Tree(object_store, builder.commit().root, cache=cache)
+    assert tree._cache is cache
+
+
+def test_cache_shared_by_chains_and_trees(object_store):
+    """Check that one cache can serve several views."""
+    cache = LRUCache(max_items=100)
+
+    chain = Chain(object_store, cache=cache)
+    block_builder = BlockBuilder(chain)
+    for i in range(5):
+        block_builder.payload = b'Block %d' % i
+        block_builder.commit()
+
+    tree_builder = TreeBuilder(object_store)
+    tree_builder[b'key'] = b'value'
+    root = tree_builder.commit().root
+
+    other_chain = Chain(object_store, head=chain.head, cache=cache)
+    tree = Tree(object_store, root, cache=cache)
+    other_tree = Tree(object_store, root, cache=cache)
+
+    assert other_chain[0].payload == b'Block 0'
+    assert tree[b'key'] == b'value'
+    hits = cache.stats.hits
+    assert other_tree[b'key'] == b'value'
+    assert cache.stats.hits > hits
+
+
+def test_default_cache(object_store):
+    """Check that the default cache is used when none is passed."""
+    cache = LRUCache()
+    with CacheParams(cache=cache).as_default():
+        assert Chain(object_store)._cache is cache
+        assert Tree(object_store, root=None)._cache is cache
+
+    first, second = Chain(object_store), Chain(object_store)
+    assert first._cache is not cache
+    assert first._cache is not second._cache
@@ -1,12 +1,14 @@
 import pytest
 import math
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from hippiepug.struct import ChainBlock
 from hippiepug.chain import Chain, BlockBuilder
 from hippiepug.chain import verify_chain_inclusion_proof
-from hippiepug.store import IntegrityValidationError
+from hippiepug.chain import verify_chain_multi_proof
+from hippiepug.chain import verify_chain_proof, verify_chain_proofs
+from hippiepug.store import IntegrityValidationError, Sha256DictStore
 from hippiepug.pack import encode, decode
 
 
@@ -63,6 +65,31 @@ def test_builder_skipchain_fingers(chain_and_hashes):
     assert 1 <= len(fingers) <= upper_bound_num_fingers
 
 
+def test_chain_lookup_with_other_finger_layout(object_store):
+    """Check that lookups follow fingers that are not at their slots."""
+    hashes = []
+    for i in range(20):
+        # Fingers to all the previous blocks, oldest first.
+        block = ChainBlock(payload='Block {}'.format(i), index=i,
+                           fingers=[[j, hashes[j]] for j in range(i)])
+        hashes.append(object_store.add(encode(block)))
+    chain = Chain(object_store, head=hashes[-1])
+    assert [chain[i].index for i in range(20)] == list(range(20))
+
+
+def test_builder_fingers_match_skipchain_indices(object_store):
+    chain = Chain(object_store)
+    chain.extend(['Block {}'.format(i) for i in range(300)])
+    for block in chain:
+        finger_indices = BlockBuilder.skipchain_indices(block.index)
+        assert all(index in finger_indices
+                   for index, _ in block.fingers[1:])
+        prev_block = chain.get_block_by_index(max(block.index - 1, 0))
+        assert [index for index, _ in block.fingers[1:]] == [
+                index for index, _ in prev_block.fingers
+                if index in finger_indices and block.index > 0]
+
+
 @pytest.mark.parametrize('chain_size', CHAIN_SIZES)
 def test_builder_commit_blocks(block_builder, chain_size):
     """Commit couple of blocks and check that the chain head moves."""
@@ -89,6 +116,72 @@ def test_builder_commit_blocks(block_builder, chain_size):
                 encode(block))
 
 
+@pytest.mark.parametrize('num_existing', [0, 1, 5])
+def test_builder_commit_many(object_store, num_existing):
+    """Check that batched commits make the same chain as single ones."""
+    payloads = ['Block {}'.format(i) for i in range(num_existing + 50)]
+    expected_chain = Chain(Sha256DictStore())
+    expected_builder = BlockBuilder(expected_chain)
+    for payload in payloads:
+        expected_builder.payload = payload
+        expected_builder.commit()
+
+    chain = Chain(object_store)
+    builder = BlockBuilder(chain)
+    for payload in payloads[:num_existing]:
+        builder.payload = payload
+        builder.commit()
+    with patch.object(object_store, 'add_hashed_many',
+                      wraps=object_store.add_hashed_many) as add_many:
+        blocks = builder.commit_many(payloads[num_existing:])
+    assert add_many.call_count == 1
+
+    assert chain.head == expected_chain.head
+    assert [block.payload for block in blocks] == payloads[num_existing:]
+    assert blocks[-1] == chain.head_block
+    assert builder.index == len(payloads)
+    assert builder.fingers == expected_builder.fingers
+    assert Chain(object_store, head=chain.head)[7] == expected_chain[7]
+
+
+def test_builder_commit_many_calls_pre_commit(object_store):
+    class SigningBlockBuilder(BlockBuilder):
+        def pre_commit(self):
+            self.payload = '{}/{}'.format(self.payload, self.index)
+
+    blocks = SigningBlockBuilder(Chain(object_store)).commit_many(
+            ['a', 'b', 'c'])
+    assert [block.payload for block in blocks] == ['a/0', 'b/1', 'c/2']
+
+
+def test_builder_commit_many_leaves_chain_on_failure(chain_and_hashes):
+    chain, hashes = chain_and_hashes
+    builder = BlockBuilder(chain)
+    builder.payload = 'Pending'
+    num_objects = len(chain.object_store._backend)
+
+    def payloads():
+        yield 'Block'
+        raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        builder.commit_many(payloads())
+    assert chain.head == hashes[-1]
+    assert len(chain.object_store._backend) == num_objects
+    assert builder.payload == 'Pending'
+    assert builder.commit().index == len(hashes)
+
+
+def test_chain_extend(chain_and_hashes):
+    chain, hashes = chain_and_hashes
+    assert chain.extend([]) == []
+    assert chain.head == hashes[-1]
+    blocks = chain.extend(['Extra {}'.format(i) for i in range(10)])
+    assert chain.head_block == blocks[-1]
+    assert [block.payload for block in chain.iter_range(len(hashes))] == \
+        ['Extra {}'.format(i) for i in range(10)]
+
+
 def test_empty_chain(object_store):
     """Check that empty chain raises only the expected error."""
     chain = Chain(object_store)
@@ -102,10 +195,9 @@ def test_chain_get_block_by_hash_from_cache(chain_and_hashes):
     """Check that blocks are retrievable by hashes from cache."""
     chain, hashes = chain_and_hashes
     chain._cache = MagicMock()
-    chain._cache.__contains__.return_value = True
     for i, block_hash in enumerate(hashes):
         block = chain._get_block_by_hash(block_hash)
-        chain._cache.__getitem__.assert_called_with(block_hash)
+        chain._cache.get.assert_called_with(block_hash)
     return block
 
 
@@ -155,16 +247,15 @@ def test_chain_get_block_by_index_from_cache(chain_and_hashes):
     cache_copy = chain._cache.copy()
 
     chain._cache = MagicMock()
-    chain._cache.__contains__.return_value = True
 
-    def mock_getitem(k):
+    def mock_get(k):
         return cache_copy[k]
 
-    chain._cache.__getitem__.side_effect = mock_getitem
+    chain._cache.get.side_effect = mock_get
 
     for i, block_hash in enumerate(hashes):
         a = chain.get_block_by_index(i)
-        chain._cache.__getitem__.assert_called_with(block_hash)
+        chain._cache.get.assert_called_with(block_hash)
 
 
 def test_get_block_by_index_from_store(chain_and_hashes):
@@ -195,6 +286,122 @@ def test_chain_iterator(chain_and_hashes):
         assert block_hash == expected_block_hash
 
 
+def test_chain_iterator_one_read_per_block(chain_and_hashes):
+    """Check that iteration retrieves each block from the store once."""
+    chain, hashes = chain_and_hashes
+    chain._cache.clear()
+    store = chain.object_store
+    with patch.object(store, 'get', wraps=store.get) as get:
+        blocks = list(chain)
+    assert [b.index for b in blocks] == list(reversed(range(len(hashes))))
+    assert get.call_count == len(hashes)
+
+
+def test_chain_reversed(chain_and_hashes):
+    """Check iteration oldest block first."""
+    chain, hashes = chain_and_hashes
+    blocks = list(reversed(chain))
+    assert [b.payload for b in blocks] == [
+            'Block {}'.format(i) for i in range(len(hashes))]
+
+
+@pytest.mark.parametrize('prefetch', [1, 3, 1024])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_chain_iter_range(chain_and_hashes, reverse, prefetch):
+    """Check iteration over ranges of blocks."""
+    chain, hashes = chain_and_hashes
+    n = len(hashes)
+    for start, stop in [(0, n), (0, 1), (n // 2, n), (1, n - 1), (n, n)]:
+        if start > stop:
+            continue
+        expected = list(range(start, stop))
+        if reverse:
+            expected = list(reversed(expected))
+        blocks = chain.iter_range(start, stop, reverse=reverse,
+                                  prefetch=prefetch)
+        assert [b.index for b in blocks] == expected
+
+
+def test_chain_iter_range_fails_if_out_of_range(chain_and_hashes):
+    """Check that exception is thrown if the range is out of bounds."""
+    chain, hashes = chain_and_hashes
+    with pytest.raises(IndexError):
+        chain.iter_range(-1)
+    with pytest.raises(IndexError):
+        chain.iter_range(0, len(hashes) + 1)
+
+
+def test_empty_chain_iteration(object_store):
+    """Check that an empty chain has no blocks to iterate over."""
+    chain = Chain(object_store)
+    assert list(chain) == []
+    assert list(reversed(chain)) == []
+
+
+def test_chain_iterator_fails_if_chain_broken(chain_and_hashes):
+    """Check that iteration stops at a missing block."""
+    chain, hashes = chain_and_hashes
+    if len(hashes) < 2:
+        return
+    chain._cache.clear()
+    del chain.object_store._backend[hashes[-2]]
+    with pytest.raises(ValueError):
+        list(chain)
+
+
+def test_chain_get_blocks(chain_and_hashes):
+    """Check batch retrieval against retrieval one by one."""
+    chain, hashes = chain_and_hashes
+    n = len(hashes)
+    indices = [n - 1, 0, n // 2, 0, n // 3]
+    blocks = chain.get_blocks(indices)
+    assert blocks == [chain.get_block_by_index(i) for i in indices]
+    assert chain.get_blocks([]) == []
+
+
+def test_chain_get_blocks_proof(chain_and_hashes):
+    """Check that the union proof is deduplicated and sufficient."""
+    chain, hashes = chain_and_hashes
+    indices = list(range(0, len(hashes), 3))
+    blocks, proof = chain.get_blocks(indices, return_proofs=True)
+
+    proof_hashes = [chain.object_store.hash_object(encode(block))
+                    for block in proof]
+    assert len(proof_hashes) == len(set(proof_hashes))
+    for block in blocks:
+        store = chain.object_store.__class__()
+        assert verify_chain_inclusion_proof(store, chain.head, block, proof)
+
+
+def test_chain_get_blocks_fails_if_out_of_range(chain_and_hashes):
+    """Check that exception is thrown if an index is out of range."""
+    chain, hashes = chain_and_hashes
+    with pytest.raises(IndexError):
+        chain.get_blocks([0, len(hashes)])
+
+
+def test_chain_get_blocks_empty(object_store):
+    """Check batch retrieval from an empty chain."""
+    chain = Chain(object_store)
+    assert chain.get_blocks([0, 1]) == [None, None]
+    assert chain.get_blocks([0], return_proofs=True) == ([None], [])
+
+
+def test_chain_proofs_are_logarithmic(object_store):
+    """Check that lookups only walk a logarithmic number of blocks."""
+    chain = Chain(object_store)
+    block_builder = BlockBuilder(chain)
+    n = 1000
+    for i in range(n):
+        block_builder.payload = 'Block {}'.format(i)
+        block_builder.commit()
+
+    max_proof_size = 2 * math.ceil(math.log(n, 2)) + 1
+    for i in range(n):
+        _, proof = chain.get_block_by_index(i, return_proof=True)
+        assert len(proof) <= max_proof_size
+
+
 def test_chain_inclusion_proof(object_store):
     """Check returned inclusion proof."""
     chain1 = Chain(object_store)
@@ -270,3 +477,109 @@ def test_chain_proof_verif_malformed(chain_and_hashes):
     with pytest.warns(UserWarning, match='Exception occured'):
         assert not verify_chain_inclusion_proof(
                 store, bad_head, result, proof)
+
+
+def test_chain_multi_proof_verif(chain_and_hashes):
+    """Check multi-proof verification."""
+    chain, hashes = chain_and_hashes
+    indices = list(range(0, len(hashes), 2))
+    blocks = chain.get_blocks(indices)
+    proof = chain.get_multi_proof(indices)
+
+    store = chain.object_store.__class__()
+    assert verify_chain_multi_proof(store, chain.head, blocks, proof)
+
+    # Serialized proof is decoded back as is.
+    proof = decode(encode(proof))
+    store = chain.object_store.__class__()
+    assert verify_chain_multi_proof(store, chain.head, blocks, proof)
+
+
+def test_chain_multi_proof_is_compact(object_store):
+    """Check that multi-proofs are smaller than separate proofs."""
+    chain = Chain(object_store)
+    block_builder = BlockBuilder(chain)
+    for i in range(100):
+        block_builder.payload = 'Block {}'.format(i)
+        block_builder.commit()
+
+    indices = list(range(0, 100, 10))
+    proof = chain.get_multi_proof(indices)
+    separate_proofs_size = sum(
+        len(encode(block)) for i in indices
+        for block in chain.get_block_by_index(i, return_proof=True)[1])
+    assert len(encode(proof)) < separate_proofs_size
+
+
+def test_chain_multi_proof_verif_bad_block(chain_and_hashes):
+    """Check multi-proof verification detects a bad block."""
+    chain, hashes = chain_and_hashes
+    blocks = chain.get_blocks([0])
+    proof = chain.get_multi_proof([0])
+    store = chain.object_store.__class__()
+    bad_block = ChainBlock('non-existent', index=0)
+    assert not verify_chain_multi_proof(
+            store, chain.head, blocks + [bad_block], proof)
+
+
+def test_chain_multi_proof_verif_insufficient(chain_and_hashes):
+    """Check multi-proof verification fails when it's insufficient."""
+    chain, hashes = chain_and_hashes
+    blocks = chain.get_blocks([0])
+    proof = chain.get_multi_proof([0])
+    proof.nodes = proof.nodes[:-1]
+    store = chain.object_store.__class__()
+    assert not verify_chain_multi_proof(store, chain.head, blocks, proof)
+
+
+def test_chain_store_free_proof_verif(chain_and_hashes):
+    """Check store-free proof verification."""
+    chain, hashes = chain_and_hashes
+    for i in range(len(hashes)):
+        block, proof = chain.get_block_by_index(i, return_proof=True)
+        result = verify_chain_proof(chain.head, block, proof)
+        assert result
+        assert result.valid and result.reason is None
+
+
+def test_chain_store_free_proof_verif_multi_proof(chain_and_hashes):
+    """Check store-free verification of blocks with a multi-proof."""
+    chain, hashes = chain_and_hashes
+    indices = list(range(len(hashes)))
+    proof = chain.get_multi_proof(indices)
+    results = verify_chain_proofs(chain.head, chain.get_blocks(indices),
+                                  [proof] * len(indices))
+    assert all(results)
+
+
+def test_chain_store_free_proof_verif_failures(chain_and_hashes):
+    """Check store-free proof verification detects bad proofs."""
+    chain, hashes = chain_and_hashes
+    block, proof = chain.get_block_by_index(0, return_proof=True)
+
+    result = verify_chain_proof(chain.head, ChainBlock('non-existent'), proof)
+    assert not result and 'does not match' in result.reason
+
+    result = verify_chain_proof(chain.head, block, [])
+    assert not result and 'missing' in result.reason
+
+    proof[0].fingers = None
+    bad_head = chain.object_store.hash_object(encode(proof[0]))
+    if block.index != proof[0].index:
+        result = verify_chain_proof(bad_head, block, proof)
+        assert not result and 'malformed' in result.reason
+
+
+def test_chain_store_free_batch_hashes_once(chain_and_hashes):
+    """Check that shared proof blocks are hashed once in a batch."""
+    chain, hashes = chain_and_hashes
+    indices = list(range(len(hashes)))
+    blocks, proofs = zip(*[chain.get_block_by_index(i, return_proof=True)
+                           for i in indices])
+    hash_object = MagicMock(side_effect=chain.object_store.hash_object)
+
+    results = verify_chain_proofs(chain.head, blocks, proofs,
+                                  hash_object=hash_object)
+    assert all(results)
+    unique_blocks = {id(block) for proof in proofs for block in proof}
+    assert hash_object.call_count == len(unique_blocks)
@@ -0,0 +1,236 @@
+import os
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.hashing import Hasher, HEX_HASHER, to_hex
+from hippiepug.hashing import available_algorithms
+from hippiepug.logstore import LogStore, HASHER_FILENAME
+from hippiepug.migrate import migrate_chain, migrate_tree
+from hippiepug.pack import EncodingParams, msgpack_encoder
+from hippiepug.pack import binary_encoder, binary_decoder
+from hippiepug.sqlitestore import SqliteStore
+from hippiepug.store import Sha256DictStore, DictStore
+from hippiepug.tree import Tree, TreeBuilder
+from hippiepug.tree import verify_tree_inclusion_proof
+
+
+BINARY_HASHER = Hasher(digest_size=32, binary=True)
+
+
+@pytest.fixture(params=['dict', 'log', 'sqlite'])
+def binary_store(request, tmp_path):
+    if request.param == 'dict':
+        yield DictStore(hasher=BINARY_HASHER)
+    elif request.param == 'log':
+        store = LogStore(str(tmp_path), hasher=BINARY_HASHER)
+        yield store
+        store.close()
+    else:
+        store = SqliteStore(str(tmp_path / 'objects.db'),
+                            hasher=BINARY_HASHER)
+        yield store
+        store.close()
+
+
+def test_hasher_formats():
+    obj = b'dummy'
+    assert HEX_HASHER(obj) == Sha256DictStore.hash_object(obj)
+    raw_hash = Hasher(binary=True)(obj)
+    assert isinstance(raw_hash, bytes) and len(raw_hash) == 8
+    assert to_hex(raw_hash) == HEX_HASHER(obj)
+    assert HEX_HASHER.to_bytes(HEX_HASHER(obj)) == raw_hash
+    assert HEX_HASHER.from_bytes(raw_hash) == HEX_HASHER(obj)
+
+
+def test_hasher_rejects_malformed_hashes():
+    with pytest.raises(ValueError):
+        HEX_HASHER.to_bytes('not a hash')
+    with pytest.raises(ValueError):
+        BINARY_HASHER.to_bytes('abcd')
+    with pytest.raises(ValueError):
+        Hasher(digest_size=33)
+
+
+@pytest.mark.parametrize('algorithm', available_algorithms())
+def test_hasher_algorithms(algorithm):
+    hasher = Hasher(digest_size=16, binary=True, algorithm=algorithm)
+    assert len(hasher(b'dummy')) == 16
+    assert hasher(b'dummy') != hasher(b'other')
+    assert Hasher.from_spec(hasher.spec) == hasher
+
+
+def test_hasher_algorithms_differ():
+    digests = set(Hasher(32, algorithm=algorithm)(b'dummy')
+                  for algorithm in available_algorithms())
+    assert len(digests) == len(available_algorithms())
+
+
+@pytest.mark.parametrize('spec', ['sha256', 'sha256/8/oct', 'md5/8/hex',
+                                  'sha256/x/hex', 'blake2s/33/bin'])
+def test_hasher_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        Hasher.from_spec(spec)
+
+
+def test_hasher_needs_blake3_package():
+    if 'blake3' in available_algorithms():
+        pytest.skip('blake3 is installed')
+    with pytest.raises(ValueError):
+        Hasher(algorithm='blake3')
+
+
+def test_log_store_records_hasher(tmp_path):
+    path = str(tmp_path)
+    hasher = Hasher(digest_size=32, binary=True, algorithm='blake2b')
+    with LogStore(path, hasher=hasher) as store:
+        obj_hash = store.add(b'dummy')
+
+    with LogStore(path) as store:
+        assert store.hasher == hasher
+        assert store.get(obj_hash) == b'dummy'
+    with LogStore(path, hasher=hasher) as store:
+        assert store.get(obj_hash) == b'dummy'
+    with pytest.raises(ValueError):
+        LogStore(path, hasher=HEX_HASHER)
+
+
+def test_log_store_without_recorded_hasher(tmp_path):
+    """Check that stores made before hashers were recorded use hex."""
+    path = str(tmp_path)
+    with LogStore(path) as store:
+        obj_hash = store.add(b'dummy')
+    os.remove(os.path.join(path, HASHER_FILENAME))
+
+    with pytest.raises(ValueError):
+        LogStore(path, hasher=BINARY_HASHER)
+    with LogStore(path) as store:
+        assert store.hasher == HEX_HASHER
+        assert store.get(obj_hash) == b'dummy'
+    assert os.path.exists(os.path.join(path, HASHER_FILENAME))
+
+
+def test_sqlite_store_records_hasher(tmp_path):
+    path = str(tmp_path / 'objects.db')
+    hasher = Hasher(digest_size=16, algorithm='blake2s')
+    with SqliteStore(path, hasher=hasher) as store:
+        obj_hash = store.add(b'dummy')
+
+    with SqliteStore(path) as store:
+        assert store.hasher == hasher
+        assert store.get(obj_hash) == b'dummy'
+    with pytest.raises(ValueError):
+        SqliteStore(path, hasher=BINARY_HASHER)
+
+    with SqliteStore(path) as store:
+        store._conn.execute('DELETE FROM meta')
+    with pytest.raises(ValueError):
+        SqliteStore(path, hasher=hasher)
+
+
+def test_binary_store_backs_chain_and_tree(binary_store):
+    """Check that chains and trees work with raw binary hashes."""
+    chain = Chain(binary_store)
+    builder = BlockBuilder(chain)
+    for i in range(20):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    assert isinstance(chain.head, bytes) and len(chain.head) == 32
+    assert Chain(binary_store, head=chain.head)[3].payload == b'Block 3'
+
+    tree_builder = TreeBuilder(binary_store)
+    for i in range(100):
+        tree_builder[b'%d' % i] = b'value %d' % i
+    tree = tree_builder.commit()
+    value, proof = Tree(binary_store, tree.root).get_value_by_lookup_key(
+            b'42', return_proof=True)
+    assert value == b'value 42'
+    assert verify_tree_inclusion_proof(DictStore(hasher=BINARY_HASHER),
+                                       tree.root, b'42', value, proof)
+
+
+def test_sqlite_store_binary_refs(tmp_path):
+    path = str(tmp_path / 'objects.db')
+    with SqliteStore(path, hasher=BINARY_HASHER) as store:
+        obj_hash = store.add(b'dummy')
+        store.set_ref('latest', obj_hash)
+        assert store.get_ref('latest') == obj_hash
+        assert 'abcd' not in store
+        with pytest.raises(ValueError):
+            store.add_hashed('abcd', b'dummy')
+
+
+def test_migrate_chain():
+    source = Sha256DictStore()
+    chain = Chain(source)
+    builder = BlockBuilder(chain)
+    heads = []
+    for i in range(30):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+        heads.append(chain.head)
+
+    target = DictStore(hasher=BINARY_HASHER)
+    memo = {}
+    old_head = migrate_chain(source, heads[9], target, memo=memo)
+    new_head = migrate_chain(source, chain.head, target, memo=memo)
+    assert memo[heads[9]] == old_head
+    assert len(target._backend) == 30
+
+    migrated = Chain(target, head=new_head)
+    assert [block.payload for block in migrated] == \
+           [block.payload for block in Chain(source, head=chain.head)]
+    assert migrated.get_block_by_index(9, return_proof=True)[0].payload == \
+           b'Block 9'
+    assert migrate_chain(source, None, target) is None
+
+
+def test_migrate_tree():
+    source = Sha256DictStore()
+    builder = TreeBuilder(source)
+    for i in range(100):
+        builder[b'%d' % i] = b'value %d' % i
+    root = builder.commit().root
+
+    target = DictStore(hasher=BINARY_HASHER)
+    new_root = migrate_tree(source, root, target)
+    tree = Tree(target, new_root)
+    assert [tree[b'%d' % i] for i in range(100)] == \
+           [b'value %d' % i for i in range(100)]
+    assert len(target._backend) == len(source._backend)
+
+
+def test_migrate_with_codecs():
+    """Check that migration decodes and encodes with the bound codecs."""
+    binary_params = EncodingParams(encoder=binary_encoder,
+                                   decoder=binary_decoder)
+    source = Sha256DictStore(encoding=binary_params)
+    chain = Chain(source)
+    chain.extend([b'Block %d' % i for i in range(10)])
+    tree_builder = TreeBuilder(source)
+    for i in range(10):
+        tree_builder[b'%d' % i] = b'value %d' % i
+    root = tree_builder.commit().root
+
+    # From the codec bound to the source to the default one.
+    target = DictStore(hasher=BINARY_HASHER)
+    head = migrate_chain(source, chain.head, target)
+    new_root = migrate_tree(source, root, target)
+    assert target.get(head) == msgpack_encoder(Chain(target, head)[9])
+    assert Chain(target, head)[3].payload == b'Block 3'
+    assert Tree(target, new_root)[b'3'] == b'value 3'
+
+    # And back, with explicit codecs.
+    other = Sha256DictStore()
+    assert migrate_chain(target, head, other,
+                         target_encoding=binary_params) == chain.head
+    assert migrate_tree(target, new_root, other,
+                        target_encoding=binary_params) == root
+
+
+def test_migrate_tree_rejects_bad_roots():
+    source = Sha256DictStore()
+    with pytest.raises(ValueError):
+        migrate_tree(source, source.hash_object(b'missing'), DictStore())
+    value_hash = source.add(b'not a node')
+    with pytest.raises(ValueError):
+        migrate_tree(source, value_hash, DictStore())
@@ -0,0 +1,146 @@
+import pytest
+
+from mock import patch
+
+from hippiepug.integrity import IntegrityPolicy, IntegrityStats
+from hippiepug.integrity import CHECK_ALWAYS, CHECK_ONCE, CHECK_SAMPLED
+from hippiepug.integrity import CHECK_TRUSTED
+from hippiepug.logstore import LogStore
+from hippiepug.sqlitestore import SqliteStore
+from hippiepug.store import Sha256DictStore, IntegrityValidationError
+from hippiepug.tree import Tree, TreeBuilder
+
+
+def _make_store(kind, path, policy):
+    if kind == 'dict':
+        return Sha256DictStore(integrity=policy)
+    if kind == 'log':
+        return LogStore(path, integrity=policy)
+    return SqliteStore(path + '/objects.db', integrity=policy)
+
+
+@pytest.fixture(params=['dict', 'log', 'sqlite'])
+def store_kind(request):
+    return request.param
+
+
+def _corrupt(store):
+    """Add an object under a wrong hash."""
+    wrong_hash = store.hash_object(b'other')
+    store.add_hashed(wrong_hash, b'dummy')
+    return wrong_hash
+
+
+def test_check_always(store_kind, tmp_path):
+    policy = IntegrityPolicy(CHECK_ALWAYS)
+    store = _make_store(store_kind, str(tmp_path), policy)
+    obj_hash = store.add(b'dummy')
+    for _ in range(3):
+        assert store.get(obj_hash) == b'dummy'
+    with pytest.raises(IntegrityValidationError):
+        store.get(_corrupt(store))
+    assert policy.stats == IntegrityStats(checked=3, skipped=0, failed=1)
+
+
+def test_check_once(store_kind, tmp_path):
+    policy = IntegrityPolicy(CHECK_ONCE)
+    store = _make_store(store_kind, str(tmp_path), policy)
+    obj_hash = store.add(b'dummy')
+    assert store.get_many([obj_hash] * 3) == [b'dummy'] * 3
+    assert policy.stats == IntegrityStats(checked=1, skipped=2, failed=0)
+    assert policy.stats.skip_rate == 2 / 3
+
+    # Failed objects are not remembered.
+    wrong_hash = _corrupt(store)
+    for _ in range(2):
+        with pytest.raises(IntegrityValidationError):
+            store.get(wrong_hash)
+    assert policy.stats.failed == 2
+
+    policy.forget()
+    policy.reset_stats()
+    store.get(obj_hash)
+    assert policy.stats.checked == 1
+
+
+def test_check_once_is_per_store(store_kind, tmp_path):
+    """Check that a shared policy still checks objects of another store."""
+    policy = IntegrityPolicy(CHECK_ONCE)
+    store = Sha256DictStore(integrity=policy)
+    obj_hash = store.add(b'dummy')
+    assert store.get(obj_hash) == b'dummy'
+
+    other_store = _make_store(store_kind, str(tmp_path), policy)
+    other_store.add_hashed(obj_hash, b'corrupted')
+    with pytest.raises(IntegrityValidationError):
+        other_store.get(obj_hash)
+    assert store.get(obj_hash) == b'dummy'
+    assert policy.stats == IntegrityStats(checked=1, skipped=1, failed=1)
+
+
+def test_check_once_is_bounded():
+    policy = IntegrityPolicy(CHECK_ONCE, max_verified=2)
+    store = Sha256DictStore(integrity=policy)
+    hashes = [store.add(b'obj %d' % i) for i in range(3)]
+    store.get_many(hashes)
+    assert len(policy._verified) == 2
+    # The oldest hash was forgotten, and is checked again.
+    store.get(hashes[0])
+    assert policy.stats == IntegrityStats(checked=4, skipped=0, failed=0)
+    store.get(hashes[2])
+    assert policy.stats.skipped == 1
+
+
+def test_check_sampled():
+    policy = IntegrityPolicy(CHECK_SAMPLED, sample_rate=0.25, seed=0)
+    store = Sha256DictStore(integrity=policy)
+    obj_hash = store.add(b'dummy')
+    for _ in range(1000):
+        store.get(obj_hash)
+    stats = policy.stats
+    assert stats.checked + stats.skipped == 1000
+    assert 150 < stats.checked < 350
+
+
+def test_check_trusted(store_kind, tmp_path):
+    policy = IntegrityPolicy(CHECK_TRUSTED)
+    store = _make_store(store_kind, str(tmp_path), policy)
+    assert store.get(_corrupt(store)) == b'dummy'
+    assert policy.stats == IntegrityStats(checked=0, skipped=1, failed=0)
+
+
+def test_check_integrity_false_bypasses_policy():
+    policy = IntegrityPolicy(CHECK_ALWAYS)
+    store = Sha256DictStore(integrity=policy)
+    store.get(store.add(b'dummy'), check_integrity=False)
+    assert policy.stats == IntegrityStats()
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(mode='sometimes'),
+    dict(mode=CHECK_ONCE, max_verified=0),
+    dict(mode=CHECK_SAMPLED, sample_rate=2),
+])
+def test_policy_rejects_bad_params(kwargs):
+    with pytest.raises(ValueError):
+        IntegrityPolicy(**kwargs)
+
+
+def test_check_once_skips_hashing_in_tree_lookups():
+    """Check that hot tree nodes are hashed only once."""
+    policy = IntegrityPolicy(CHECK_ONCE)
+    store = Sha256DictStore(integrity=policy)
+    builder = TreeBuilder(store)
+    for i in range(100):
+        builder[b'%d' % i] = b'value %d' % i
+    root = builder.commit().root
+
+    with patch.object(Sha256DictStore, 'hash_object',
+                      wraps=Sha256DictStore.hash_object) as hash_object:
+        for _ in range(5):
+            # A fresh view has a cold cache, and retrieves all nodes again.
+            tree = Tree(store, root)
+            assert [tree[b'%d' % i] for i in range(100)] == \
+                   [b'value %d' % i for i in range(100)]
+    assert hash_object.call_count == policy.stats.checked
+    assert policy.stats.skipped == 4 * policy.stats.checked
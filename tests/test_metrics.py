@@ -0,0 +1,130 @@
+import pytest
+
+from hippiepug.cache import LRUCache
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.metrics import Instrumentation, InstrumentedStore
+from hippiepug.metrics import InstrumentedCache, MemorySink, PrometheusSink
+from hippiepug.metrics import CallbackSink, Histogram
+from hippiepug.pack import encode, decode
+from hippiepug.store import Sha256DictStore, IntegrityValidationError
+from hippiepug.tree import Tree, TreeBuilder
+
+
+@pytest.fixture
+def sink():
+    return MemorySink()
+
+
+@pytest.fixture
+def instrumentation(sink):
+    return Instrumentation(sinks=[sink])
+
+
+@pytest.fixture
+def store(instrumentation):
+    return InstrumentedStore(Sha256DictStore(), instrumentation)
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(1.0, 2.0))
+    for seconds in [0.5, 1.0, 1.5, 3.0]:
+        histogram.observe(seconds)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.total == 6.0
+
+
+def test_instrumented_store_records_operations(store, sink):
+    obj_hash = store.add(b'dummy')
+    assert store.get(obj_hash) == b'dummy'
+    assert store.get_many([obj_hash, 'missing']) == [b'dummy', None]
+    assert obj_hash in store
+    store.add_many([b'obj %d' % i for i in range(3)])
+
+    assert sink.counters == {
+        'hash_object': 6,
+        'store.add': 1,
+        'store.add_many': 1,
+        'store.get': 1,
+        'store.get_many': 1,
+        'store.miss': 1,
+        'store.contains': 1,
+    }
+    assert sink.histograms['store.get'].count == 1
+    assert 'store.miss' not in sink.histograms
+
+
+def test_instrumented_store_checks_integrity(store):
+    obj_hash = store.hash_object(b'other')
+    store.add_hashed(obj_hash, b'dummy')
+    with pytest.raises(IntegrityValidationError):
+        store.get(obj_hash)
+    with pytest.raises(IntegrityValidationError):
+        store.get_many([obj_hash])
+    assert store.get(obj_hash, check_integrity=False) == b'dummy'
+
+
+def test_instrumented_cache_records_hits(instrumentation, sink):
+    cache = InstrumentedCache(LRUCache(2), instrumentation)
+    cache['a'] = 1
+    assert cache.get('a') == 1
+    assert cache.get('b', 'default') == 'default'
+    assert 'a' in cache and len(cache) == 1
+    assert sink.counters == {'cache.hit': 1, 'cache.miss': 1}
+    # Attributes of the wrapped cache are passed through.
+    assert cache.stats.hits == 1
+
+
+def test_instrumented_encoding(instrumentation, sink):
+    with instrumentation.encoding_params().as_default():
+        assert decode(encode(b'dummy')) == b'dummy'
+    encode(b'dummy')
+    assert sink.counters == {'encode': 1, 'decode': 1}
+
+
+def test_instrumented_views(store, instrumentation, sink):
+    """Check that chains and trees work on instrumented components."""
+    chain = Chain(store)
+    builder = BlockBuilder(chain)
+    for i in range(10):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    tree_builder = TreeBuilder(store)
+    for i in range(10):
+        tree_builder[b'%d' % i] = b'value %d' % i
+    root = tree_builder.commit().root
+
+    sink.reset()
+    cache = InstrumentedCache({}, instrumentation)
+    chain = Chain(store, head=chain.head, cache=cache)
+    assert chain[3].payload == b'Block 3'
+    tree = Tree(store, root, cache=cache)
+    assert tree[b'4'] == b'value 4'
+    assert tree[b'4'] == b'value 4'
+    assert sink.counters['cache.hit'] > 0
+    assert sink.counters['cache.miss'] > 0
+    assert sink.counters['hash_object'] > 0
+
+
+def test_callback_sink(store):
+    records = []
+    store.instrumentation.sinks.append(
+            CallbackSink(lambda op, seconds: records.append(op)))
+    store.add(b'dummy')
+    assert records == ['hash_object', 'store.add']
+
+
+def test_prometheus_sink_render():
+    sink = PrometheusSink(prefix='test', buckets=(0.1, 1.0))
+    sink.record('store.get', 0.05)
+    sink.record('store.get', 0.5)
+    sink.record('cache.hit')
+    lines = sink.render().splitlines()
+    assert 'test_operations_total{op="cache.hit"} 1' in lines
+    assert 'test_operations_total{op="store.get"} 2' in lines
+    assert 'test_operation_seconds_bucket{op="store.get",le="0.1"} 1' \
+            in lines
+    assert 'test_operation_seconds_bucket{op="store.get",le="+Inf"} 2' \
+            in lines
+    assert 'test_operation_seconds_count{op="store.get"} 2' in lines
+    assert 'test_operation_seconds_sum{op="store.get"} 0.55' in lines
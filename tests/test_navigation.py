@@ -0,0 +1,62 @@
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.navigation import finger_indices, finger_slot
+from hippiepug.navigation import next_hop, lookup_path
+from hippiepug.store import Sha256DictStore
+
+
+@pytest.mark.parametrize('index', list(range(300)) + [10**7 - 1, 2**40 + 3])
+def test_finger_indices_match_skipchain_indices(index):
+    fingers = finger_indices(index)
+    assert set(fingers) == BlockBuilder.skipchain_indices(index)
+    assert list(fingers) == sorted(fingers, reverse=True)
+    for slot, finger_index in enumerate(fingers):
+        assert finger_slot(index, finger_index) == slot
+
+
+@pytest.mark.parametrize('index,finger_index', [
+    (0, 0), (13, 13), (13, 11), (13, 4), (13, -1),
+])
+def test_finger_slot_raises_when_no_finger(index, finger_index):
+    with pytest.raises(ValueError):
+        finger_slot(index, finger_index)
+
+
+@pytest.mark.parametrize('from_index', range(1, 130))
+def test_next_hop_is_smallest_finger_not_beyond_target(from_index):
+    fingers = finger_indices(from_index)
+    for to_index in range(from_index):
+        hop_index = min(f for f in fingers if f >= to_index)
+        assert next_hop(from_index, to_index) == (
+                hop_index, fingers.index(hop_index))
+
+
+@pytest.mark.parametrize('from_index,to_index', [
+    (0, 0), (5, 5), (5, 6), (5, -1),
+])
+def test_next_hop_raises_when_target_not_before(from_index, to_index):
+    with pytest.raises(ValueError):
+        next_hop(from_index, to_index)
+
+
+def test_lookup_path():
+    assert lookup_path(0, 0) == [0]
+    assert lookup_path(13, 13) == [13]
+    assert lookup_path(13, 12) == [13, 12]
+    assert lookup_path(2**20 + 1, 0) == [2**20 + 1, 0]
+    assert lookup_path(2**20 + 2, 2**20) == [2**20 + 2, 2**20]
+    path = lookup_path(10**7, 12345)
+    assert path[0] == 10**7 and path[-1] == 12345
+    assert all(a > b for a, b in zip(path, path[1:]))
+    assert len(path) <= 2 * (10**7).bit_length()
+    with pytest.raises(ValueError):
+        lookup_path(3, 4)
+
+
+def test_lookup_path_matches_chain_walk():
+    chain = Chain(Sha256DictStore())
+    chain.extend(['Block {}'.format(i) for i in range(200)])
+    for index in range(0, 200, 7):
+        _, proof = chain.get_block_by_index(index, return_proof=True)
+        assert [block.index for block in proof] == lookup_path(199, index)
@@ -1,13 +1,31 @@
+import threading
+
 import pytest
 
+import attr
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.chain import verify_chain_inclusion_proof
+from hippiepug.chain import verify_chain_multi_proof
+from hippiepug.chain import verify_chain_proof, verify_chain_proofs
 from hippiepug.pack import encode, decode
-from hippiepug.pack import EncodingParams
+from hippiepug.pack import EncodingParams, msgpack_frozen_decoder
+from hippiepug.pack import msgpack_encoder, binary_encoder, binary_decoder
+from hippiepug.pack import binary_frozen_decoder, BINARY_MAGIC
+from hippiepug.pack import BINARY_PROTO_VERSION
+from hippiepug.tree import Tree, TreeBuilder, verify_tree_inclusion_proof
+from hippiepug.tree import verify_tree_multi_proof, verify_tree_range_proof
+from hippiepug.tree import verify_tree_proof, verify_tree_proofs
+from hippiepug.store import Sha256DictStore, DictStore
+from hippiepug.struct import MultiProof, ChainBlock, TreeNode, TreeLeaf
+from hippiepug.struct import FrozenChainBlock, Fingers, freeze
 
 
 @pytest.mark.parametrize('obj', [
     pytest.lazy_fixture('node'),
     pytest.lazy_fixture('leaf'),
     pytest.lazy_fixture('block'),
+    MultiProof(nodes=[b'first', b'second']),
     b'binary string'
 ])
 def test_msgpack_serialization(obj):
@@ -18,6 +36,51 @@ def test_msgpack_serialization(obj):
     assert a == b
 
 
+@pytest.mark.parametrize('obj', [
+    ChainBlock(payload=b'payload', index=3, fingers=[[2, 'ab'], [0, 'cd']]),
+    TreeNode(pivot_prefix='test', left_hash='ab', right_hash='cd'),
+    TreeLeaf(lookup_key='test', payload_hash='ab'),
+])
+def test_frozen_serialization(obj):
+    """Check that frozen variants are equal and serialize identically."""
+    frozen = freeze(obj)
+    assert frozen == obj and obj == frozen
+    assert not frozen != obj
+    assert hash(frozen) == hash(freeze(obj))
+    assert encode(frozen) == encode(obj)
+
+    decoded = msgpack_frozen_decoder(encode(obj))
+    assert decoded.__class__ is frozen.__class__
+    assert decoded == obj
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        decoded.pivot_prefix = None
+
+
+def test_compact_fingers():
+    fingers = Fingers([[2, 'ab'], [0, 'cd']])
+    assert list(fingers) == [(2, 'ab'), (0, 'cd')]
+    assert fingers[0] == (2, 'ab')
+    assert fingers[1:] == [[0, 'cd']]
+    assert fingers == Fingers(fingers)
+    assert fingers != [[2, 'ab']]
+    assert fingers != 42
+    assert len(fingers) == 2
+    assert FrozenChainBlock(b'', fingers=[[0, 'ab']]).fingers == [[0, 'ab']]
+
+
+def test_chain_with_frozen_blocks():
+    """Check that chains work with frozen blocks in the cache."""
+    chain = Chain(Sha256DictStore())
+    builder = BlockBuilder(chain)
+    with EncodingParams(decoder=msgpack_frozen_decoder).as_default():
+        for i in range(20):
+            builder.payload = b'Block %d' % i
+            builder.commit()
+        blocks = list(Chain(chain.object_store, head=chain.head))
+    assert all(isinstance(block, FrozenChainBlock) for block in blocks)
+    assert [block.payload for block in blocks][-3] == b'Block 2'
+
+
 def test_custom_defaults():
     def mock_encoder(obj):
         return b'encoded!'
@@ -41,3 +104,241 @@ def test_decode_raises_when_format_unknown(thing):
     with pytest.raises(ValueError):
         decode(thing)
 
+
+BINARY_OBJS = [
+    ChainBlock(payload=b'payload', index=300,
+               fingers=[[299, 'ab' * 8], [256, 'cd' * 8]]),
+    ChainBlock(payload='text', index=0),
+    ChainBlock(payload=None, index=5, fingers=[[4, b'\x00' * 32]]),
+    ChainBlock(payload={'key': [1, 2]}, index=1, fingers=[[0, 'ab']]),
+    ChainBlock(payload=b'', index=-1),
+    ChainBlock(payload=b'', index=2**40, fingers=[[2**40 - 1, b'ab'],
+                                                  [-2**15, b'cd']]),
+    TreeNode(pivot_prefix='test', left_hash='ab', right_hash='cd'),
+    TreeNode(pivot_prefix=b'\xff' * 200, left_hash=b'ab', right_hash=b'cd'),
+    TreeLeaf(lookup_key='k\u00e9y', payload_hash='0123456789abcdef'),
+    MultiProof(nodes=[b'first', b'second']),
+    b'binary string',
+    'text',
+    None,
+]
+
+
+@pytest.mark.parametrize('obj', BINARY_OBJS)
+def test_binary_serialization(obj):
+    """Check binary serialization correctness."""
+    serialized = binary_encoder(obj)
+    assert serialized[0] == BINARY_MAGIC
+    assert binary_decoder(serialized) == obj
+    if isinstance(obj, ChainBlock):
+        assert isinstance(binary_decoder(serialized).fingers, Fingers)
+    if isinstance(obj, (ChainBlock, TreeNode, TreeLeaf)):
+        frozen = binary_frozen_decoder(serialized)
+        assert frozen.__class__ is freeze(obj).__class__
+        assert frozen == obj
+
+
+def test_binary_serialization_is_compact():
+    """Check that objects with full-width hex hashes take less space."""
+    digest = 'ab' * 32
+    for obj in [
+            ChainBlock(payload=b'payload', index=300,
+                       fingers=[[299, digest], [298, digest], [296, digest]]),
+            TreeNode(pivot_prefix='test', left_hash=digest,
+                     right_hash=digest),
+            TreeLeaf(lookup_key='test', payload_hash=digest)]:
+        assert len(binary_encoder(obj)) < len(msgpack_encoder(obj))
+
+
+@pytest.mark.parametrize('obj', [
+    TreeNode(pivot_prefix='test'),
+    TreeNode(pivot_prefix='test', left_hash='ab', right_hash=b'cd'),
+    TreeNode(pivot_prefix='test', left_hash='ab', right_hash='abcd'),
+    TreeLeaf(lookup_key='test', payload_hash='AB'),
+    ChainBlock(payload=b'', index=2**63),
+    ChainBlock(payload=b'', index=1, fingers=[[0, 'ab'], [2**63, 'cd']]),
+    ChainBlock(payload=b'', index=2, fingers=[[1, 'ab'], [0, 'abcd']]),
+    MultiProof(nodes=['not bytes']),
+])
+def test_binary_encoder_falls_back_to_msgpack(obj):
+    """Check that objects without a binary layout are still serialized."""
+    serialized = binary_encoder(obj)
+    assert serialized == msgpack_encoder(obj)
+    assert binary_decoder(serialized) == obj
+
+
+def test_binary_decoder_reads_msgpack():
+    block = ChainBlock(payload=b'payload', index=1, fingers=[[0, 'ab']])
+    assert binary_decoder(msgpack_encoder(block)) == block
+    assert binary_frozen_decoder(msgpack_encoder(block)) == block
+
+
+@pytest.mark.parametrize('serialized', [
+    b'',
+    bytes([BINARY_MAGIC]),
+    bytes([BINARY_MAGIC, 1, 1]),
+    bytes([BINARY_MAGIC, BINARY_PROTO_VERSION, 42]),
+    binary_encoder(TreeLeaf(lookup_key='test', payload_hash='ab'))[:-1],
+    binary_encoder(TreeLeaf(lookup_key='test', payload_hash='ab')) + b'\x00',
+    binary_encoder(ChainBlock(payload=b'', index=200))[:4],
+    binary_encoder(ChainBlock(payload=b'', index=2, fingers=[[1, 'ab']]))[:12],
+    bytes([BINARY_MAGIC, BINARY_PROTO_VERSION, 3, 2, 0, 0, 0, 1, 0xff]),
+    bytes([BINARY_MAGIC, BINARY_PROTO_VERSION, 3, 9, 0, 0, 0, 0]),
+    bytes([BINARY_MAGIC, BINARY_PROTO_VERSION, 4, 0, 0, 0, 1, 0, 0, 0, 5]),
+])
+def test_binary_decoder_raises_when_format_unknown(serialized):
+    with pytest.raises(ValueError):
+        binary_decoder(serialized)
+
+
+def test_chain_and_tree_with_binary_codec():
+    """Check that chains and trees work with the binary codec."""
+    store = Sha256DictStore()
+    with EncodingParams(encoder=binary_encoder,
+                        decoder=binary_decoder).as_default():
+        chain = Chain(store)
+        builder = BlockBuilder(chain)
+        for i in range(20):
+            builder.payload = b'Block %d' % i
+            builder.commit()
+        assert chain.get_block_by_index(3).payload == b'Block 3'
+
+        tree_builder = TreeBuilder(store)
+        for i in range(20):
+            tree_builder['key %d' % i] = b'value %d' % i
+        tree = tree_builder.commit()
+        assert tree['key 7'] == b'value 7'
+        assert store.get(chain.head)[0] == BINARY_MAGIC
+
+
+def test_default_contexts_are_counted():
+    """Check that the fast path is only taken without active contexts."""
+    tagging_params = EncodingParams(encoder=lambda obj: b'tagged')
+    assert EncodingParams._num_contexts == 0
+    with pytest.raises(RuntimeError):
+        with tagging_params.as_default():
+            assert EncodingParams._num_contexts == 1
+            assert encode(b'dummy') == b'tagged'
+            raise RuntimeError()
+    assert EncodingParams._num_contexts == 0
+    assert encode(b'dummy') == msgpack_encoder(b'dummy')
+
+    # A context in one thread does not leak into another one.
+    entered = threading.Event()
+    done = threading.Event()
+
+    def hold_context():
+        with tagging_params.as_default():
+            entered.set()
+            done.wait()
+
+    thread = threading.Thread(target=hold_context)
+    thread.start()
+    entered.wait()
+    try:
+        assert EncodingParams._num_contexts == 1
+        assert encode(b'dummy') == msgpack_encoder(b'dummy')
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_global_default_is_used_on_fast_path():
+    EncodingParams.get_default().encoder = lambda obj: b'mutated'
+    try:
+        assert encode(b'dummy') == b'mutated'
+    finally:
+        EncodingParams.reset_defaults()
+    assert encode(b'dummy') == msgpack_encoder(b'dummy')
+
+
+BINARY_PARAMS = EncodingParams(encoder=binary_encoder, decoder=binary_decoder)
+
+
+@pytest.mark.parametrize('bound_to', ['view', 'store'])
+def test_codec_bound_to_views(bound_to):
+    """Check that chains and trees keep their codec outside contexts."""
+    if bound_to == 'store':
+        store = Sha256DictStore(encoding=BINARY_PARAMS)
+        encoding = None
+    else:
+        store = Sha256DictStore()
+        encoding = BINARY_PARAMS
+
+    chain = Chain(store, encoding=encoding)
+    builder = BlockBuilder(chain)
+    for i in range(10):
+        builder.payload = b'Block %d' % i
+        builder.commit()
+    assert store.get(chain.head)[0] == BINARY_MAGIC
+    assert Chain(store, head=chain.head, encoding=encoding)[3].payload == \
+        b'Block 3'
+    assert Chain(store, encoding=encoding).encoding is encoding
+
+    tree_builder = TreeBuilder(store, encoding=encoding)
+    for i in range(10):
+        tree_builder['key %d' % i] = b'value %d' % i
+    tree = tree_builder.commit()
+    assert store.get(tree.root)[0] == BINARY_MAGIC
+    new_tree = tree.update({'key 3': b'new value'})
+    assert store.get(new_tree.root)[0] == BINARY_MAGIC
+    assert Tree(store, new_tree.root, encoding=encoding)['key 3'] == \
+        b'new value'
+
+    value, proof = tree.get_value_by_lookup_key('key 7', return_proof=True)
+    verification_store = Sha256DictStore(encoding=BINARY_PARAMS)
+    assert verify_tree_inclusion_proof(verification_store, tree.root,
+                                       'key 7', value, proof)
+
+
+def test_verifiers_use_codec():
+    """Check that proofs from views with a bound codec verify."""
+    store = Sha256DictStore(encoding=BINARY_PARAMS)
+    chain = Chain(store)
+    chain.extend([b'Block %d' % i for i in range(20)])
+    tree_builder = TreeBuilder(store)
+    for i in range(20):
+        tree_builder['key %d' % i] = b'value %d' % i
+    tree = tree_builder.commit()
+
+    block, proof = chain.get_block_by_index(5, return_proof=True)
+    multi_proof = chain.get_multi_proof([5])
+    assert not verify_chain_proof(chain.head, block, proof)
+    for chain_proof in [proof, multi_proof]:
+        assert verify_chain_proof(chain.head, block, chain_proof,
+                                  encoding=BINARY_PARAMS)
+        assert verify_chain_proofs(chain.head, [block], [chain_proof],
+                                   encoding=BINARY_PARAMS)[0]
+    assert verify_chain_inclusion_proof(Sha256DictStore(), chain.head,
+                                        block, proof, encoding=BINARY_PARAMS)
+    assert verify_chain_multi_proof(Sha256DictStore(), chain.head, [block],
+                                    multi_proof, encoding=BINARY_PARAMS)
+
+    value, proof = tree.get_value_by_lookup_key('key 7', return_proof=True)
+    multi_proof = tree.get_multi_proof(['key 7'])
+    assert not verify_tree_proof(tree.root, 'key 7', value, proof)
+    for tree_proof in [proof, multi_proof]:
+        assert verify_tree_proof(tree.root, 'key 7', value, tree_proof,
+                                 encoding=BINARY_PARAMS)
+        assert verify_tree_proofs(tree.root, [('key 7', value)],
+                                  [tree_proof], encoding=BINARY_PARAMS)[0]
+    assert verify_tree_inclusion_proof(Sha256DictStore(), tree.root,
+                                       'key 7', value, proof,
+                                       encoding=BINARY_PARAMS)
+    assert verify_tree_multi_proof(Sha256DictStore(), tree.root,
+                                   [('key 7', value)], multi_proof,
+                                   encoding=BINARY_PARAMS)
+    items, proof = tree.get_range('key 1', 'key 2', return_proof=True)
+    assert verify_tree_range_proof(Sha256DictStore(), tree.root, items,
+                                   proof, 'key 1', 'key 2',
+                                   encoding=BINARY_PARAMS)
+
+
+def test_explicit_codec_overrides_store():
+    store = DictStore(encoding=BINARY_PARAMS)
+    tree_builder = TreeBuilder(store, encoding=EncodingParams())
+    tree_builder['key'] = b'value'
+    tree = tree_builder.commit()
+    assert store.get(tree.root) == msgpack_encoder(tree.root_node)
+    # The binary decoder bound to the store also reads msgpack nodes.
+    assert Tree(store, tree.root)['key'] == b'value'
@@ -0,0 +1,416 @@
+import os
+import threading
+import pytest
+
+from mock import patch
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.logstore import LogStore, SYNC_ALWAYS, LOG_FILENAME
+from hippiepug.logstore import INDEX_FILENAME
+from hippiepug.sqlitestore import SqliteStore, BATCH_SIZE
+from hippiepug.store import Sha256DictStore, IntegrityValidationError
+from hippiepug.tree import Tree, TreeBuilder
+
+
+@pytest.fixture(params=['dict', 'log', 'sqlite'])
+def any_store(request, tmp_path):
+    if request.param == 'dict':
+        yield Sha256DictStore()
+    elif request.param == 'log':
+        store = LogStore(str(tmp_path))
+        yield store
+        store.close()
+    else:
+        store = SqliteStore(str(tmp_path / 'objects.db'))
+        yield store
+        store.close()
+
+
+def test_store_add_get(any_store):
+    """Check the basic store contract."""
+    obj = b'dummy'
+    obj_hash = any_store.add(obj)
+    assert obj_hash == any_store.hash_object(obj)
+    assert obj_hash in any_store
+    assert any_store.get(obj_hash) == obj
+    assert any_store.get(obj_hash, check_integrity=False) == obj
+
+
+def test_store_get_view(any_store):
+    """Check that stores return objects as views."""
+    obj_hash = any_store.add(b'dummy')
+    view = any_store.get_view(obj_hash)
+    assert isinstance(view, memoryview)
+    assert view == b'dummy'
+    assert any_store.get_view(any_store.hash_object(b'missing')) is None
+
+
+def test_store_add_is_idempotent(any_store):
+    """Check that adding an object twice returns the same hash."""
+    assert any_store.add(b'dummy') == any_store.add(b'dummy')
+
+
+def test_store_missing(any_store):
+    """Check that missing objects are reported as such."""
+    missing_hash = any_store.hash_object(b'nonexistent')
+    assert missing_hash not in any_store
+    assert any_store.get(missing_hash) is None
+
+
+def test_store_add_hashed(any_store):
+    """Check adding objects with precomputed hashes."""
+    obj = b'dummy'
+    obj_hash = any_store.hash_object(obj)
+    assert any_store.add_hashed(obj_hash, obj) == obj_hash
+    assert any_store.get(obj_hash) == obj
+
+    wrong_hash = any_store.hash_object(b'other')
+    any_store.add_hashed(wrong_hash, obj)
+    with pytest.raises(IntegrityValidationError):
+        any_store.get(wrong_hash)
+    assert any_store.get(wrong_hash, check_integrity=False) == obj
+
+
+def test_store_get_many(any_store):
+    """Check batch retrieval."""
+    hashes = [any_store.add(b'obj %d' % i) for i in range(10)]
+    missing_hash = any_store.hash_object(b'nonexistent')
+    objs = any_store.get_many(hashes + [missing_hash])
+    assert objs == [b'obj %d' % i for i in range(10)] + [None]
+
+
+def test_store_add_many(any_store):
+    """Check batch insertion."""
+    objs = [b'obj %d' % i for i in range(10)]
+    hashes = any_store.add_many(objs + objs[:2])
+    assert hashes == [any_store.hash_object(obj) for obj in objs + objs[:2]]
+    assert any_store.get_many(hashes[:10]) == objs
+
+
+def test_store_add_hashed_many(any_store):
+    """Check batch insertion with precomputed hashes."""
+    objs = [b'obj %d' % i for i in range(10)]
+    hashed_objs = [(any_store.hash_object(obj), obj) for obj in objs]
+    hashes = any_store.add_hashed_many(iter(hashed_objs))
+    assert hashes == [obj_hash for obj_hash, _ in hashed_objs]
+    assert any_store.get_many(hashes) == objs
+
+
+def test_store_contains_many(any_store):
+    """Check batch membership."""
+    hashes = any_store.add_many([b'obj %d' % i for i in range(3)])
+    missing_hash = any_store.hash_object(b'nonexistent')
+    assert any_store.contains_many(hashes + [missing_hash]) == \
+            [True, True, True, False]
+
+
+def test_dict_store_add_does_not_read_values():
+    """Check that adding an object only probes the backend once."""
+    store = Sha256DictStore()
+    with patch.object(store, 'get', wraps=store.get) as get:
+        store.add(b'dummy')
+        store.add(b'dummy')
+    assert get.call_count == 0
+
+
+def test_store_backs_chain_and_tree(any_store):
+    """Check that chains and trees work on top of the store."""
+    chain = Chain(any_store)
+    block_builder = BlockBuilder(chain)
+    for i in range(20):
+        block_builder.payload = b'Block %d' % i
+        block_builder.commit()
+
+    tree_builder = TreeBuilder(any_store)
+    for i in range(100):
+        tree_builder[b'%d' % i] = b'value %d' % i
+    root = tree_builder.commit().root
+
+    assert Chain(any_store, head=chain.head)[3].payload == b'Block 3'
+    assert Tree(any_store, root)[b'42'] == b'value 42'
+
+
+@pytest.fixture
+def log_store_path(tmp_path):
+    return str(tmp_path)
+
+
+def _fill(store, num_objs, offset=0):
+    return [store.add(b'obj %d' % i) for i in range(offset, offset + num_objs)]
+
+
+def test_log_store_persists(log_store_path):
+    """Check that objects survive reopening the store."""
+    with LogStore(log_store_path) as store:
+        hashes = _fill(store, 100)
+    with LogStore(log_store_path) as store:
+        assert len(store) == 100
+        assert store.get_many(hashes) == [b'obj %d' % i for i in range(100)]
+
+
+def test_log_store_recovers_unindexed_tail(log_store_path):
+    """Check that records written after the saved index are recovered."""
+    store = LogStore(log_store_path, sync=SYNC_ALWAYS)
+    hashes = _fill(store, 10)
+    store.save_index()
+    hashes += _fill(store, 10, offset=10)
+    # Simulate a crash: no index is saved on close.
+    store._close_files()
+
+    with LogStore(log_store_path) as store:
+        assert store.get_many(hashes) == [b'obj %d' % i for i in range(20)]
+
+
+def test_log_store_truncates_torn_record(log_store_path):
+    """Check that a partially written record is dropped on recovery."""
+    store = LogStore(log_store_path, sync=1)
+    hashes = _fill(store, 10)
+    store._close_files()
+
+    log_path = os.path.join(log_store_path, LOG_FILENAME)
+    full_size = os.path.getsize(log_path)
+    with open(log_path, 'r+b') as f:
+        f.truncate(full_size - 3)
+
+    with LogStore(log_store_path) as store:
+        assert len(store) == 9
+        assert hashes[-1] not in store
+        assert store.get(hashes[0]) == b'obj 0'
+        # The log is appendable again after truncation.
+        new_hash = store.add(b'new obj')
+    with LogStore(log_store_path) as store:
+        assert store.get(new_hash) == b'new obj'
+        assert len(store) == 10
+
+
+def test_log_store_ignores_corrupt_index(log_store_path):
+    """Check that a corrupt index is rebuilt from the log."""
+    with LogStore(log_store_path) as store:
+        hashes = _fill(store, 10)
+    with open(os.path.join(log_store_path, INDEX_FILENAME), 'r+b') as f:
+        f.seek(10)
+        f.write(b'garbage')
+    with LogStore(log_store_path) as store:
+        assert store.get_many(hashes) == [b'obj %d' % i for i in range(10)]
+
+
+def test_log_store_detects_corrupt_value(log_store_path):
+    """Check that integrity checks catch values corrupted on disk."""
+    with LogStore(log_store_path) as store:
+        obj_hash = store.add(b'dummy')
+        offset, length = store._index[obj_hash]
+    with open(os.path.join(log_store_path, LOG_FILENAME), 'r+b') as f:
+        f.seek(offset)
+        f.write(b'D')
+    with LogStore(log_store_path) as store:
+        with pytest.raises(IntegrityValidationError):
+            store.get(obj_hash)
+
+
+def test_log_store_views_are_not_copied(log_store_path):
+    """Check that views point into the memory map, and outlive it."""
+    store = LogStore(log_store_path)
+    obj_hash = store.add(b'dummy')
+    view = store.get_view(obj_hash)
+    assert view.obj is store._mmap
+
+    # Writes remap the log, and closing the store drops the map.
+    hashes = _fill(store, 100)
+    assert store.get_view(hashes[-1]) is not None
+    store.close()
+    assert view == b'dummy'
+
+
+def test_log_store_views_are_checked(log_store_path):
+    with LogStore(log_store_path) as store:
+        obj_hash = store.add(b'dummy')
+        offset, length = store._index[obj_hash]
+    with open(os.path.join(log_store_path, LOG_FILENAME), 'r+b') as f:
+        f.seek(offset)
+        f.write(b'D')
+    with LogStore(log_store_path) as store:
+        with pytest.raises(IntegrityValidationError):
+            store.get_view(obj_hash)
+        assert store.get_view(obj_hash, check_integrity=False) == b'Dummy'
+
+
+def test_log_store_compaction(log_store_path):
+    """Check that compaction keeps only live objects."""
+    with LogStore(log_store_path) as store:
+        hashes = _fill(store, 100)
+        store.sync()
+        size_before = os.path.getsize(os.path.join(log_store_path,
+                                                   LOG_FILENAME))
+        store.compact(live_hashes=hashes[:10])
+        size_after = os.path.getsize(os.path.join(log_store_path,
+                                                  LOG_FILENAME))
+        assert size_after < size_before / 5
+        assert len(store) == 10
+        assert store.get(hashes[0]) == b'obj 0'
+        assert hashes[50] not in store
+        new_hash = store.add(b'new obj')
+
+    with LogStore(log_store_path) as store:
+        assert len(store) == 11
+        assert store.get(new_hash) == b'new obj'
+        assert store.get(hashes[9]) == b'obj 9'
+
+
+def test_log_store_compaction_crash_before_index(log_store_path):
+    """Check that a crash right after compaction keeps the live objects."""
+    store = LogStore(log_store_path)
+    hashes = _fill(store, 5)
+    # The saved index covers less than the compacted log.
+    store.save_index()
+    hashes += _fill(store, 95, offset=5)
+    with patch.object(store, 'save_index', side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            store.compact(live_hashes=hashes[50:])
+    # Simulate a crash: no index is saved on close.
+    store._close_files()
+
+    with LogStore(log_store_path) as store:
+        assert len(store) == 50
+        assert store.get_many(hashes[50:]) == [
+                b'obj %d' % i for i in range(50, 100)]
+        assert hashes[0] not in store
+
+
+def test_log_store_rejects_unknown_sync_policy(log_store_path):
+    with pytest.raises(ValueError):
+        LogStore(log_store_path, sync='sometimes')
+
+
+def test_log_store_syncs_batch_once(log_store_path):
+    """Check that a batch is synced once under the always-sync policy."""
+    with LogStore(log_store_path, sync=SYNC_ALWAYS) as store:
+        with patch.object(store, 'sync', wraps=store.sync) as sync:
+            store.add_many([b'obj %d' % i for i in range(10)])
+        assert sync.call_count == 1
+
+
+@pytest.fixture
+def sqlite_store_path(tmp_path):
+    return str(tmp_path / 'objects.db')
+
+
+def test_sqlite_store_persists(sqlite_store_path):
+    """Check that objects and refs survive reopening the store."""
+    with SqliteStore(sqlite_store_path) as store:
+        hashes = store.add_many([b'obj %d' % i for i in range(10)])
+        store.set_ref('head', hashes[-1])
+        store.set_ref('root', hashes[0])
+        store.set_ref('root', hashes[1])
+
+    with SqliteStore(sqlite_store_path) as store:
+        assert len(store) == 10
+        assert store.get_many(hashes) == [b'obj %d' % i for i in range(10)]
+        assert store.refs() == {'head': hashes[-1], 'root': hashes[1]}
+        store.delete_ref('head')
+        assert store.get_ref('head') is None
+
+
+def test_sqlite_store_uses_wal(sqlite_store_path):
+    with SqliteStore(sqlite_store_path) as store:
+        mode, = store._conn.execute('PRAGMA journal_mode').fetchone()
+        assert mode == 'wal'
+
+
+def test_sqlite_store_transaction_rollback(sqlite_store_path):
+    """Check that a failed transaction leaves no objects behind."""
+    with SqliteStore(sqlite_store_path) as store:
+        with pytest.raises(RuntimeError):
+            with store.transaction():
+                store.add(b'dummy')
+                with store.transaction():
+                    store.add(b'other')
+                raise RuntimeError()
+        assert len(store) == 0
+
+        with store.transaction():
+            with store.transaction():
+                store.add(b'dummy')
+            assert store._local.depth == 1
+        assert store._local.depth == 0
+        assert len(store) == 1
+
+
+def test_sqlite_store_chain_in_one_transaction(sqlite_store_path):
+    """Check that a batch of block commits can share a transaction."""
+    with SqliteStore(sqlite_store_path) as store:
+        chain = Chain(store)
+        with store.transaction():
+            builder = BlockBuilder(chain)
+            for i in range(10):
+                builder.payload = b'Block %d' % i
+                builder.commit()
+            store.set_ref('head', chain.head)
+
+    with SqliteStore(sqlite_store_path) as store:
+        chain = Chain(store, head=store.get_ref('head'))
+        assert [block.payload for block in chain][-1] == b'Block 0'
+
+
+def test_sqlite_store_tree_commit_in_one_transaction(sqlite_store_path):
+    """Check that a tree commit written in many batches is still atomic."""
+    with SqliteStore(sqlite_store_path) as store:
+        builder = TreeBuilder(store)
+        for i in range(100):
+            builder[b'key %d' % i] = b'value %d' % i
+        add_hashed_many = store.add_hashed_many
+        calls = []
+
+        def fail_third_batch(hashed_objs):
+            calls.append(hashed_objs)
+            if len(calls) == 3:
+                raise RuntimeError()
+            return add_hashed_many(hashed_objs)
+
+        with patch('hippiepug.tree.COMMIT_BATCH_SIZE', 16), \
+                patch.object(store, 'add_hashed_many', fail_third_batch):
+            with pytest.raises(RuntimeError):
+                builder.commit()
+        assert len(store) == 0
+
+        with patch('hippiepug.tree.COMMIT_BATCH_SIZE', 16):
+            tree = builder.commit()
+        assert len(store) == 299
+        assert tree[b'key 7'] == b'value 7'
+
+
+def test_sqlite_store_large_batches(sqlite_store_path):
+    """Check batches larger than the query size limit."""
+    num_objs = 2 * BATCH_SIZE + 1
+    with SqliteStore(sqlite_store_path) as store:
+        objs = [b'obj %d' % i for i in range(num_objs)]
+        hashes = store.add_many(objs)
+        assert store.get_many(hashes) == objs
+        assert all(store.contains_many(hashes))
+
+
+def test_sqlite_store_thread_connections(sqlite_store_path):
+    """Check that every thread gets its own connection."""
+    with SqliteStore(sqlite_store_path) as store:
+        obj_hash = store.add(b'dummy')
+        results = []
+
+        def read():
+            results.append((store._conn, store.get(obj_hash)))
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        conns = set(id(conn) for conn, _ in results)
+        assert len(conns) == 4
+        assert id(store._conn) not in conns
+        assert all(obj == b'dummy' for _, obj in results)
+        assert len(store._connections) == 5
+
+
+def test_sqlite_store_rejects_non_hex_hashes(sqlite_store_path):
+    with SqliteStore(sqlite_store_path) as store:
+        with pytest.raises(ValueError):
+            store.add_hashed('not a hash', b'dummy')
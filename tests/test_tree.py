@@ -1,11 +1,20 @@
+import math
+import random
 import pytest
 
-from mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from mock import MagicMock, patch
 from hashlib import sha256
 
-from hippiepug.tree import TreeBuilder, Tree
+from hippiepug.tree import TreeBuilder, Tree, MAX_DEPTH_FACTOR
 from hippiepug.tree import verify_tree_inclusion_proof
-from hippiepug.pack import encode
+from hippiepug.tree import verify_tree_range_proof
+from hippiepug.tree import verify_tree_multi_proof
+from hippiepug.tree import verify_tree_proof, verify_tree_proofs
+from hippiepug.struct import TreeNode, TreeLeaf
+from hippiepug.pack import EncodingParams, encode, decode
+from hippiepug.pack import msgpack_encoder
 
 
 LOOKUP_KEYS = ['AB', 'AC', 'ZZZ', 'Z']
@@ -59,9 +68,8 @@ def test_builder(populated_tree):
 def test_tree_get_by_hash_from_cache(populated_tree):
     """Check if can retrieve a node by hash from cache."""
     populated_tree._cache = MagicMock()
-    populated_tree._cache.__contains__.return_value = True
     populated_tree._get_node_by_hash(populated_tree.root)
-    populated_tree._cache.__getitem__.assert_called_with(
+    populated_tree._cache.get.assert_called_with(
             populated_tree.root)
 
 
@@ -189,3 +197,576 @@ def test_tree_key_density(object_store, num_keys):
     for i in range(num_keys):
         key = str(i).encode()
         assert tree[key] == sha256(key).digest()
+
+
+def _reference_root(object_store, items):
+    """Root hash as computed by the original slicing builder."""
+    def make_subtree(items):
+        if len(items) == 1:
+            (key, serialized_obj), = items
+            value_hash = object_store.hash_object(serialized_obj)
+            return TreeLeaf(lookup_key=key, payload_hash=value_hash)
+        middle = len(items) // 2
+        left = make_subtree(items[:middle])
+        right = make_subtree(items[middle:])
+        return TreeNode(pivot_prefix=items[middle][0],
+                        left_hash=object_store.hash_object(encode(left)),
+                        right_hash=object_store.hash_object(encode(right)))
+
+    root_node = make_subtree(sorted(items.items(), key=lambda t: t[0]))
+    return object_store.hash_object(encode(root_node))
+
+
+@pytest.mark.parametrize('num_keys', [1, 2, 3, 7, 100, 1000])
+def test_builder_root_matches_reference(object_store, num_keys):
+    """Check that the bulk builder produces the same roots as before."""
+    builder = TreeBuilder(object_store)
+    for i in range(num_keys):
+        builder[str(i)] = str(i).encode()
+    tree = builder.commit()
+    assert tree.root == _reference_root(object_store, builder.items)
+
+
+def test_builder_hashes_each_object_once(object_store):
+    """Check that every node and value is hashed and stored only once."""
+    num_keys = 100
+    builder = TreeBuilder(object_store)
+    for i in range(num_keys):
+        builder[str(i)] = str(i).encode()
+
+    with patch.object(object_store, 'hash_object',
+                      wraps=object_store.hash_object) as hash_object, \
+         patch.object(object_store, 'add',
+                      wraps=object_store.add) as add, \
+         patch.object(object_store, 'add_hashed_many',
+                      wraps=object_store.add_hashed_many) as add_hashed_many:
+        builder.commit()
+
+    # n values, n leaves and n - 1 inner nodes.
+    assert hash_object.call_count == 3 * num_keys - 1
+    assert add.call_count == 0
+    assert add_hashed_many.call_count == 1
+    assert len(object_store._backend) == 3 * num_keys - 1
+
+
+@pytest.mark.parametrize('update', [False, True])
+def test_builder_commits_in_bounded_batches(object_store, update):
+    """Check that a commit puts objects into the store in bounded batches."""
+    batch_size = 16
+    items = {str(i): str(i).encode() for i in range(200)}
+
+    def make_builder():
+        builder = TreeBuilder(object_store)
+        if update:
+            builder.items.update(
+                    {key: items[key] for key in sorted(items)[::4]})
+            builder = TreeBuilder.from_tree(builder.commit())
+        builder.items.update(items)
+        return builder
+
+    expected_root = make_builder().commit().root
+    builder = make_builder()
+    with patch.object(object_store, 'add_hashed_many',
+                      wraps=object_store.add_hashed_many) as add_hashed_many, \
+            patch('hippiepug.tree.COMMIT_BATCH_SIZE', batch_size):
+        tree = builder.commit()
+
+    assert tree.root == expected_root
+    batch_sizes = [len(args[0]) for args, _ in add_hashed_many.call_args_list]
+    assert max(batch_sizes) <= batch_size
+    assert sum(batch_sizes) > 10 * batch_size
+
+
+def _build_tree(object_store, items):
+    builder = TreeBuilder(object_store)
+    builder.items.update(items)
+    return builder.commit()
+
+
+def _tree_nodes(tree):
+    """Collect the hashes of all nodes reachable from the root."""
+    hashes = set()
+    stack = [tree.root]
+    while stack:
+        node_hash = stack.pop()
+        hashes.add(node_hash)
+        node = tree._get_node_by_hash(node_hash)
+        if isinstance(node, TreeNode):
+            stack.extend([node.left_hash, node.right_hash])
+    return hashes
+
+
+def _tree_depth(tree):
+    """Length of the longest path from the root to a leaf."""
+    depth = 0
+    stack = [(tree.root, 0)]
+    while stack:
+        node_hash, node_depth = stack.pop()
+        node = tree._get_node_by_hash(node_hash)
+        if isinstance(node, TreeNode):
+            stack.append((node.left_hash, node_depth + 1))
+            stack.append((node.right_hash, node_depth + 1))
+        depth = max(depth, node_depth)
+    return depth
+
+
+@pytest.mark.parametrize('changes', [
+    {'AC': b'new AC value'},
+    {'AA': b'AA value'},
+    {'ZZZZ': b'ZZZZ value', 'B': b'B value', 'AB': b'new AB value'},
+    {'AB': None},
+    {'Z': None, 'AA': b'AA value', 'nonexistent': None},
+    {'AB': None, 'AC': None, 'Z': None},
+])
+def test_tree_update(populated_tree, changes):
+    """Check that updates produce the same contents as a fresh tree."""
+    expected = {key: ('%s value' % key).encode('utf-8')
+                for key in LOOKUP_KEYS}
+    expected.update(changes)
+    expected = {k: v for k, v in expected.items() if v is not None}
+
+    new_tree = populated_tree.update(changes)
+    for key, value in expected.items():
+        assert new_tree[key] == value
+    for key, value in changes.items():
+        if value is None:
+            assert key not in new_tree
+
+    # The old version is unchanged.
+    for key in LOOKUP_KEYS:
+        assert populated_tree[key] == ('%s value' % key).encode('utf-8')
+
+
+def test_tree_update_unchanged(populated_tree):
+    """Check that no-op updates keep the root."""
+    assert populated_tree.update({}).root == populated_tree.root
+    assert populated_tree.update({'AB': b'AB value'}).root == \
+            populated_tree.root
+    assert populated_tree.update({'nonexistent': None}).root == \
+            populated_tree.root
+
+
+def test_tree_update_fails_when_empty(populated_tree):
+    """Check that deleting all items raises."""
+    with pytest.raises(ValueError):
+        populated_tree.update({key: None for key in LOOKUP_KEYS})
+
+
+def test_tree_update_shares_subtrees(object_store):
+    """Check that updates only rewrite the paths to the changed keys."""
+    num_keys = 1024
+    tree = _build_tree(object_store, {
+        str(i).encode(): str(i).encode() for i in range(num_keys)})
+    old_nodes = _tree_nodes(tree)
+    store_size = len(object_store._backend)
+
+    new_tree = tree.update({b'42': b'new', b'4242': b'inserted'})
+    new_nodes = _tree_nodes(new_tree)
+
+    assert new_tree[b'42'] == b'new'
+    assert new_tree[b'4242'] == b'inserted'
+    assert len(new_nodes - old_nodes) <= 2 * 12 + 2
+    assert len(object_store._backend) - store_size <= 2 * 12 + 4
+
+
+@pytest.mark.parametrize('reopen', [False, True])
+def test_tree_sequential_updates_keep_depth_logarithmic(object_store,
+                                                        reopen):
+    """Check that single-key appends do not grow the depth unboundedly."""
+    tree = _build_tree(object_store, {
+        'k%08d' % i: b'value' for i in range(1024)})
+    num_keys = 1024
+    for i in range(1024, 3024):
+        if reopen and i % 500 == 0:
+            # Views from a root hash do not know their size.
+            tree = Tree(object_store, tree.root)
+        tree = tree.update({'k%08d' % i: b'value'})
+        num_keys += 1
+        if i % 100 == 0:
+            assert _tree_depth(tree) <= \
+                MAX_DEPTH_FACTOR * math.log2(num_keys)
+
+    if reopen:
+        assert tree._min_size <= num_keys
+    else:
+        assert tree._min_size == num_keys
+    assert list(tree.keys()) == ['k%08d' % i for i in range(num_keys)]
+    value, proof = tree.get_value_by_lookup_key('k00003000',
+                                                return_proof=True)
+    assert value == b'value'
+    assert len(proof) <= MAX_DEPTH_FACTOR * math.log2(num_keys) + 1
+
+
+def test_tree_update_of_reopened_tree_reads_few_nodes(object_store):
+    """Check that updating a view from a root hash does not count all its
+    leaves to check the balance."""
+    num_keys = 2**14
+    tree = _build_tree(object_store, {
+        'k%08d' % i: b'value' for i in range(num_keys)})
+    tree = Tree(object_store, tree.root)
+
+    reads = []
+    get = object_store.get
+    get_many = object_store.get_many
+
+    def counting_get(obj_hash, *args, **kwargs):
+        reads.append(obj_hash)
+        return get(obj_hash, *args, **kwargs)
+
+    def counting_get_many(obj_hashes, *args, **kwargs):
+        obj_hashes = list(obj_hashes)
+        reads.extend(obj_hashes)
+        return get_many(obj_hashes, *args, **kwargs)
+
+    object_store.get = counting_get
+    object_store.get_many = counting_get_many
+    tree.update({'k%08d' % num_keys: b'value'})
+    # Counting the whole tree would read all 2 * num_keys - 1 nodes.
+    assert len(reads) <= 8 * math.sqrt(num_keys)
+
+    # The view remembers what was counted.
+    del reads[:]
+    tree.update({'k%08d' % (num_keys + 1): b'value'})
+    assert len(reads) <= 2 * (math.log2(num_keys) + 2)
+
+
+def test_builder_from_tree(populated_tree):
+    """Check that a builder can apply changes to an existing tree."""
+    builder = TreeBuilder.from_tree(populated_tree)
+    builder['AA'] = b'AA value'
+    del builder['ZZZ']
+    new_tree = builder.commit()
+    assert new_tree['AA'] == b'AA value'
+    assert 'ZZZ' not in new_tree
+    assert new_tree['Z'] == b'Z value'
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_tree_random_updates(object_store, seed):
+    """Check a sequence of random batched updates against a dict."""
+    rng = random.Random(seed)
+    expected = {str(i): str(i).encode() for i in range(50)}
+    tree = _build_tree(object_store, expected)
+    for _ in range(10):
+        changes = {}
+        for _ in range(rng.randint(1, 20)):
+            key = str(rng.randint(0, 100))
+            changes[key] = rng.choice([None, key.encode() * 2])
+        expected.update(changes)
+        expected = {k: v for k, v in expected.items() if v is not None}
+        if not expected:
+            break
+        tree = tree.update(changes)
+        for key in map(str, range(101)):
+            assert tree.get_value_by_lookup_key(key) == expected.get(key)
+
+
+def test_tree_get_many(populated_tree):
+    """Check batch lookups against single lookups."""
+    lookup_keys = ['ZZZ', 'nonexistent', 'AB', 'Z', 'AB', 'AC', 'ZZ']
+    values = populated_tree.get_many(lookup_keys)
+    assert values == [populated_tree.get_value_by_lookup_key(key)
+                      for key in lookup_keys]
+    assert populated_tree.get_many([]) == []
+
+
+def test_tree_get_many_proofs(populated_tree):
+    """Check that batch proofs are the same as single proofs."""
+    lookup_keys = LOOKUP_KEYS + ['ZZ', 'A', '']
+    values, proofs = populated_tree.get_many(lookup_keys, return_proofs=True)
+    for lookup_key, value, proof in zip(lookup_keys, values, proofs):
+        expected = populated_tree.get_value_by_lookup_key(
+                lookup_key, return_proof=True)
+        assert (value, proof) == expected
+
+
+def test_tree_get_many_fetches_once(object_store):
+    """Check that each node and value is retrieved once."""
+    num_keys = 256
+    tree = _build_tree(object_store, {
+        str(i).encode(): str(i).encode() for i in range(num_keys)})
+    lookup_keys = [str(i).encode() for i in range(0, 2 * num_keys, 2)]
+
+    with patch.object(object_store, 'get',
+                      wraps=object_store.get) as get, \
+         patch.object(object_store, 'get_many',
+                      wraps=object_store.get_many) as get_many:
+        values = tree.get_many(lookup_keys)
+
+    assert values == [key if int(key) < num_keys else None
+                      for key in lookup_keys]
+    # Sibling nodes are retrieved together, and the values in one batch.
+    # The store retrieves the objects of a batch one by one.
+    fetched = [c[0][0] for c in get.call_args_list]
+    assert len(fetched) == len(set(fetched))
+    assert get_many.call_count < len(lookup_keys)
+
+
+def test_tree_get_many_missing_node(populated_tree):
+    """Check that batch lookups warn when a node is missing."""
+    del populated_tree.object_store._backend[
+            populated_tree.root_node.left_hash]
+    with pytest.warns(UserWarning, match='Exception occured'):
+        values = populated_tree.get_many(['AB', 'Z'])
+    assert values == [None, b'Z value']
+
+
+def test_tree_iteration(populated_tree):
+    """Check iteration over keys and items."""
+    assert list(populated_tree) == sorted(LOOKUP_KEYS)
+    assert list(populated_tree.keys()) == sorted(LOOKUP_KEYS)
+    assert list(populated_tree.items()) == [
+            (key, ('%s value' % key).encode('utf-8'))
+            for key in sorted(LOOKUP_KEYS)]
+
+
+@pytest.mark.parametrize('start,stop', [
+    (None, None), ('AC', None), (None, 'Z'), ('AB', 'ZZZ'),
+    ('A', 'B'), ('Z', 'Z'), ('ZZ', 'ZZZZ'), ('B', 'C'),
+])
+def test_tree_range_scan(populated_tree, start, stop):
+    """Check range scans against a sorted list of keys."""
+    expected = [key for key in sorted(LOOKUP_KEYS)
+                if (start is None or start <= key) and
+                   (stop is None or key < stop)]
+    assert list(populated_tree.keys(start, stop)) == expected
+    assert [k for k, _ in populated_tree.items(start, stop)] == expected
+    assert [k for k, _ in populated_tree.get_range(start, stop)] == expected
+
+
+@pytest.mark.parametrize('prefix,expected', [
+    ('A', ['AB', 'AC']),
+    ('Z', ['Z', 'ZZZ']),
+    ('ZZ', ['ZZZ']),
+    ('', sorted(LOOKUP_KEYS)),
+    ('B', []),
+])
+def test_tree_prefix_scan(populated_tree, prefix, expected):
+    """Check prefix scans."""
+    assert [k for k, _ in populated_tree.prefix_scan(prefix)] == expected
+
+
+def test_tree_range_scan_prunes(object_store):
+    """Check that range scans only visit overlapping subtrees."""
+    num_keys = 1024
+    tree = _build_tree(object_store, {
+        b'%04d' % i: b'%04d' % i for i in range(num_keys)})
+
+    visited = []
+    keys = list(tree._iter_leaves(b'0100', b'0110', visited=visited))
+    assert [leaf.lookup_key for leaf in keys] == [
+            b'%04d' % i for i in range(100, 110)]
+    assert len(visited) < 2 * 10 + 2 * 11
+
+    prefix_keys = [k for k, _ in tree.prefix_scan(b'051')]
+    assert prefix_keys == [b'%04d' % i for i in range(510, 520)]
+
+
+def test_tree_range_scan_is_lazy(object_store):
+    """Check that iteration does not traverse the whole tree upfront."""
+    tree = _build_tree(object_store, {
+        b'%04d' % i: b'%04d' % i for i in range(1024)})
+    with patch.object(object_store, 'get_many',
+                      wraps=object_store.get_many) as get_many:
+        keys = tree.keys()
+        assert next(keys) == b'0000'
+    assert get_many.call_count <= 11
+
+
+@pytest.mark.parametrize('start,stop', [
+    (None, None), ('AC', 'ZZZ'), ('B', 'C'), ('Z', None)])
+def test_tree_range_proof_verify(populated_tree, start, stop):
+    """Check range proof verification."""
+    items, proof = populated_tree.get_range(start, stop, return_proof=True)
+    store = populated_tree.object_store.__class__()
+    assert verify_tree_range_proof(store, populated_tree.root, items, proof,
+                                   start=start, stop=stop)
+
+
+def test_tree_range_proof_verify_fails_when_item_omitted(populated_tree):
+    """Check range proof fails when an item is omitted."""
+    items, proof = populated_tree.get_range(return_proof=True)
+    store = populated_tree.object_store.__class__()
+    assert not verify_tree_range_proof(store, populated_tree.root,
+                                       items[1:], proof)
+
+
+def test_tree_range_proof_verify_fails_when_node_omitted(populated_tree):
+    """Check range proof fails when a node is omitted."""
+    items, proof = populated_tree.get_range(return_proof=True)
+    leaf_index = [i for i, node in enumerate(proof)
+                  if isinstance(node, TreeLeaf)][0]
+    del proof[leaf_index]
+    store = populated_tree.object_store.__class__()
+    assert not verify_tree_range_proof(store, populated_tree.root,
+                                       items, proof)
+
+
+def test_tree_range_proof_verify_fails_when_value_different(populated_tree):
+    """Check range proof fails when a value is different."""
+    items, proof = populated_tree.get_range(return_proof=True)
+    items[0] = (items[0][0], b'non-existent')
+    store = populated_tree.object_store.__class__()
+    assert not verify_tree_range_proof(store, populated_tree.root,
+                                       items, proof)
+
+
+def test_tree_multi_proof_verify(populated_tree):
+    """Check multi-proof verification with present and absent keys."""
+    lookup_keys = LOOKUP_KEYS + ['ZZ', 'A']
+    values = populated_tree.get_many(lookup_keys)
+    proof = populated_tree.get_multi_proof(lookup_keys)
+    items = list(zip(lookup_keys, values))
+
+    # Each node is included once.
+    assert len(proof.nodes) == len(set(proof.nodes)) == 7
+
+    store = populated_tree.object_store.__class__()
+    assert verify_tree_multi_proof(store, populated_tree.root, items, proof)
+
+    proof = decode(encode(proof))
+    store = populated_tree.object_store.__class__()
+    assert verify_tree_multi_proof(store, populated_tree.root, items, proof)
+
+
+@pytest.mark.parametrize('bad_item', [
+    ('AB', b'non-existent'), ('AB', None), ('ZZ', b'ZZ value')])
+def test_tree_multi_proof_verify_fails_when_value_different(
+        populated_tree, bad_item):
+    """Check multi-proof verification detects wrong values."""
+    lookup_keys = ['AB', 'ZZ', 'Z']
+    proof = populated_tree.get_multi_proof(lookup_keys)
+    items = dict(zip(lookup_keys, populated_tree.get_many(lookup_keys)))
+    items.update([bad_item])
+
+    store = populated_tree.object_store.__class__()
+    assert not verify_tree_multi_proof(
+            store, populated_tree.root, items.items(), proof)
+
+
+def test_tree_multi_proof_verify_fails_when_insufficient(populated_tree):
+    """Check multi-proof verification fails when a node is missing."""
+    lookup_keys = ['AB', 'ZZ']
+    proof = populated_tree.get_multi_proof(lookup_keys)
+    items = list(zip(lookup_keys, populated_tree.get_many(lookup_keys)))
+    proof.nodes = proof.nodes[:-1]
+
+    store = populated_tree.object_store.__class__()
+    with pytest.warns(UserWarning):
+        assert not verify_tree_multi_proof(
+                store, populated_tree.root, items, proof)
+
+
+@pytest.mark.parametrize('lookup_key', LOOKUP_KEYS + ['ZZ', 'A'])
+def test_tree_store_free_proof_verify(populated_tree, lookup_key):
+    """Check store-free (non-)inclusion proof verification."""
+    value, proof = populated_tree.get_value_by_lookup_key(
+            lookup_key, return_proof=True)
+    result = verify_tree_proof(populated_tree.root, lookup_key, value, proof)
+    assert result and result.reason is None
+
+
+def test_tree_store_free_proof_verify_failures(populated_tree):
+    """Check store-free proof verification detects bad proofs."""
+    root = populated_tree.root
+    value, proof = populated_tree.get_value_by_lookup_key(
+            'AB', return_proof=True)
+
+    result = verify_tree_proof(root, 'AB', b'non-existent', proof)
+    assert not result and 'does not match' in result.reason
+    result = verify_tree_proof(root, 'AB', None, proof)
+    assert not result
+    result = verify_tree_proof(root, 'AB', value, proof[:2])
+    assert not result and 'missing' in result.reason
+
+    _, proof = populated_tree.get_value_by_lookup_key(
+            'ZZ', return_proof=True)
+    result = verify_tree_proof(root, 'ZZ', b'ZZ value', proof)
+    assert not result and 'not in the tree' in result.reason
+
+    proof[-1].lookup_key = 'ZZ'
+    result = verify_tree_proof(root, 'ZZ', b'Z value', proof)
+    assert not result and 'missing' in result.reason
+
+
+def test_tree_store_free_batch(populated_tree):
+    """Check batch store-free verification with a shared multi-proof."""
+    lookup_keys = LOOKUP_KEYS + ['ZZ']
+    values = populated_tree.get_many(lookup_keys)
+    proof = populated_tree.get_multi_proof(lookup_keys)
+    hash_object = MagicMock(
+            side_effect=populated_tree.object_store.hash_object)
+
+    results = verify_tree_proofs(populated_tree.root,
+                                 zip(lookup_keys, values),
+                                 [proof] * len(lookup_keys),
+                                 hash_object=hash_object)
+    assert all(results)
+    num_values = sum(1 for v in values if v is not None)
+    assert hash_object.call_count == len(proof.nodes) + num_values
+
+
+def _committed_objects(object_store, builder, **kwargs):
+    """Commit a builder, and record the objects put into the store."""
+    with patch.object(object_store, 'add_hashed_many',
+                      wraps=object_store.add_hashed_many) as add_hashed_many:
+        tree = builder.commit(**kwargs)
+    hashed_objs = [hashed_obj for args, _ in add_hashed_many.call_args_list
+                   for hashed_obj in args[0]]
+    return tree.root, hashed_objs
+
+
+@pytest.mark.parametrize('executor_class', [
+    ThreadPoolExecutor, ProcessPoolExecutor])
+@pytest.mark.parametrize('num_keys', [1, 2, 7, 100])
+def test_parallel_commit_is_identical(object_store, executor_class,
+                                      num_keys):
+    """Check that a parallel commit is bit-identical to a serial one."""
+    items = {str(i): str(i).encode() * 10 for i in range(num_keys)}
+    serial_builder = TreeBuilder(object_store)
+    serial_builder.items.update(items)
+    expected = _committed_objects(object_store, serial_builder)
+
+    with executor_class(max_workers=2) as executor:
+        parallel_builder = TreeBuilder(object_store)
+        parallel_builder.items.update(items)
+        result = _committed_objects(object_store, parallel_builder,
+                                    executor=executor, chunk_size=3)
+    assert result == expected
+
+
+def test_parallel_update_is_identical(populated_tree):
+    """Check that a parallel update is bit-identical to a serial one."""
+    changes = {'AB': None, 'B': b'B value', 'ZZZ': b'new value'}
+    object_store = populated_tree.object_store
+    serial_builder = TreeBuilder.from_tree(populated_tree)
+    serial_builder.items.update(changes)
+    expected = _committed_objects(object_store, serial_builder)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        parallel_builder = TreeBuilder.from_tree(populated_tree)
+        parallel_builder.items.update(changes)
+        result = _committed_objects(object_store, parallel_builder,
+                                    executor=executor, chunk_size=1)
+    assert result == expected
+
+
+def _prefixed_encoder(obj):
+    return b'custom' + msgpack_encoder(obj)
+
+
+def test_parallel_commit_uses_context_encoder(object_store):
+    """Check that workers use the encoder of the committing thread."""
+    items = {str(i): str(i).encode() for i in range(20)}
+    params = EncodingParams(encoder=_prefixed_encoder)
+    with params.as_default():
+        serial_builder = TreeBuilder(object_store)
+        serial_builder.items.update(items)
+        expected = _committed_objects(object_store, serial_builder)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            parallel_builder = TreeBuilder(object_store)
+            parallel_builder.items.update(items)
+            result = _committed_objects(object_store, parallel_builder,
+                                        executor=executor, chunk_size=4)
+    assert result == expected
@@ -0,0 +1,129 @@
+import io
+import shutil
+
+import pytest
+
+from hippiepug.chain import Chain, BlockBuilder
+from hippiepug.logstore import LogStore
+from hippiepug.metrics import Instrumentation, InstrumentedStore, MemorySink
+from hippiepug.pack import EncodingParams, view_decoder
+from hippiepug.pack import msgpack_encoder, binary_encoder
+from hippiepug.store import Sha256DictStore
+from hippiepug.struct import ChainBlock, TreeNode, TreeLeaf, MultiProof
+from hippiepug.tree import Tree, TreeBuilder
+from hippiepug.views import ViewStore, PayloadReader
+
+
+LARGE_PAYLOAD = bytes(range(256)) * 4096
+
+
+@pytest.mark.parametrize('encoder', [msgpack_encoder, binary_encoder])
+@pytest.mark.parametrize('payload', [b'', b'payload', LARGE_PAYLOAD])
+def test_view_decoder_leaves_payload_in_buffer(encoder, payload):
+    block = ChainBlock(payload=payload, index=300,
+                       fingers=[[299 - i, 'ab' * 8] for i in range(40)])
+    serialized = encoder(block)
+    decoded = view_decoder(serialized)
+    assert isinstance(decoded.payload, memoryview)
+    assert decoded.payload.obj is serialized
+    assert decoded == block
+
+    value = view_decoder(encoder(payload))
+    assert isinstance(value, memoryview)
+    assert value == payload
+
+
+@pytest.mark.parametrize('encoder', [msgpack_encoder, binary_encoder])
+@pytest.mark.parametrize('obj', [
+    ChainBlock(payload='text', index=1, fingers=[[0, 'ab']]),
+    ChainBlock(payload={'key': b'value'}, index=0),
+    TreeNode(pivot_prefix=b'key', left_hash='ab', right_hash='cd'),
+    TreeLeaf(lookup_key=b'key', payload_hash=b'\x00' * 8),
+    MultiProof(nodes=[b'first', b'second']),
+    'text',
+    None,
+])
+def test_view_decoder_decodes_other_objects(encoder, obj):
+    decoded = view_decoder(memoryview(encoder(obj)))
+    assert decoded == obj
+    if isinstance(obj, (TreeNode, TreeLeaf)):
+        assert decoded.__class__ is obj.__class__
+        assert isinstance(getattr(decoded, 'lookup_key', None) or
+                          decoded.pivot_prefix, bytes)
+
+
+@pytest.mark.parametrize('serialized', [
+    b'',
+    msgpack_encoder(ChainBlock(payload=b'payload'))[:-1],
+    msgpack_encoder(ChainBlock(payload=b'payload')) + b'\x00',
+    msgpack_encoder(ChainBlock(payload=LARGE_PAYLOAD))[:100],
+    binary_encoder(ChainBlock(payload=b'payload'))[:-1],
+])
+def test_view_decoder_raises_when_format_unknown(serialized):
+    with pytest.raises(ValueError):
+        view_decoder(serialized)
+
+
+def test_view_store_backs_chain_and_tree(tmp_path):
+    """Check that chains and trees read views of a log store."""
+    with LogStore(str(tmp_path)) as store:
+        chain = Chain(store)
+        builder = BlockBuilder(chain)
+        for i in range(10):
+            builder.payload = LARGE_PAYLOAD + b'%d' % i
+            builder.commit()
+        tree_builder = TreeBuilder(store)
+        tree_builder['large'] = LARGE_PAYLOAD
+        root = tree_builder.commit().root
+
+        view_store = ViewStore(store)
+        with EncodingParams(decoder=view_decoder).as_default():
+            block = Chain(view_store, head=chain.head)[3]
+            value = Tree(view_store, root)['large']
+        assert block.payload.obj is store._mmap
+        assert block.payload == LARGE_PAYLOAD + b'3'
+        assert value.obj is store._mmap
+        assert value == LARGE_PAYLOAD
+
+        assert view_store.get_many([root, 'missing'])[1] is None
+        assert view_store.path == store.path
+
+
+def test_instrumented_store_records_views():
+    sink = MemorySink()
+    store = InstrumentedStore(Sha256DictStore(), Instrumentation([sink]))
+    obj_hash = store.add(b'dummy')
+    assert store.get_view(obj_hash) == b'dummy'
+    assert sink.counters['store.get'] == 1
+
+
+def test_payload_reader():
+    reader = PayloadReader(memoryview(LARGE_PAYLOAD))
+    assert reader.read(3) == b'\x00\x01\x02'
+    buffer = bytearray(2)
+    assert reader.readinto(buffer) == 2
+    assert buffer == b'\x03\x04'
+    assert reader.tell() == 5
+
+    assert reader.seek(-1, io.SEEK_END) == len(LARGE_PAYLOAD) - 1
+    assert reader.read() == b'\xff'
+    assert reader.read(1) == b''
+
+    reader.seek(0)
+    output = io.BytesIO()
+    shutil.copyfileobj(reader, output)
+    assert output.getvalue() == LARGE_PAYLOAD
+
+    reader.seek(10, io.SEEK_SET)
+    reader.seek(-4, io.SEEK_CUR)
+    chunks = list(reader.iter_chunks(chunk_size=2**16))
+    assert b''.join(chunks) == LARGE_PAYLOAD[6:]
+    assert max(len(chunk) for chunk in chunks) == 2**16
+
+    with pytest.raises(ValueError):
+        reader.seek(-1)
+    with pytest.raises(ValueError):
+        reader.seek(0, 42)
+    reader.close()
+    with pytest.raises(ValueError):
+        reader.read()